@@ -0,0 +1 @@
+"""Benchmarks of the `quadtreed3` package, which are not installed with it."""
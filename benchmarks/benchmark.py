@@ -0,0 +1,392 @@
+"""Benchmarks of quadtree construction, queries and conversions.
+
+Run the benchmarks and write the results as JSON, then compare two result files
+to flag regressions:
+
+    python -m benchmarks.benchmark run -o new.json --sizes 1e3 1e5
+    python -m benchmarks.benchmark compare old.json new.json
+
+The benchmarks live outside the package and are run from the repository root.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Union
+
+import numpy as np
+
+from quadtreed3.arraytree import ArrayQuadtree
+from quadtreed3.quadtreed3 import Quadtree
+
+
+def uniform(n: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Points uniformly distributed in [0, 1000) x [0, 1000)."""
+    return rng.uniform(0, 1000, n), rng.uniform(0, 1000, n)
+
+
+def clusters(n: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Points in 20 Gaussian clusters of different spreads."""
+    centers = rng.uniform(0, 1000, (20, 2))
+    spreads = 10.0 ** rng.uniform(-1, 1.5, 20)
+    label = rng.integers(0, 20, n)
+    return (
+        centers[label, 0] + rng.normal(0, 1, n) * spreads[label],
+        centers[label, 1] + rng.normal(0, 1, n) * spreads[label],
+    )
+
+
+def near_duplicates(n: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Uniform points, each with a few copies moved by about 1e-9."""
+    xs, ys = uniform(-(-n // 4), rng)
+    xs = np.repeat(xs, 4)[:n] + rng.normal(0, 1e-9, n)
+    ys = np.repeat(ys, 4)[:n] + rng.normal(0, 1e-9, n)
+    return xs, ys
+
+
+def outliers(n: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Uniform points and 1% of outliers up to 1e9 away."""
+    xs, ys = uniform(n, rng)
+    far = rng.random(n) < 0.01
+    scale = 10.0 ** rng.uniform(4, 9, far.sum())
+    xs[far] *= scale
+    ys[far] *= -scale
+    return xs, ys
+
+
+DISTRIBUTIONS: dict[str, Callable[[int, np.random.Generator], tuple]] = {
+    "uniform": uniform,
+    "clusters": clusters,
+    "near_duplicates": near_duplicates,
+    "outliers": outliers,
+}
+
+
+def _prepare_build(xs: np.ndarray, ys: np.ndarray) -> Callable[[], object]:
+    return lambda: Quadtree().add_all(xs, ys)
+
+
+def _prepare_build_array(xs: np.ndarray, ys: np.ndarray) -> Callable[[], object]:
+    return lambda: ArrayQuadtree().add_all(xs, ys)
+
+
+def _prepare_add(xs: np.ndarray, ys: np.ndarray) -> Callable[[], object]:
+    points = list(zip(xs.tolist(), ys.tolist()))
+
+    def run():
+        tree = Quadtree()
+        for x, y in points:
+            tree.add(x, y)
+        return tree
+
+    return run
+
+
+def _prepare_cover(xs: np.ndarray, ys: np.ndarray) -> Callable[[], object]:
+    # Grow the extent of a tree with a few points, point by point
+    points = list(zip(xs.tolist(), ys.tolist()))
+
+    def run():
+        tree = Quadtree().add_all(xs[:2], ys[:2])
+        for x, y in points:
+            tree.cover(x, y)
+        return tree
+
+    return run
+
+
+def _prepare_query_rect(xs: np.ndarray, ys: np.ndarray) -> Callable[[], object]:
+    # 100 rectangles of about 1% of the points each
+    tree = Quadtree().add_all(xs, ys)
+    rng = np.random.default_rng(0)
+    lo = np.quantile(np.stack([xs, ys]), 0.02, axis=1)
+    hi = np.quantile(np.stack([xs, ys]), 0.98, axis=1)
+    side = (hi - lo) * 0.1
+    corners = lo + rng.random((100, 2)) * (hi - lo - side)
+    rects = np.concatenate([corners, corners + side], axis=1).tolist()
+    return lambda: [list(tree.query_rect(*rect)) for rect in rects]
+
+
+def _prepare_knn(xs: np.ndarray, ys: np.ndarray) -> Callable[[], object]:
+    # 1000 queries of 10 neighbors at data points
+    tree = Quadtree().add_all(xs, ys)
+    rng = np.random.default_rng(0)
+    picked = rng.integers(0, len(xs), 1000)
+    return lambda: tree.knn_batch(xs[picked], ys[picked], 10)
+
+
+def _prepare_to_array(xs: np.ndarray, ys: np.ndarray) -> Callable[[], object]:
+    tree = Quadtree().add_all(xs, ys)
+    return tree.to_array
+
+
+def _prepare_node_representation(
+    xs: np.ndarray, ys: np.ndarray
+) -> Callable[[], object]:
+    tree = Quadtree().add_all(xs, ys)
+    return tree.get_node_representation
+
+
+# Each case prepares its inputs out of the timed region and returns the timed
+# function, point-by-point cases in pure Python are limited to smaller sizes
+CASES: dict[str, tuple[Callable[[np.ndarray, np.ndarray], Callable], int]] = {
+    "add_all": (_prepare_build, 10**7),
+    "array_add_all": (_prepare_build_array, 10**7),
+    "add": (_prepare_add, 10**5),
+    "cover": (_prepare_cover, 10**6),
+    "query_rect": (_prepare_query_rect, 10**7),
+    "knn_batch": (_prepare_knn, 10**7),
+    "to_array": (_prepare_to_array, 10**6),
+    "get_node_representation": (_prepare_node_representation, 10**6),
+}
+
+DEFAULT_SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+
+def tree_shape(xs: np.ndarray, ys: np.ndarray) -> dict:
+    """
+    Get the depth and the node counts of the tree of some points.
+
+    Args:
+        xs (np.ndarray): The x coordinates of the points
+        ys (np.ndarray): The y coordinates of the points
+
+    Returns:
+        dict: The depth and the number of internal and leaf nodes
+    """
+    table = ArrayQuadtree().add_all(xs, ys).node_table()
+    leaves = int(np.count_nonzero(table.ref < 0))
+    return {
+        "depth": int(table.level.max(initial=0)),
+        "internal_nodes": len(table.ref) - leaves,
+        "leaf_nodes": leaves,
+    }
+
+
+def measure(run: Callable[[], object], repeat: int = 3) -> dict:
+    """
+    Measure the wall time of a function, the best of a few runs, and its peak
+    memory in a separate run with tracemalloc, which slows down allocations.
+
+    Args:
+        run (Callable[[], object]): The measured function
+        repeat (int, optional): The number of timed runs. Defaults to 3.
+
+    Returns:
+        dict: The time in seconds and the peak memory in bytes
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"time": min(times), "peak_memory": peak}
+
+
+def run_benchmarks(
+    sizes: Union[list[int], None] = None,
+    distributions: Union[list[str], None] = None,
+    cases: Union[list[str], None] = None,
+    repeat: int = 3,
+    seed: int = 0,
+    log: Union[Callable[[str], None], None] = None,
+) -> dict:
+    """
+    Run every case on every distribution and size. Data sets are generated
+    from the seed, so runs on different versions use the same points.
+
+    Args:
+        sizes (list[int], optional): The numbers of points. Defaults to 1e3 to
+            1e7.
+        distributions (list[str], optional): Names in DISTRIBUTIONS. Defaults
+            to all distributions.
+        cases (list[str], optional): Names in CASES. Defaults to all cases.
+        repeat (int, optional): The number of timed runs. Defaults to 3.
+        seed (int, optional): The seed of the data sets. Defaults to 0.
+        log (Callable[[str], None], optional): Called with a line of progress
+            after every measurement. Defaults to None.
+
+    Returns:
+        dict: The environment under "meta" and a list of records under
+            "results", one for each case, distribution and size
+    """
+    sizes = sizes if sizes is not None else DEFAULT_SIZES
+    distributions = distributions if distributions is not None else DISTRIBUTIONS
+    cases = cases if cases is not None else CASES
+
+    results = []
+    for distribution in distributions:
+        for size in sizes:
+            rng = np.random.default_rng(seed)
+            xs, ys = DISTRIBUTIONS[distribution](size, rng)
+            shape = tree_shape(xs, ys)
+
+            for case in cases:
+                prepare, max_size = CASES[case]
+                if size > max_size:
+                    continue
+
+                record = {"case": case, "distribution": distribution, "size": size}
+                record.update(measure(prepare(xs, ys), repeat))
+                record.update(shape)
+                results.append(record)
+
+                if log is not None:
+                    memory = record["peak_memory"] / 2**20
+                    log(
+                        f"{case:<24} {distribution:<16} {size:>9} "
+                        f"{record['time']:10.4f}s {memory:10.1f}MB"
+                    )
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "date": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+
+
+def compare_results(
+    baseline: dict,
+    current: dict,
+    time_tolerance: float = 0.25,
+    memory_tolerance: float = 0.1,
+    min_time: float = 1e-3,
+) -> list[dict]:
+    """
+    Compare two benchmark results. A measurement regresses if it is slower or
+    uses more memory than the baseline by more than the tolerance. Changes of
+    the tree shape are reported too, because the trees should not depend on
+    the implementation.
+
+    Args:
+        baseline (dict): The results of run_benchmarks() to compare against
+        current (dict): The new results
+        time_tolerance (float, optional): The allowed relative slowdown.
+            Defaults to 0.25.
+        memory_tolerance (float, optional): The allowed relative increase of
+            the peak memory. Defaults to 0.1.
+        min_time (float, optional): Times below this many seconds are too
+            noisy to compare. Defaults to 1e-3.
+
+    Returns:
+        list[dict]: The regressions, each with the case, distribution, size,
+            metric, baseline and current values
+    """
+    tolerances = {"time": time_tolerance, "peak_memory": memory_tolerance}
+    shape_metrics = ("depth", "internal_nodes", "leaf_nodes")
+
+    def key(record):
+        return record["case"], record["distribution"], record["size"]
+
+    old_records = {key(record): record for record in baseline["results"]}
+    regressions = []
+
+    for record in current["results"]:
+        old = old_records.get(key(record))
+        if old is None:
+            continue
+
+        changed = []
+        for metric, tolerance in tolerances.items():
+            if metric == "time" and max(old[metric], record[metric]) < min_time:
+                continue
+            if record[metric] > old[metric] * (1 + tolerance):
+                changed.append(metric)
+        changed += [m for m in shape_metrics if record[m] != old[m]]
+
+        for metric in changed:
+            regressions.append(
+                {
+                    "case": record["case"],
+                    "distribution": record["distribution"],
+                    "size": record["size"],
+                    "metric": metric,
+                    "baseline": old[metric],
+                    "current": record[metric],
+                }
+            )
+
+    return regressions
+
+
+def main(argv: Union[list[str], None] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.benchmark", description=__doc__.split("\n")[0]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks")
+    run.add_argument("-o", "--output", help="the JSON file of the results")
+    run.add_argument(
+        "--sizes", nargs="+", type=float, default=DEFAULT_SIZES, help="point counts"
+    )
+    run.add_argument(
+        "--distributions",
+        nargs="+",
+        choices=list(DISTRIBUTIONS),
+        default=list(DISTRIBUTIONS),
+    )
+    run.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--seed", type=int, default=0)
+
+    compare = commands.add_parser(
+        "compare", help="compare two result files, exit with 1 on regressions"
+    )
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--time-tolerance", type=float, default=0.25)
+    compare.add_argument("--memory-tolerance", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_benchmarks(
+            [int(size) for size in args.sizes],
+            args.distributions,
+            args.cases,
+            args.repeat,
+            args.seed,
+            log=print,
+        )
+        if args.output:
+            with open(args.output, "w", encoding="utf8") as fp:
+                json.dump(results, fp, indent=2)
+        return 0
+
+    with open(args.baseline, "r", encoding="utf8") as fp:
+        baseline = json.load(fp)
+    with open(args.current, "r", encoding="utf8") as fp:
+        current = json.load(fp)
+
+    regressions = compare_results(
+        baseline, current, args.time_tolerance, args.memory_tolerance
+    )
+    for r in regressions:
+        print(
+            f"REGRESSION {r['case']} {r['distribution']} {r['size']} "
+            f"{r['metric']}: {r['baseline']} -> {r['current']}"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
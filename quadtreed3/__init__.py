@@ -5,3 +5,7 @@ __email__ = "jay@zijie.wang"
 __version__ = "0.1.1"
 
 from quadtreed3.quadtreed3 import *
+from quadtreed3.arraytree import ArrayQuadtree
+from quadtreed3.forces import ManyBodyForce
+from quadtreed3.instrument import Instrumentation, TqdmProgress, progress_bar
+from quadtreed3.join import quadtree_join, quadtree_self_join
@@ -0,0 +1,1616 @@
+"""Array-backed quadtree storage."""
+
+from json import dumps, loads
+
+from typing import Callable, NamedTuple, Union
+
+import numpy as np
+
+import heapq
+import itertools
+import math
+import struct
+from array import array
+
+from quadtreed3.bulk import (
+    bulk_partition,
+    nested_from_arrays,
+    paused_gc,
+)
+from quadtreed3.columns import as_rows, gather_field, to_json_value
+from quadtreed3.geometry import (
+    ExtentMixin,
+    get_distance2,
+    get_quadrant,
+    get_quadrant_extents,
+)
+from quadtreed3.instrument import get_depth, progress_bar
+
+
+class NodeTable(NamedTuple):
+    """
+    A columnar view of all nodes of a quadtree. Nodes are numbered in pre-order
+    with quadrants 0 to 3, which are the same ids as Node.nid from
+    Quadtree.get_node_representation(). The points of each subtree are the
+    contiguous range order[start:start + size].
+    """
+
+    # The child reference of each node in the array-backed storage
+    ref: np.ndarray
+    parent: np.ndarray
+    # The ids of the four children of each node, -1 is an empty slot
+    children: np.ndarray
+    level: np.ndarray
+    # The cell [x0, y0, x1, y1] of each node
+    x0: np.ndarray
+    y0: np.ndarray
+    x1: np.ndarray
+    y1: np.ndarray
+    # The number of points (including coincident points) in each subtree
+    size: np.ndarray
+    height: np.ndarray
+    start: np.ndarray
+    # Point indices in pre-order, the points of a leaf from the head of its chain
+    order: np.ndarray
+
+
+class NodeAggregates(NamedTuple):
+    """
+    Aggregates of the points in every subtree, indexed by the pre-order node id
+    (Node.nid). Empty bounding boxes are never produced because every node
+    holds at least one point.
+    """
+
+    count: np.ndarray
+    # The centroid of the points in each subtree
+    cx: np.ndarray
+    cy: np.ndarray
+    # The tight bounding box [x0, y0, x1, y1] of the points in each subtree
+    x0: np.ndarray
+    y0: np.ndarray
+    x1: np.ndarray
+    y1: np.ndarray
+    # Results of the user reductions, by reduction name
+    reductions: dict[str, np.ndarray]
+
+
+# Supported reductions of a data field over the points of each subtree
+REDUCTIONS = ("sum", "min", "max", "mean")
+
+# The binary file layout written by ArrayQuadtree.save(): the magic bytes, the
+# length of a JSON header, the header, then every array at an aligned offset
+FILE_MAGIC = b"QTD3TREE"
+FILE_VERSION = 1
+FILE_ALIGNMENT = 64
+
+
+class ArrayQuadtree(ExtentMixin):
+    """
+    A compact quadtree that keeps its topology in flat NumPy arrays instead of
+    nested lists and dicts. It has the same add()/add_all()/cover()/extent() API
+    as Quadtree, and it converts losslessly to the d3-compatible nested-list
+    root.
+
+    Child references are encoded as integers: -1 is an empty slot, a value
+    i >= 0 is the internal node i, and a value r <= -2 is the leaf -2 - r.
+    Every leaf holds the index of the most recently added point at its
+    position, and coincident points are chained through `next_point`.
+    """
+
+    def __init__(self):
+        # The tree is fully initialized after self.add_all() call
+        self.x0 = None
+        self.y0 = None
+        self.x1 = None
+        self.y1 = None
+        self.root_ref = -1
+
+        # Data entries of the points, None means the default {'x': x, 'y': y}
+        self._data = None
+        self._data_loader = None
+
+        self.n_internal = 0
+        self.n_leaves = 0
+        self.n_points = 0
+
+        self._children = np.full((0, 4), -1, dtype=np.int32)
+        self._point_index = np.empty(0, dtype=np.int32)
+        self._next_point = np.empty(0, dtype=np.int32)
+        self._xs = np.empty(0, dtype=np.float64)
+        self._ys = np.empty(0, dtype=np.float64)
+
+        # The node table is computed on demand and dropped on every change
+        self._node_table = None
+
+        # The maximum number of distinct positions in a leaf, copies of
+        # bucketed Quadtrees keep it for queries and to_quadtree(). Points are
+        # only added one by one to trees with leaf_capacity 1
+        self.leaf_capacity = 1
+
+        # Optional Instrumentation that counts inserts, splits and doublings
+        self.instrument = None
+
+    @property
+    def data(self) -> Union[list[Union[dict, None]], None]:
+        """The data entries of all points, None means the default entries."""
+        if self._data_loader is not None:
+            self._data = self._data_loader()
+            self._data_loader = None
+        return self._data
+
+    @data.setter
+    def data(self, data: Union[list[Union[dict, None]], None]):
+        self._data = data
+        self._data_loader = None
+
+    @property
+    def children(self) -> np.ndarray:
+        """The child table of shape [n_internal, 4]."""
+        return self._children[: self.n_internal]
+
+    @property
+    def point_index(self) -> np.ndarray:
+        """The index of the head point of every leaf."""
+        return self._point_index[: self.n_leaves]
+
+    @property
+    def next_point(self) -> np.ndarray:
+        """The next coincident point of every point, -1 ends a chain."""
+        return self._next_point[: self.n_points]
+
+    @property
+    def xs(self) -> np.ndarray:
+        """The x coordinates of all points."""
+        return self._xs[: self.n_points]
+
+    @property
+    def ys(self) -> np.ndarray:
+        """The y coordinates of all points."""
+        return self._ys[: self.n_points]
+
+    @property
+    def root(self) -> Union[list, dict, None]:
+        """The root of the equivalent d3-compatible nested-list quadtree."""
+        with paused_gc():
+            return nested_from_arrays(
+                self.children,
+                self.point_index,
+                self.next_point,
+                self.root_ref,
+                [{"data": d} for d in self.get_data()],
+            )
+
+    def get_data(self) -> list[dict]:
+        """
+        Get the data entries of all points, ordered by point index.
+
+        Returns:
+            list[dict]: Data entries
+        """
+        if self.data is None:
+            return [
+                {"x": x, "y": y} for x, y in zip(self.xs.tolist(), self.ys.tolist())
+            ]
+
+        return [
+            d if d is not None else {"x": x, "y": y}
+            for d, x, y in zip(self.data, self.xs.tolist(), self.ys.tolist())
+        ]
+
+    def add(self, x: float, y: float, d: Union[dict, None] = None):
+        """
+        Add a data point into the quadtree.
+
+        Args:
+            x(float): The x coordinate of the data point
+            y(float): The y coordinate of the data point
+            d(dict): The data entry associated with this data point. The default
+                value is {'x': x, 'y': y}.
+        """
+
+        # Make sure the new point is covered by the extent before adding it
+        self.cover(x, y)
+        self._add_skip_cover(x, y, d)
+        return self
+
+    def _add_skip_cover(self, x: float, y: float, d: Union[dict, None] = None):
+        """
+        Add a data point into the quadtree without covering it first. This method
+        should only be called in add() or add_all().
+
+        Args:
+            x(float): The x coordinate of the data point
+            y(float): The y coordinate of the data point
+            d(dict): The data entry associated with this data point. The default
+                value is {'x': x, 'y': y}.
+        """
+        if self.leaf_capacity > 1 and self.root_ref != -1:
+            raise ValueError(
+                "Points can only be added one by one with leaf_capacity 1, "
+                "use to_quadtree() to add points to a bucketed tree"
+            )
+
+        self._node_table = None
+        p = self._new_point(x, y, d)
+
+        # Case (1): The tree is empty => use this new point as the root
+        if self.root_ref == -1:
+            self.root_ref = -2 - self._new_leaf(p)
+            if self.instrument is not None:
+                self.instrument.record_insert()
+            return self
+
+        # Case (2) & (3): Find the leaf this data point belongs to
+        children = self._children
+        ref = self.root_ref
+        x0, y0, x1, y1 = self.x0, self.y0, self.x1, self.y1
+        parent = -1
+        quad = None
+
+        while ref >= 0:
+            xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+            quad = get_quadrant(x, y, xm, ym)
+            x0, y0, x1, y1 = get_quadrant_extents(x0, y0, x1, y1)[quad]
+
+            parent = ref
+            ref = int(children[parent, quad])
+
+            # Case (2): Empty slot to plug in this data point
+            if ref == -1:
+                children[parent, quad] = -2 - self._new_leaf(p)
+                if self.instrument is not None:
+                    self.instrument.record_insert(
+                        depth=get_depth(self.x1 - self.x0, x1 - x0)
+                    )
+                return self
+
+        # Case (3): Link coincident points, or split the leaf until the two
+        # points are separated in different quadrants
+        leaf = -2 - ref
+        head = int(self._point_index[leaf])
+        x_old, y_old = float(self._xs[head]), float(self._ys[head])
+
+        if x == x_old and y == y_old:
+            self._next_point[p] = head
+            self._point_index[leaf] = p
+            if self.instrument is not None:
+                self.instrument.record_insert(
+                    depth=get_depth(self.x1 - self.x0, x1 - x0)
+                )
+            return self
+
+        quad_new = quad
+        quad_old = quad
+        leaf_length = x1 - x0
+
+        while quad_new == quad_old:
+            node = self._new_internal()
+            if parent == -1:
+                self.root_ref = node
+            else:
+                self._children[parent, quad_new] = node
+            parent = node
+
+            xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+            quad_new = get_quadrant(x, y, xm, ym)
+            quad_old = get_quadrant(x_old, y_old, xm, ym)
+            x0, y0, x1, y1 = get_quadrant_extents(x0, y0, x1, y1)[quad_new]
+
+        self._children[parent, quad_old] = ref
+        self._children[parent, quad_new] = -2 - self._new_leaf(p)
+        if self.instrument is not None:
+            self.instrument.record_insert(
+                depth=get_depth(self.x1 - self.x0, x1 - x0),
+                splits=get_depth(leaf_length, x1 - x0),
+            )
+        return self
+
+    def add_all_data(self, data: list[dict]):
+        """
+        Add all data points into the quadtree.
+
+        Args:
+            data(list[dict]): A list of data entries. Each data entry is a
+                dictionary with at least two keys 'x' and 'y'.
+        """
+        xs = [d["x"] for d in data]
+        ys = [d["y"] for d in data]
+        self.add_all(xs, ys, list(data))
+        return self
+
+    def add_all(
+        self,
+        xs: list[float],
+        ys: list[float],
+        data: Union[list[dict], dict[str, np.ndarray], np.ndarray, None] = None,
+        progress: bool = False,
+    ):
+        """
+        Add all data points into the quadtree.
+
+        Args:
+            xs(list[float]): A list of x coordinates
+            ys(list[float]): A list of y coordinates
+            data(Union[list[dict], dict[str, np.ndarray], np.ndarray]): A list
+                of data entries. Each data entry is a dictionary with at least
+                two keys 'x' and 'y'. Columnar data, a dict of NumPy columns or
+                a structured array, is kept as columns and every point gets a
+                lazy Row of it, which reads the values when accessed.
+            progress(bool): Show the inserted points on a tqdm progress bar,
+                which requires tqdm. Defaults to False.
+        """
+        if progress:
+            with progress_bar(self, len(xs)):
+                return self.add_all(xs, ys, data)
+
+        # Initialize the extent by (min_x, min_y) and (max_x, max_y)
+        if len(xs) == 0:
+            return self
+
+        data = as_rows(data, xs, ys)
+
+        self.cover_all(xs, ys)
+
+        # The bulk partition already produces this storage layout
+        if self.root_ref == -1:
+            xs = np.asarray(xs, dtype=np.float64)
+            ys = np.asarray(ys, dtype=np.float64)
+            children, point_index, next_point, root_ref, depth = bulk_partition(
+                xs, ys, self.x0, self.y0, self.x1, self.y1, self.leaf_capacity
+            )
+            self._children = children
+            self._point_index = point_index
+            self._next_point = next_point
+            self._xs = xs.copy()
+            self._ys = ys.copy()
+            self.n_internal = len(children)
+            self.n_leaves = len(point_index)
+            self.n_points = len(xs)
+            self.root_ref = root_ref
+            self.data = [d if d else None for d in data] if data else None
+            self._node_table = None
+            if self.instrument is not None:
+                self.instrument.record_insert(len(xs), depth, len(children))
+            return self
+
+        # Add new points one by one
+        for i, _ in enumerate(xs):
+            self._add_skip_cover(float(xs[i]), float(ys[i]), data[i] if data else None)
+
+        return self
+
+    def _grow_root(self, quads: list[int]) -> bool:
+        # A leaf root does not need any new parent nodes
+        node = self.root_ref
+        if node < 0:
+            return False
+
+        for quad in quads:
+            parent = self._new_internal()
+            self._children[parent, quad] = node
+            node = parent
+        self.root_ref = node
+        return True
+
+    def _extent_changed(self):
+        self._node_table = None
+
+    def node_table(self) -> NodeTable:
+        """
+        Get the columnar node table of this tree. The table is computed with a
+        few vectorized passes per tree level and cached until the tree changes.
+
+        Returns:
+            NodeTable: All nodes of the tree in pre-order
+        """
+        if self._node_table is None:
+            self._node_table = _build_node_table(self)
+        return self._node_table
+
+    def aggregates(
+        self, reductions: Union[dict[str, tuple[str, str]], None] = None
+    ) -> NodeAggregates:
+        """
+        Compute the count, centroid, tight bounding box and user reductions of
+        every subtree in one bottom-up pass. Leaves are reduced from their
+        contiguous point ranges, then each level is folded into its parents
+        with one unbuffered ufunc call per reduction type.
+
+        Args:
+            reductions (dict[str, tuple[str, str]], optional): User reductions
+                {name: (field, reduction)}, where reduction is one of "sum",
+                "min", "max" and "mean" of the data field. Defaults to None.
+
+        Returns:
+            NodeAggregates: Aggregates indexed by the pre-order node id
+        """
+        reductions = reductions if reductions else {}
+        table = self.node_table()
+
+        # Group the reduced columns by their reduction type
+        sum_columns = [self.xs, self.ys]
+        min_columns = [self.xs, self.ys]
+        max_columns = [self.xs, self.ys]
+        slots = {}
+
+        for name, (field, reduce) in reductions.items():
+            if reduce not in REDUCTIONS:
+                raise ValueError(f"Unknown reduction: {reduce}")
+
+            values = self.get_field(field)
+            if reduce in ("sum", "mean"):
+                slots[name] = (reduce, len(sum_columns))
+                sum_columns.append(values)
+            elif reduce == "min":
+                slots[name] = (reduce, len(min_columns))
+                min_columns.append(values)
+            else:
+                slots[name] = (reduce, len(max_columns))
+                max_columns.append(values)
+
+        sums = _reduce_subtrees(table, np.stack(sum_columns, axis=1), np.add, 0)
+        mins = _reduce_subtrees(
+            table, np.stack(min_columns, axis=1), np.minimum, np.inf
+        )
+        maxs = _reduce_subtrees(
+            table, np.stack(max_columns, axis=1), np.maximum, -np.inf
+        )
+
+        count = table.size
+        results = {}
+        for name, (reduce, column) in slots.items():
+            if reduce == "sum":
+                results[name] = sums[:, column]
+            elif reduce == "mean":
+                results[name] = sums[:, column] / count
+            elif reduce == "min":
+                results[name] = mins[:, column]
+            else:
+                results[name] = maxs[:, column]
+
+        return NodeAggregates(
+            count=count,
+            cx=sums[:, 0] / count,
+            cy=sums[:, 1] / count,
+            x0=mins[:, 0],
+            y0=mins[:, 1],
+            x1=maxs[:, 0],
+            y1=maxs[:, 1],
+            reductions=results,
+        )
+
+    def subtree_sums(self, values: np.ndarray) -> np.ndarray:
+        """
+        Sum per-point values over every subtree.
+
+        Args:
+            values (np.ndarray): Values of shape [n_points] or [n_points, k],
+                ordered by point index
+
+        Returns:
+            np.ndarray: Sums of shape [n_nodes] or [n_nodes, k], indexed by the
+                pre-order node id
+        """
+        values = np.asarray(values, dtype=np.float64)
+        sums = _reduce_subtrees(
+            self.node_table(), values.reshape(len(values), -1), np.add, 0
+        )
+        return sums.reshape((len(sums),) + values.shape[1:])
+
+    def get_field(self, field: str) -> np.ndarray:
+        """
+        Get a data field of all points as a float64 column, ordered by point
+        index. The fields 'x' and 'y' are the point coordinates.
+
+        Args:
+            field (str): The name of the data field
+
+        Returns:
+            np.ndarray: Values of the field
+        """
+        if field == "x":
+            return self.xs
+        if field == "y":
+            return self.ys
+
+        data = self.get_data()
+        column = gather_field(data, field)
+        if column is not None:
+            return column
+        return np.array([d[field] for d in data], dtype=np.float64)
+
+    def knn_batch(
+        self, xs: np.ndarray, ys: np.ndarray, k: int, leaf_size: int = 256
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest points of many query points at once. Each query is
+        first located in the tree to bound its k-th nearest distance with
+        nearby points in pre-order. One shared traversal then refines all
+        queries together, pruning every node farther than the bound of all its
+        queries.
+
+        Args:
+            xs (np.ndarray): The x coordinates of the query points
+            ys (np.ndarray): The y coordinates of the query points
+            k (int): The number of neighbors
+            leaf_size (int, optional): Subtrees with at most this many points are
+                compared with the queries in one block. Defaults to 256.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The distances and point indices of the
+                neighbors, both of shape [n_queries, k] and sorted by distance.
+                Missing neighbors have distance inf and index -1.
+        """
+        qx = np.asarray(xs, dtype=np.float64).ravel()
+        qy = np.asarray(ys, dtype=np.float64).ravel()
+        n_queries = len(qx)
+
+        dist2 = np.full((n_queries, k), np.inf)
+        index = np.full((n_queries, k), -1, dtype=np.int64)
+
+        n = self.n_points
+        k_found = min(k, n)
+        if k_found <= 0 or n_queries == 0:
+            return np.sqrt(dist2), index
+
+        table = self.node_table()
+        px, py = self.xs, self.ys
+
+        # Locate the deepest node containing every query
+        node = np.zeros(n_queries, dtype=np.int64)
+        moving = np.arange(n_queries)
+
+        while len(moving) > 0:
+            cur = node[moving]
+            internal = table.ref[cur] >= 0
+            moving, cur = moving[internal], cur[internal]
+            xm = (table.x0[cur] + table.x1[cur]) / 2
+            ym = (table.y0[cur] + table.y1[cur]) / 2
+            quad = (qx[moving] >= xm).astype(np.int64) + 2 * (qy[moving] >= ym)
+            child = table.children[cur, quad]
+            found = child != -1
+            moving = moving[found]
+            node[moving] = child[found]
+
+        # Points next to the query in pre-order are spatially close, their k-th
+        # nearest distance bounds the true k-th nearest distance
+        width = min(2 * k_found, n)
+        base = np.clip(table.start[node] - k_found, 0, n - width)
+        window = table.order[base[:, None] + np.arange(width)]
+        window_dist2 = (px[window] - qx[:, None]) ** 2 + (py[window] - qy[:, None]) ** 2
+        bound = np.partition(window_dist2, k_found - 1, axis=1)[:, k_found - 1]
+
+        best_dist2 = dist2[:, :k_found].copy()
+        best_index = index[:, :k_found].copy()
+
+        # Each item in the stack is (node id, queries that may reach the node)
+        stack = [(0, np.arange(n_queries))]
+
+        while len(stack) > 0:
+            cur, active = stack.pop()
+
+            ax, ay = qx[active], qy[active]
+            dx = np.maximum(np.maximum(table.x0[cur] - ax, ax - table.x1[cur]), 0)
+            dy = np.maximum(np.maximum(table.y0[cur] - ay, ay - table.y1[cur]), 0)
+            active = active[dx * dx + dy * dy <= bound[active]]
+
+            if len(active) == 0:
+                continue
+
+            if table.ref[cur] < 0 or table.size[cur] <= leaf_size:
+                start = table.start[cur]
+                points = table.order[start : start + table.size[cur]]
+                cand_dist2 = (px[points] - qx[active, None]) ** 2 + (
+                    py[points] - qy[active, None]
+                ) ** 2
+
+                all_dist2 = np.concatenate([best_dist2[active], cand_dist2], axis=1)
+                all_index = np.concatenate(
+                    [best_index[active], np.broadcast_to(points, cand_dist2.shape)],
+                    axis=1,
+                )
+                keep = np.argpartition(all_dist2, k_found - 1, axis=1)[:, :k_found]
+                best_dist2[active] = np.take_along_axis(all_dist2, keep, axis=1)
+                best_index[active] = np.take_along_axis(all_index, keep, axis=1)
+                bound[active] = np.minimum(
+                    bound[active], best_dist2[active].max(axis=1)
+                )
+                continue
+
+            for child in table.children[cur].tolist():
+                if child != -1:
+                    stack.append((child, active))
+
+        sort = np.argsort(best_dist2, axis=1, kind="stable")
+        dist2[:, :k_found] = np.take_along_axis(best_dist2, sort, axis=1)
+        index[:, :k_found] = np.take_along_axis(best_index, sort, axis=1)
+        return np.sqrt(dist2), index
+
+    def visit_levels(
+        self,
+        callback: Callable[
+            [np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+            Union[np.ndarray, None],
+        ],
+    ):
+        """
+        Visit the nodes one level at a time. The callback is called as
+        callback(nodes, x0, y0, x1, y1) with the pre-order ids of the visited
+        nodes of a level and the arrays of their cells. It may return a boolean
+        array, and the children of the nodes marked True are not visited. Nodes
+        of a level are grouped by parent and sorted by quadrant.
+
+        Args:
+            callback (Callable): The function called for the visited nodes of
+                every level
+        """
+        table = self.node_table()
+        nodes = np.zeros(min(len(table.ref), 1), dtype=np.int64)
+
+        while len(nodes) > 0:
+            skip = callback(
+                nodes,
+                table.x0[nodes],
+                table.y0[nodes],
+                table.x1[nodes],
+                table.y1[nodes],
+            )
+            if skip is not None:
+                nodes = nodes[~np.asarray(skip, dtype=bool)]
+
+            children = table.children[nodes]
+            nodes = children[children >= 0]
+
+        return self
+
+    def query_rect(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """
+        Find all points inside the rectangle [x0, x1] x [y0, y1], see
+        Quadtree.query_rect(). Only the visited rows of the arrays are read, so
+        memory-mapped trees do not load the whole file.
+
+        Args:
+            x0 (float): The minimum x coordinate of the rectangle
+            y0 (float): The minimum y coordinate of the rectangle
+            x1 (float): The maximum x coordinate of the rectangle
+            y1 (float): The maximum y coordinate of the rectangle
+
+        Returns:
+            np.ndarray: Point indices inside the rectangle, in the pre-order of
+                the tree
+        """
+        results = []
+
+        if self.root_ref == -1:
+            return np.array(results, dtype=np.int64)
+
+        # Each item in the stack is (ref, [x0, y0, x1, y1] of the node)
+        stack = [(self.root_ref, (self.x0, self.y0, self.x1, self.y1))]
+
+        while len(stack) > 0:
+            ref, position = stack.pop()
+
+            # The points of a bucket leaf are checked one by one
+            if ref <= -2:
+                for p in self._iter_chain(int(self._point_index[-2 - ref])):
+                    x, y = float(self._xs[p]), float(self._ys[p])
+                    if x0 <= x <= x1 and y0 <= y <= y1:
+                        results.append(p)
+                continue
+
+            quad_positions = get_quadrant_extents(*position)
+            row = self._children[ref].tolist()
+            for quad in (3, 2, 1, 0):
+                cx0, cy0, cx1, cy1 = quad_positions[quad]
+                if (
+                    row[quad] != -1
+                    and cx0 <= x1
+                    and x0 < cx1
+                    and cy0 <= y1
+                    and y0 < cy1
+                ):
+                    stack.append((row[quad], quad_positions[quad]))
+
+        return np.array(results, dtype=np.int64)
+
+    def query_radius(
+        self, x: float, y: float, r: float, leaf_size: int = 64
+    ) -> np.ndarray:
+        """
+        Find all points within distance r of (x, y), see query_region().
+
+        Args:
+            x (float): The x coordinate of the circle center
+            y (float): The y coordinate of the circle center
+            r (float): The radius, points at distance r are included
+            leaf_size (int, optional): Partially covered subtrees with at most
+                this many points are tested point by point. Defaults to 64.
+
+        Returns:
+            np.ndarray: Point indices inside the circle, in the pre-order of the
+                tree
+        """
+        r2 = r * r
+
+        def classify(x0, y0, x1, y1):
+            # The nearest and the farthest point of every cell
+            dx = np.maximum(np.maximum(x0 - x, x - x1), 0)
+            dy = np.maximum(np.maximum(y0 - y, y - y1), 0)
+            fx = np.maximum(x - x0, x1 - x)
+            fy = np.maximum(y - y0, y1 - y)
+            return fx * fx + fy * fy <= r2, dx * dx + dy * dy > r2
+
+        def contains(xs, ys):
+            return (xs - x) ** 2 + (ys - y) ** 2 <= r2
+
+        return self.query_region(classify, contains, leaf_size)
+
+    def query_polygon(
+        self, vertices: Union[list[list[float]], np.ndarray], leaf_size: int = 64
+    ) -> np.ndarray:
+        """
+        Find all points inside a polygon, see query_region(). The polygon is
+        closed from the last vertex to the first one, and may be concave or
+        self-intersecting with the even-odd rule. Points exactly on an edge may
+        be reported as inside or outside.
+
+        Args:
+            vertices (Union[list[list[float]], np.ndarray]): The [x, y]
+                coordinates of the polygon vertices
+            leaf_size (int, optional): Partially covered subtrees with at most
+                this many points are tested point by point. Defaults to 64.
+
+        Returns:
+            np.ndarray: Point indices inside the polygon, in the pre-order of
+                the tree
+        """
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+        if len(vertices) < 3:
+            return np.array([], dtype=np.int64)
+
+        edges = _polygon_edges(vertices)
+        px0, py0 = vertices.min(axis=0)
+        px1, py1 = vertices.max(axis=0)
+
+        def classify(x0, y0, x1, y1):
+            # Cells that no edge crosses are entirely on one side of the
+            # boundary, the side of their center
+            crossed = _edges_cross_boxes(edges, x0, y0, x1, y1)
+            center = _inside_polygon(edges, (x0 + x1) / 2, (y0 + y1) / 2)
+            disjoint = (x1 < px0) | (px1 < x0) | (y1 < py0) | (py1 < y0)
+            return ~crossed & center, disjoint | (~crossed & ~center)
+
+        def contains(xs, ys):
+            return _inside_polygon(edges, xs, ys)
+
+        return self.query_region(classify, contains, leaf_size)
+
+    def query_region(
+        self,
+        classify: Callable[
+            [np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+            tuple[np.ndarray, np.ndarray],
+        ],
+        contains: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        leaf_size: int = 64,
+    ) -> np.ndarray:
+        """
+        Find all points inside a region. The cells are visited one level at a
+        time and classified as inside, outside or partially covered by the
+        region. The subtrees of inside cells are emitted as whole point ranges
+        of the node table, and only the points of partially covered leaves and
+        small subtrees are tested, in one vectorized call.
+
+        Args:
+            classify (Callable): Called as classify(x0, y0, x1, y1) with arrays
+                of closed cells, it returns the boolean arrays (inside,
+                outside). Cells may be reported as neither if unsure.
+            contains (Callable): Called as contains(xs, ys) with arrays of point
+                coordinates, it returns a boolean array
+            leaf_size (int, optional): Partially covered subtrees with at most
+                this many points are tested point by point. Defaults to 64.
+
+        Returns:
+            np.ndarray: Point indices inside the region, in the pre-order of
+                the tree
+        """
+        if self.root_ref == -1:
+            return np.array([], dtype=np.int64)
+
+        table = self.node_table()
+        inside_nodes, tested_nodes = [], []
+        nodes = np.zeros(1, dtype=np.int64)
+
+        while len(nodes) > 0:
+            inside, outside = classify(
+                table.x0[nodes], table.y0[nodes], table.x1[nodes], table.y1[nodes]
+            )
+            partial = ~inside & ~outside
+            inside_nodes.append(nodes[inside])
+
+            tested = partial & (
+                (table.ref[nodes] < 0) | (table.size[nodes] <= leaf_size)
+            )
+            tested_nodes.append(nodes[tested])
+
+            children = table.children[nodes[partial & ~tested]]
+            nodes = children[children >= 0]
+
+        # Point positions in the pre-order of the tree
+        inside_nodes = np.concatenate(inside_nodes)
+        inside_positions = _expand_ranges(
+            table.start[inside_nodes], table.size[inside_nodes]
+        )
+        tested_nodes = np.concatenate(tested_nodes)
+        tested_positions = _expand_ranges(
+            table.start[tested_nodes], table.size[tested_nodes]
+        )
+        points = table.order[tested_positions]
+        tested_positions = tested_positions[contains(self.xs[points], self.ys[points])]
+
+        positions = np.sort(np.concatenate([inside_positions, tested_positions]))
+        return table.order[positions]
+
+    def histogram(
+        self,
+        bounds: Union[list[float], None] = None,
+        nx: int = 256,
+        ny: int = 256,
+        leaf_size: int = 64,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Count the points in the pixels of a regular grid, with the bins of
+        numpy.histogram2d(xs, ys, bins=[nx, ny], range=...). The cells are
+        visited one level at a time, and a cell that falls inside one pixel
+        adds its subtree size without visiting its points. Only the points of
+        leaves and small subtrees that cross pixel edges are binned one by one,
+        so the cost follows the resolution rather than the number of points.
+
+        Args:
+            bounds (list[float], optional): The grid [x0, y0, x1, y1], the last
+                pixels include the points on x1 and y1. Defaults to the extent of
+                the tree.
+            nx (int, optional): The number of pixels along x. Defaults to 256.
+            ny (int, optional): The number of pixels along y. Defaults to 256.
+            leaf_size (int, optional): Subtrees with at most this many points
+                that cross pixel edges are binned point by point. Defaults to
+                64.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The counts of shape
+                [nx, ny], and the pixel edges along x and y
+        """
+        if bounds is None:
+            bounds = [self.x0, self.y0, self.x1, self.y1]
+        x0, y0, x1, y1 = bounds
+        x_edges = np.linspace(x0, x1, nx + 1)
+        y_edges = np.linspace(y0, y1, ny + 1)
+        counts = np.zeros(nx * ny, dtype=np.int64)
+
+        if self.root_ref == -1:
+            return counts.reshape(nx, ny), x_edges, y_edges
+
+        table = self.node_table()
+        binned_nodes = []
+        nodes = np.zeros(1, dtype=np.int64)
+
+        while len(nodes) > 0:
+            cx0, cy0 = table.x0[nodes], table.y0[nodes]
+            cx1, cy1 = table.x1[nodes], table.y1[nodes]
+
+            # Cells hold the points of [cx0, cx1) x [cy0, cy1)
+            outside = (cx1 <= x0) | (cx0 > x1) | (cy1 <= y0) | (cy0 > y1)
+            ix = np.searchsorted(x_edges, cx0, side="right") - 1
+            iy = np.searchsorted(y_edges, cy0, side="right") - 1
+            inside = (
+                (cx0 >= x0)
+                & (cx1 <= x1)
+                & (cy0 >= y0)
+                & (cy1 <= y1)
+                & (ix == np.searchsorted(x_edges, cx1, side="left") - 1)
+                & (iy == np.searchsorted(y_edges, cy1, side="left") - 1)
+            )
+            counts += np.bincount(
+                ix[inside] * ny + iy[inside],
+                weights=table.size[nodes[inside]],
+                minlength=nx * ny,
+            ).astype(np.int64)
+
+            crossing = ~outside & ~inside
+            binned = crossing & (
+                (table.ref[nodes] < 0) | (table.size[nodes] <= leaf_size)
+            )
+            binned_nodes.append(nodes[binned])
+
+            children = table.children[nodes[crossing & ~binned]]
+            nodes = children[children >= 0]
+
+        # Bin the remaining points as numpy.histogram2d does
+        binned_nodes = np.concatenate(binned_nodes)
+        points = table.order[
+            _expand_ranges(table.start[binned_nodes], table.size[binned_nodes])
+        ]
+        px, py = self.xs[points], self.ys[points]
+        ix = np.searchsorted(x_edges, px, side="right") - 1
+        iy = np.searchsorted(y_edges, py, side="right") - 1
+        ix[px == x1] = nx - 1
+        iy[py == y1] = ny - 1
+        keep = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        counts += np.bincount(ix[keep] * ny + iy[keep], minlength=nx * ny)
+
+        return counts.reshape(nx, ny), x_edges, y_edges
+
+    def find(self, x: float, y: float, radius: Union[float, None] = None) -> int:
+        """
+        Find the point closest to (x, y) within the search radius, see
+        Quadtree.find().
+
+        Args:
+            x (float): The x coordinate of the query point
+            y (float): The y coordinate of the query point
+            radius (float, optional): The search radius. Defaults to None, which
+                means an infinite radius.
+
+        Returns:
+            int: The index of the closest point, or -1 if there is no point
+                within the search radius
+        """
+        nearest = self.knn(x, y, 1, radius)
+        return int(nearest[0]) if len(nearest) > 0 else -1
+
+    def knn(
+        self, x: float, y: float, k: int, radius: Union[float, None] = None
+    ) -> np.ndarray:
+        """
+        Find the k points closest to (x, y) with a best-first traversal, see
+        Quadtree.knn(). Only the visited rows of the arrays are read.
+
+        Args:
+            x (float): The x coordinate of the query point
+            y (float): The y coordinate of the query point
+            k (int): The number of points to find
+            radius (float, optional): The search radius. Defaults to None, which
+                means an infinite radius.
+
+        Returns:
+            np.ndarray: Up to k point indices, sorted by their distance to (x, y)
+        """
+        results = []
+
+        if self.root_ref == -1 or k <= 0:
+            return np.array(results, dtype=np.int64)
+
+        radius2 = math.inf if radius is None else radius * radius
+
+        # Each item in the heap is (squared distance, tie breaker, ref,
+        # [x0, y0, x1, y1] of the node). A point whose distance is already exact
+        # has its point index instead of a ref, and no position.
+        counter = itertools.count()
+        heap = [(0, next(counter), self.root_ref, (self.x0, self.y0, self.x1, self.y1))]
+
+        while len(heap) > 0:
+            _, _, ref, position = heapq.heappop(heap)
+
+            if position is None:
+                results.append(ref)
+                if len(results) == k:
+                    return np.array(results, dtype=np.int64)
+                continue
+
+            if ref <= -2:
+                for p in self._iter_chain(int(self._point_index[-2 - ref])):
+                    dx = float(self._xs[p]) - x
+                    dy = float(self._ys[p]) - y
+                    d2 = dx * dx + dy * dy
+                    if d2 < radius2:
+                        heapq.heappush(heap, (d2, next(counter), p, None))
+                continue
+
+            quad_positions = get_quadrant_extents(*position)
+            for quad, child in enumerate(self._children[ref].tolist()):
+                if child != -1:
+                    d2 = get_distance2(x, y, *quad_positions[quad])
+                    if d2 < radius2:
+                        heapq.heappush(
+                            heap, (d2, next(counter), child, quad_positions[quad])
+                        )
+
+        return np.array(results, dtype=np.int64)
+
+    def _iter_chain(self, head: int):
+        """Iterate through the chain of a leaf from its head."""
+        while head != -1:
+            yield head
+            head = int(self._next_point[head])
+
+    def save(self, path: str, chunk_size: int = 65536):
+        """
+        Save this tree in a compact binary file: a JSON header with the extent
+        and the array layout, followed by the child table, the leaf point
+        indices, the point chains and the coordinate columns at aligned offsets.
+        Data entries, if any, are streamed as a JSON section at the end. Default
+        entries {'x': x, 'y': y} are not stored, load() rebuilds them from the
+        coordinate columns.
+
+        Args:
+            path (str): The file path
+            chunk_size (int, optional): The number of data entries serialized
+                at once. Defaults to 65536.
+        """
+        arrays = {
+            "children": self.children,
+            "point_index": self.point_index,
+            "next_point": self.next_point,
+            "xs": self.xs,
+            "ys": self.ys,
+        }
+        data = self.data
+        default_data = data is not None and _is_default_data(data, self.xs, self.ys)
+
+        header = {
+            "version": FILE_VERSION,
+            "extent": [self.x0, self.y0, self.x1, self.y1],
+            "root_ref": int(self.root_ref),
+            "leaf_capacity": self.leaf_capacity,
+            "arrays": {},
+            "data": None,
+        }
+
+        # The header length depends on the offsets, so reserve enough room for
+        # the longest possible offsets first
+        for name, values in arrays.items():
+            header["arrays"][name] = {
+                "dtype": values.dtype.str,
+                "shape": list(values.shape),
+                "offset": 2**62,
+            }
+        if default_data:
+            header["data"] = {"default": True}
+        elif data is not None:
+            header["data"] = {"offset": 2**62, "length": 2**62}
+
+        header_length = len(dumps(header))
+        offset = _align(len(FILE_MAGIC) + 8 + header_length)
+        for name, values in arrays.items():
+            header["arrays"][name]["offset"] = offset
+            offset = _align(offset + values.nbytes)
+
+        with open(path, "wb") as fp:
+            for name, values in arrays.items():
+                fp.seek(header["arrays"][name]["offset"])
+                fp.write(np.ascontiguousarray(values).tobytes())
+
+            if header["data"] is not None and not default_data:
+                fp.seek(offset)
+                _write_json_list(fp, data, chunk_size)
+                header["data"] = {"offset": offset, "length": fp.tell() - offset}
+
+            # The final header is never longer than the reserved one
+            header_bytes = dumps(header).encode("utf-8")
+            fp.seek(0)
+            fp.write(FILE_MAGIC)
+            fp.write(struct.pack("<Q", len(header_bytes)))
+            fp.write(header_bytes)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "ArrayQuadtree":
+        """
+        Load a tree saved by save(). With `mmap`, the arrays are memory-mapped
+        copy-on-write, so opening is O(1) and queries only read the pages they
+        visit. Data entries are parsed on first access.
+
+        Args:
+            path (str): The file path
+            mmap (bool, optional): Memory-map the arrays instead of reading them.
+                Defaults to True.
+
+        Returns:
+            ArrayQuadtree: The loaded tree
+        """
+        with open(path, "rb") as fp:
+            if fp.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError(f"Not a quadtree file: {path}")
+
+            (header_length,) = struct.unpack("<Q", fp.read(8))
+            header = loads(fp.read(header_length).decode("utf-8"))
+
+        if header["version"] != FILE_VERSION:
+            raise ValueError(f"Unknown quadtree file version: {header['version']}")
+
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            shape = tuple(spec["shape"])
+            if mmap and np.prod(shape) > 0:
+                arrays[name] = np.memmap(
+                    path, dtype=dtype, mode="c", offset=spec["offset"], shape=shape
+                )
+            else:
+                arrays[name] = np.fromfile(
+                    path, dtype=dtype, count=int(np.prod(shape)), offset=spec["offset"]
+                ).reshape(shape)
+
+        tree = cls()
+        tree.x0, tree.y0, tree.x1, tree.y1 = header["extent"]
+        tree.root_ref = header["root_ref"]
+        tree.leaf_capacity = header.get("leaf_capacity", 1)
+        tree._children = arrays["children"]
+        tree._point_index = arrays["point_index"]
+        tree._next_point = arrays["next_point"]
+        tree._xs = arrays["xs"]
+        tree._ys = arrays["ys"]
+        tree.n_internal = len(tree._children)
+        tree.n_leaves = len(tree._point_index)
+        tree.n_points = len(tree._xs)
+
+        if header["data"] is not None and header["data"].get("default"):
+            tree._data_loader = _default_data_loader(tree)
+        elif header["data"] is not None:
+            tree._data_loader = _data_loader(
+                path, header["data"]["offset"], header["data"]["length"]
+            )
+
+        return tree
+
+    def to_quadtree(self):
+        """
+        Convert this tree into a Quadtree with the nested-list structure.
+
+        Returns:
+            Quadtree: The equivalent quadtree
+        """
+        from quadtreed3.quadtreed3 import Quadtree
+
+        q = Quadtree(self.leaf_capacity)
+        q.x0, q.y0, q.x1, q.y1 = self.x0, self.y0, self.x1, self.y1
+        q.root = self.root
+        return q
+
+    @classmethod
+    def from_quadtree(cls, quadtree) -> "ArrayQuadtree":
+        """
+        Create an array-backed copy of a Quadtree. Nodes and points are numbered
+        in the pre-order of the nested-list root, quadrants 0 to 3 and each chain
+        of coincident points from its head.
+
+        Args:
+            quadtree (Quadtree): The quadtree to copy
+
+        Returns:
+            ArrayQuadtree: The equivalent array-backed quadtree
+        """
+        tree = cls()
+        tree.x0, tree.y0 = quadtree.x0, quadtree.y0
+        tree.x1, tree.y1 = quadtree.x1, quadtree.y1
+        tree.leaf_capacity = quadtree.leaf_capacity
+
+        root = quadtree.uncompressed_root()
+        if root is None:
+            return tree
+
+        # Flat typed buffers, the children of internal node i are 4 * i to 4 * i + 3
+        children = array("i")
+        point_index = array("i")
+        next_point = array("i")
+        xs, ys, data = array("d"), array("d"), []
+
+        # Each item in the stack is (cur_node, children slot of the node)
+        stack = [(root, -1)]
+
+        while len(stack) > 0:
+            cur_node, slot = stack.pop()
+
+            if "data" in cur_node:
+                ref = -2 - len(point_index)
+                point_index.append(len(xs))
+
+                if "next" not in cur_node and "count" not in cur_node:
+                    d = cur_node["data"]
+                    xs.append(d["x"])
+                    ys.append(d["y"])
+                    data.append(d)
+                    next_point.append(-1)
+                else:
+                    # Chains through "next" and counted leaves, newest first
+                    entries = []
+                    leaf = cur_node
+                    while leaf is not None:
+                        entries.append(leaf["data"])
+                        entries.extend(reversed(leaf.get("duplicates", ())))
+                        leaf = leaf.get("next")
+
+                    for d in entries:
+                        xs.append(d["x"])
+                        ys.append(d["y"])
+                        data.append(d)
+                        next_point.append(len(xs))
+                    next_point[-1] = -1
+            else:
+                ref = len(children) // 4
+                children.extend((-1, -1, -1, -1))
+
+                # Push the children reversely to visit them in quadrant order
+                for child_quad in (3, 2, 1, 0):
+                    child = cur_node[child_quad]
+                    if child is not None:
+                        stack.append((child, 4 * ref + child_quad))
+
+            if slot == -1:
+                tree.root_ref = ref
+            else:
+                children[slot] = ref
+
+        tree._children = np.array(children, dtype=np.int32).reshape(-1, 4)
+        tree._point_index = np.array(point_index, dtype=np.int32)
+        tree._next_point = np.array(next_point, dtype=np.int32)
+        tree._xs = np.array(xs, dtype=np.float64)
+        tree._ys = np.array(ys, dtype=np.float64)
+        tree.n_internal = len(children) // 4
+        tree.n_leaves = len(point_index)
+        tree.n_points = len(xs)
+        tree.data = data
+        return tree
+
+    def _new_point(self, x: float, y: float, d: Union[dict, None]) -> int:
+        p = self.n_points
+        if p == len(self._xs):
+            capacity = max(16, 2 * p)
+            self._xs = _grow(self._xs, capacity)
+            self._ys = _grow(self._ys, capacity)
+            self._next_point = _grow(self._next_point, capacity)
+
+        self._xs[p] = x
+        self._ys[p] = y
+        self._next_point[p] = -1
+
+        if d and self.data is None:
+            self.data = [None] * p
+        if self.data is not None:
+            self.data.append(d if d else None)
+
+        self.n_points += 1
+        return p
+
+    def _new_leaf(self, p: int) -> int:
+        leaf = self.n_leaves
+        if leaf == len(self._point_index):
+            self._point_index = _grow(self._point_index, max(16, 2 * leaf))
+
+        self._point_index[leaf] = p
+        self.n_leaves += 1
+        return leaf
+
+    def _new_internal(self) -> int:
+        node = self.n_internal
+        if node == len(self._children):
+            self._children = _grow(self._children, max(16, 2 * node))
+
+        self._children[node] = -1
+        self.n_internal += 1
+        return node
+
+
+def _build_node_table(tree: ArrayQuadtree) -> NodeTable:
+    """
+    Compute the node table of an array-backed quadtree. Nodes are collected
+    level by level, subtree sizes are summed bottom-up, and the pre-order ids
+    and point offsets are assigned top-down, each with one vectorized pass per
+    level.
+    """
+    if tree.root_ref == -1:
+        empty = np.empty(0, dtype=np.int64)
+        empty_float = np.empty(0, dtype=np.float64)
+        return NodeTable(
+            ref=empty,
+            parent=empty,
+            children=np.empty((0, 4), dtype=np.int64),
+            level=empty,
+            x0=empty_float,
+            y0=empty_float,
+            x1=empty_float,
+            y1=empty_float,
+            size=empty,
+            height=empty,
+            start=empty,
+            order=empty,
+        )
+
+    children = tree.children.astype(np.int64)
+    point_index = tree.point_index.astype(np.int64)
+    next_point = tree.next_point.astype(np.int64)
+
+    # Collect the nodes level by level. Nodes of a level are grouped by parent
+    # and sorted by quadrant inside each group.
+    refs = [np.array([tree.root_ref], dtype=np.int64)]
+    parents = [np.array([-1], dtype=np.int64)]
+    quads = [np.array([-1], dtype=np.int64)]
+    boxes = [np.array([[tree.x0, tree.y0, tree.x1, tree.y1]], dtype=np.float64)]
+    offset = 0
+
+    while True:
+        internal = np.flatnonzero(refs[-1] >= 0)
+        if len(internal) == 0:
+            break
+
+        rows = children[refs[-1][internal]]
+        filled = rows != -1
+        child_parent, child_quad = np.nonzero(filled)
+
+        parent_box = boxes[-1][internal][child_parent]
+        x0, y0, x1, y1 = parent_box.T
+        xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+        right = (child_quad & 1).astype(bool)
+        top = (child_quad & 2).astype(bool)
+
+        refs.append(rows[filled])
+        parents.append(offset + internal[child_parent])
+        quads.append(child_quad)
+        boxes.append(
+            np.stack(
+                [
+                    np.where(right, xm, x0),
+                    np.where(top, ym, y0),
+                    np.where(right, x1, xm),
+                    np.where(top, y1, ym),
+                ],
+                axis=1,
+            )
+        )
+        offset += len(refs[-2])
+
+    level_sizes = [len(r) for r in refs]
+    level_offsets = np.concatenate([[0], np.cumsum(level_sizes)])
+    ref = np.concatenate(refs)
+    parent = np.concatenate(parents)
+    box = np.concatenate(boxes)
+    n_nodes = len(ref)
+
+    # Count the points of every leaf by walking all chains at once
+    is_leaf = ref <= -2
+    leaf_nodes = np.flatnonzero(is_leaf)
+    heads = point_index[-2 - ref[leaf_nodes]]
+
+    size = np.zeros(n_nodes, dtype=np.int64)
+    cur, nodes = heads, leaf_nodes
+    while len(cur) > 0:
+        size[nodes] += 1
+        cur = next_point[cur]
+        linked = cur != -1
+        cur, nodes = cur[linked], nodes[linked]
+
+    # Sum sizes, node counts and heights bottom-up
+    count = np.ones(n_nodes, dtype=np.int64)
+    height = np.zeros(n_nodes, dtype=np.int64)
+    for level in range(len(refs) - 1, 0, -1):
+        lo, hi = level_offsets[level], level_offsets[level + 1]
+        np.add.at(size, parent[lo:hi], size[lo:hi])
+        np.add.at(count, parent[lo:hi], count[lo:hi])
+        np.maximum.at(height, parent[lo:hi], height[lo:hi] + 1)
+
+    # Assign pre-order ids and point offsets top-down. A child comes after its
+    # parent and after all nodes and points of its previous siblings.
+    nid = np.zeros(n_nodes, dtype=np.int64)
+    start = np.zeros(n_nodes, dtype=np.int64)
+    for level in range(1, len(refs)):
+        lo, hi = level_offsets[level], level_offsets[level + 1]
+        p = parent[lo:hi]
+        first = np.flatnonzero(np.r_[True, p[1:] != p[:-1]])
+        group_counts = np.diff(np.r_[first, hi - lo])
+
+        before_count = np.cumsum(count[lo:hi]) - count[lo:hi]
+        before_count -= np.repeat(before_count[first], group_counts)
+        before_size = np.cumsum(size[lo:hi]) - size[lo:hi]
+        before_size -= np.repeat(before_size[first], group_counts)
+
+        nid[lo:hi] = nid[p] + 1 + before_count
+        start[lo:hi] = start[p] + before_size
+
+    # Lay out the points of every leaf chain from its start offset
+    order = np.empty(tree.n_points, dtype=np.int64)
+    cur, pos = heads, start[leaf_nodes]
+    while len(cur) > 0:
+        order[pos] = cur
+        cur, pos = next_point[cur], pos + 1
+        linked = cur != -1
+        cur, pos = cur[linked], pos[linked]
+
+    # Reorder everything by pre-order id
+    by_nid = np.empty(n_nodes, dtype=np.int64)
+    by_nid[nid] = np.arange(n_nodes)
+
+    node_children = np.full((n_nodes, 4), -1, dtype=np.int64)
+    node_children[nid[parent[1:]], np.concatenate(quads)[1:]] = nid[1:]
+
+    level = np.repeat(np.arange(len(refs)), level_sizes)
+    parent_nid = np.where(parent >= 0, nid[np.maximum(parent, 0)], -1)
+
+    return NodeTable(
+        ref=ref[by_nid],
+        parent=parent_nid[by_nid],
+        children=node_children,
+        level=level[by_nid],
+        x0=box[by_nid, 0],
+        y0=box[by_nid, 1],
+        x1=box[by_nid, 2],
+        y1=box[by_nid, 3],
+        size=size[by_nid],
+        height=height[by_nid],
+        start=start[by_nid],
+        order=order,
+    )
+
+
+def _reduce_subtrees(
+    table: NodeTable, values: np.ndarray, ufunc: np.ufunc, initial: float
+) -> np.ndarray:
+    """
+    Reduce per-point columns over every subtree. Leaves are reduced from their
+    contiguous point ranges, then each level is folded into its parents with
+    one unbuffered ufunc call.
+
+    Args:
+        table (NodeTable): The node table of the tree
+        values (np.ndarray): Columns of shape [n_points, k] by point index
+        ufunc (np.ufunc): The reduction, e.g. np.add
+        initial (float): The identity of the reduction
+
+    Returns:
+        np.ndarray: Reduced columns of shape [n_nodes, k] by pre-order node id
+    """
+    reduced = np.full((len(table.ref), values.shape[1]), initial, dtype=np.float64)
+
+    # Leaves hold disjoint point ranges that tile the pre-order
+    leaves = np.flatnonzero(table.ref < 0)
+    if len(leaves) > 0:
+        reduced[leaves] = ufunc.reduceat(values[table.order], table.start[leaves])
+
+    # Fold the levels into their parents from the bottom
+    by_level = np.argsort(table.level, kind="stable")
+    bounds = np.searchsorted(
+        table.level[by_level], np.arange(table.level.max(initial=0) + 2)
+    )
+    for level in range(len(bounds) - 2, 0, -1):
+        nodes = by_level[bounds[level] : bounds[level + 1]]
+        ufunc.at(reduced, table.parent[nodes], reduced[nodes])
+
+    return reduced
+
+
+def _expand_ranges(starts: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """
+    Concatenate the ranges [start, start + size).
+    """
+    offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return np.repeat(starts, sizes) + offsets
+
+
+def _polygon_edges(vertices: np.ndarray) -> np.ndarray:
+    """Get the edges [x0, y0, x1, y1] of a closed polygon, shape [4, n_edges]."""
+    closed = np.roll(vertices, -1, axis=0)
+    return np.stack([vertices[:, 0], vertices[:, 1], closed[:, 0], closed[:, 1]])
+
+
+def _inside_polygon(
+    edges: np.ndarray, xs: np.ndarray, ys: np.ndarray, block: int = 1 << 20
+) -> np.ndarray:
+    """
+    Test points against a polygon with the even-odd rule, by counting the edges
+    crossed by a horizontal ray to the right of every point.
+    """
+    ex0, ey0, ex1, ey1 = edges[:, :, None]
+    inside = np.zeros(len(xs), dtype=bool)
+    step = max(block // edges.shape[1], 1)
+
+    for i in range(0, len(xs), step):
+        x, y = xs[i : i + step], ys[i : i + step]
+        straddle = (ey0 > y) != (ey1 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cross_x = ex0 + (y - ey0) * (ex1 - ex0) / (ey1 - ey0)
+        crossings = (straddle & (x < cross_x)).sum(axis=0)
+        inside[i : i + step] = crossings % 2 == 1
+
+    return inside
+
+
+def _edges_cross_boxes(
+    edges: np.ndarray,
+    x0: np.ndarray,
+    y0: np.ndarray,
+    x1: np.ndarray,
+    y1: np.ndarray,
+    block: int = 1 << 20,
+) -> np.ndarray:
+    """
+    Test if any polygon edge touches each closed box. An edge misses a box if
+    their bounding boxes are disjoint, or if all corners of the box are strictly
+    on one side of the line through the edge.
+    """
+    ex0, ey0, ex1, ey1 = edges[:, :, None]
+    crossed = np.zeros(len(x0), dtype=bool)
+    step = max(block // edges.shape[1], 1)
+
+    for i in range(0, len(x0), step):
+        bx0, by0 = x0[i : i + step], y0[i : i + step]
+        bx1, by1 = x1[i : i + step], y1[i : i + step]
+        overlap = (
+            (np.minimum(ex0, ex1) <= bx1)
+            & (bx0 <= np.maximum(ex0, ex1))
+            & (np.minimum(ey0, ey1) <= by1)
+            & (by0 <= np.maximum(ey0, ey1))
+        )
+
+        # The side of every corner, as the sign of the cross product
+        dx, dy = ex1 - ex0, ey1 - ey0
+        sides = [
+            np.sign(dx * (cy - ey0) - dy * (cx - ex0))
+            for cx, cy in ((bx0, by0), (bx1, by0), (bx0, by1), (bx1, by1))
+        ]
+        one_side = (sum(sides) == 4) | (sum(sides) == -4)
+        crossed[i : i + step] = (overlap & ~one_side).any(axis=0)
+
+    return crossed
+
+
+def _align(offset: int) -> int:
+    """Round an offset in the binary file up to the array alignment."""
+    return -(-offset // FILE_ALIGNMENT) * FILE_ALIGNMENT
+
+
+def _data_loader(path: str, offset: int, length: int) -> Callable[[], list]:
+    """Create a function that reads the JSON data section of a binary file."""
+
+    def load_data() -> list:
+        with open(path, "rb") as fp:
+            fp.seek(offset)
+            return loads(fp.read(length).decode("utf-8"))
+
+    return load_data
+
+
+def _default_data_loader(tree: ArrayQuadtree) -> Callable[[], list]:
+    """Create a function that rebuilds default data entries from the columns."""
+
+    def load_data() -> list:
+        with paused_gc():
+            return [
+                {"x": x, "y": y} for x, y in zip(tree.xs.tolist(), tree.ys.tolist())
+            ]
+
+    return load_data
+
+
+def _is_default_data(data: list, xs: np.ndarray, ys: np.ndarray) -> bool:
+    """
+    Check whether data entries are all None or {'x': x, 'y': y} with the
+    coordinates of their point.
+    """
+    if not all(d is None or d.keys() == {"x", "y"} for d in data):
+        return False
+
+    data_xs = np.array(
+        [x if d is None else d["x"] for d, x in zip(data, xs.tolist())], dtype=float
+    )
+    data_ys = np.array(
+        [y if d is None else d["y"] for d, y in zip(data, ys.tolist())], dtype=float
+    )
+    return np.array_equal(data_xs, xs, equal_nan=True) and np.array_equal(
+        data_ys, ys, equal_nan=True
+    )
+
+
+def _write_json_list(fp, values: list, chunk_size: int):
+    """Write a list as a JSON array to a binary file, one chunk at a time."""
+    fp.write(b"[")
+    for i in range(0, len(values), chunk_size):
+        if i > 0:
+            fp.write(b", ")
+        chunk = dumps(values[i : i + chunk_size], default=to_json_value)
+        fp.write(chunk[1:-1].encode("utf-8"))
+    fp.write(b"]")
+
+
+def _grow(array: np.ndarray, capacity: int) -> np.ndarray:
+    """Copy an array into a new buffer with a larger first dimension."""
+    new_array = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    new_array[: len(array)] = array
+    return new_array
@@ -0,0 +1,504 @@
+"""Vectorized bulk construction of quadtrees."""
+
+import gc
+import math
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import Union
+
+import numpy as np
+
+
+@contextmanager
+def paused_gc():
+    """
+    Pause the cyclic garbage collector while building large object graphs. The
+    nested lists and dicts of a quadtree hold no reference cycles, but creating
+    millions of them otherwise triggers many full collections.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def bulk_partition(
+    xs: np.ndarray,
+    ys: np.ndarray,
+    x0: float,
+    y0: float,
+    x1: float,
+    y1: float,
+    leaf_capacity: int = 1,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, int, int]:
+    """
+    Partition all points into quadtree cells in one vectorized pass per tree
+    level. Each level appends one quadrant digit (the next two bits of the
+    points' Morton codes) to every point that still shares its cell with a
+    distinct point, and stable-sorts the points by their Morton prefix.
+
+    The quadrant digits are computed with the same midpoint comparisons as
+    get_quadrant(), so the resulting tree is identical to inserting the points
+    one by one into the extent [x0, x1) x [y0, y1).
+
+    Child references are encoded as integers: -1 is an empty slot, a value
+    i >= 0 is the internal node i, and a value r <= -2 is the leaf -2 - r.
+
+    Args:
+        xs (np.ndarray): The x coordinates of the points
+        ys (np.ndarray): The y coordinates of the points
+        x0 (float): The x coordinate of the extent origin
+        y0 (float): The y coordinate of the extent origin
+        x1 (float): The x coordinate of the extent end
+        y1 (float): The y coordinate of the extent end
+        leaf_capacity (int, optional): The maximum number of distinct positions
+            in a leaf, see Quadtree.leaf_capacity. Defaults to 1.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray, int, int]: The child table of
+            shape [n_internal, 4], the head point index of every leaf, the next
+            point index of every point (-1 ends the chain of a leaf), the
+            reference to the root node and the maximum depth of the leaves.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    n = len(xs)
+
+    next_point = np.full(n, -1, dtype=np.int32)
+
+    if n == 0:
+        return (
+            np.empty((0, 4), dtype=np.int32),
+            np.empty(0, dtype=np.int32),
+            next_point,
+            -1,
+            0,
+        )
+
+    # The points of a leaf are chained with the last inserted point at the head
+    if leaf_capacity > 1:
+        root_is_leaf = (
+            count_positions(xs, ys, np.zeros(n), np.zeros(1, dtype=np.int64))[0]
+            <= leaf_capacity
+        )
+    else:
+        root_is_leaf = xs.min() == xs.max() and ys.min() == ys.max()
+
+    if root_is_leaf:
+        next_point[1:] = np.arange(n - 1, dtype=np.int32)
+        return (
+            np.empty((0, 4), dtype=np.int32),
+            np.array([n - 1], dtype=np.int32),
+            next_point,
+            -2,
+            0,
+        )
+
+    # Internal nodes are created level by level, one child table chunk per level
+    chunks = [np.full((1, 4), -1, dtype=np.int32)]
+    leaf_chunks = []
+    n_internal = 1
+    n_leaves = 0
+
+    bx0 = np.array([x0], dtype=np.float64)
+    by0 = np.array([y0], dtype=np.float64)
+    bx1 = np.array([x1], dtype=np.float64)
+    by1 = np.array([y1], dtype=np.float64)
+
+    # Active points are sorted by their cell, and by insertion order in a cell
+    order = np.arange(n)
+    group = np.zeros(n, dtype=np.int64)
+
+    while len(order) > 0:
+        px, py = xs[order], ys[order]
+        xm = (bx0 + bx1) / 2
+        ym = (by0 + by1) / 2
+
+        # Quadrant index
+        # |2|3|
+        # |0|1|
+        quad = (px >= xm[group]).astype(np.int64) + 2 * (py >= ym[group])
+        key = group * 4 + quad
+
+        sort = np.argsort(key, kind="stable")
+        order, key, px, py = order[sort], key[sort], px[sort], py[sort]
+
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        counts = np.diff(np.r_[starts, len(key)])
+        parents = key[starts] // 4
+        quads = key[starts] % 4
+
+        # A cell becomes a leaf once all its points are coincident, or once
+        # it has at most leaf_capacity distinct positions
+        if leaf_capacity > 1:
+            is_leaf = count_positions(px, py, key, starts) <= leaf_capacity
+        else:
+            is_leaf = (
+                np.minimum.reduceat(px, starts) == np.maximum.reduceat(px, starts)
+            ) & (np.minimum.reduceat(py, starts) == np.maximum.reduceat(py, starts))
+        point_is_leaf = np.repeat(is_leaf, counts)
+
+        # Link the points of every leaf into a chain, newest point first
+        first = np.zeros(len(order), dtype=bool)
+        first[starts] = True
+        chained = point_is_leaf & ~first
+        next_point[order[chained]] = order[np.flatnonzero(chained) - 1]
+
+        leaf_starts = starts[is_leaf]
+        leaf_chunks.append(order[leaf_starts + counts[is_leaf] - 1])
+        leaf_ids = n_leaves + np.arange(len(leaf_starts))
+        n_leaves += len(leaf_starts)
+
+        parent_chunk = chunks[-1]
+        parent_chunk[parents[is_leaf], quads[is_leaf]] = -2 - leaf_ids
+
+        # The remaining cells are split at the next level
+        is_node = ~is_leaf
+        n_new = int(is_node.sum())
+        if n_new == 0:
+            break
+
+        parent_chunk[parents[is_node], quads[is_node]] = n_internal + np.arange(n_new)
+        chunks.append(np.full((n_new, 4), -1, dtype=np.int32))
+        n_internal += n_new
+
+        node_parents = parents[is_node]
+        node_quads = quads[is_node]
+        right = (node_quads & 1).astype(bool)
+        top = (node_quads & 2).astype(bool)
+        pxm, pym = xm[node_parents], ym[node_parents]
+        bx0, bx1 = (
+            np.where(right, pxm, bx0[node_parents]),
+            np.where(right, bx1[node_parents], pxm),
+        )
+        by0, by1 = (
+            np.where(top, pym, by0[node_parents]),
+            np.where(top, by1[node_parents], pym),
+        )
+
+        keep = ~point_is_leaf
+        group = np.repeat(np.cumsum(is_node) - 1, counts)[keep]
+        order = order[keep]
+
+    children = np.concatenate(chunks)
+    point_index = np.concatenate(leaf_chunks).astype(np.int32)
+    return children, point_index, next_point, 0, len(chunks)
+
+
+def count_positions(
+    xs: np.ndarray, ys: np.ndarray, key: np.ndarray, starts: np.ndarray
+) -> np.ndarray:
+    """
+    Count the distinct positions of every group of points.
+
+    Args:
+        xs (np.ndarray): The x coordinates of the points
+        ys (np.ndarray): The y coordinates of the points
+        key (np.ndarray): The sorted group key of every point
+        starts (np.ndarray): The index of the first point of every group
+
+    Returns:
+        np.ndarray: The number of distinct positions in every group
+    """
+    sort = np.lexsort((ys, xs, key))
+    xs, ys, key = xs[sort], ys[sort], key[sort]
+    new = np.r_[True, (key[1:] != key[:-1]) | (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])]
+    return np.add.reduceat(new.astype(np.int64), starts)
+
+
+def nested_from_arrays(
+    children: np.ndarray,
+    point_index: np.ndarray,
+    next_point: np.ndarray,
+    root_ref: int,
+    leaves: list[dict],
+):
+    """
+    Convert an integer-encoded quadtree into the nested-list structure used by
+    d3-quadtree.
+
+    Args:
+        children (np.ndarray): The child table of shape [n_internal, 4]
+        point_index (np.ndarray): The head point index of every leaf
+        next_point (np.ndarray): The next point index of every point
+        root_ref (int): The reference to the root node
+        leaves (list[dict]): The leaf dict {"data": ...} of every point
+
+    Returns:
+        Union[list, dict, None]: The root of the nested-list quadtree
+    """
+    if root_ref == -1:
+        return None
+
+    # Link the points of every leaf, each point links to the previously
+    # inserted point in the leaf
+    linked = np.flatnonzero(next_point != -1)
+    for p, p_next in zip(linked.tolist(), next_point[linked].tolist()):
+        leaves[p]["next"] = leaves[p_next]
+
+    heads = [leaves[p] for p in point_index.tolist()]
+
+    if root_ref <= -2:
+        return heads[-2 - root_ref]
+
+    # Create all internal nodes first, then resolve the child references through
+    # one lookup table [internal nodes, leaves, empty slot]
+    n_internal = len(children)
+    nodes = [[None, None, None, None] for _ in range(n_internal)]
+    table = nodes + heads + [None]
+
+    slots = np.where(
+        children >= 0,
+        children,
+        np.where(children <= -2, n_internal - 2 - children, len(table) - 1),
+    )
+
+    for node, row in zip(nodes, slots.tolist()):
+        node[:] = map(table.__getitem__, row)
+
+    return nodes[root_ref]
+
+
+def parallel_build(
+    xs: np.ndarray,
+    ys: np.ndarray,
+    x0: float,
+    y0: float,
+    x1: float,
+    y1: float,
+    leaves: list[dict],
+    workers: int,
+    leaf_capacity: int = 1,
+) -> tuple[Union[list, dict, None], int, int]:
+    """
+    Build the nested-list quadtree of all points with a process pool. The
+    extent is split into the 4^k quadrant cells of level k, every cell is
+    partitioned by bulk_partition() in a worker process, and the subtrees are
+    grafted below a top tree of k levels. The cells use the same midpoints as
+    the serial build, so the tree is identical to bulk_partition() on all
+    points.
+
+    The coordinates are passed to the workers in shared memory, the workers
+    only receive the range of their cell in the point order.
+
+    Args:
+        xs (np.ndarray): The x coordinates of the points
+        ys (np.ndarray): The y coordinates of the points
+        x0 (float): The x coordinate of the extent origin
+        y0 (float): The y coordinate of the extent origin
+        x1 (float): The x coordinate of the extent end
+        y1 (float): The y coordinate of the extent end
+        leaves (list[dict]): The leaf dict {"data": ...} of every point
+        workers (int): The number of worker processes
+        leaf_capacity (int, optional): The maximum number of distinct positions
+            in a leaf. Defaults to 1.
+
+    Returns:
+        tuple[Union[list, dict, None], int, int]: The root of the nested-list
+            quadtree, the number of internal nodes and the maximum depth of
+            the leaves
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    n = len(xs)
+
+    # Use a few cells per worker to balance uneven cells
+    levels = max(1, math.ceil(math.log(4 * workers, 4)))
+    key, boxes = cell_partition(xs, ys, x0, y0, x1, y1, levels)
+
+    order = np.argsort(key, kind="stable")
+    starts = np.flatnonzero(np.r_[True, key[order][1:] != key[order][:-1]])
+    stops = np.r_[starts[1:], n]
+    cell_keys = key[order][starts].tolist()
+
+    # Share the coordinates and the point order with the workers
+    shm = SharedMemory(create=True, size=max(24 * n, 1))
+    try:
+        shared = _shared_arrays(shm, n)
+        shared[0][:], shared[1][:], shared[2][:] = xs, ys, order
+        del shared
+
+        tasks = [
+            (
+                shm.name,
+                n,
+                start,
+                stop,
+                tuple(boxes[:, order[start]].tolist()),
+                leaf_capacity,
+            )
+            for start, stop in zip(starts.tolist(), stops.tolist())
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_partition_cell, tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # Convert every cell into a subtree (root, number of internal nodes, depth,
+    # range in the point order)
+    cells = {}
+    for (
+        cell_key,
+        start,
+        stop,
+        (children, point_index, next_point, root_ref, depth),
+    ) in zip(cell_keys, starts.tolist(), stops.tolist(), results):
+        cell_leaves = [leaves[p] for p in order[start:stop].tolist()]
+        root = nested_from_arrays(
+            children, point_index, next_point, root_ref, cell_leaves
+        )
+        cells[cell_key] = (
+            root,
+            len(children),
+            depth if root_ref >= 0 else 0,
+            start,
+            stop,
+        )
+
+    root, n_internal, depth, _, _ = _graft_cells(
+        cells, levels, 0, 0, leaf_capacity, order, leaves
+    )
+    return root, n_internal, depth
+
+
+def cell_partition(
+    xs: np.ndarray,
+    ys: np.ndarray,
+    x0: float,
+    y0: float,
+    x1: float,
+    y1: float,
+    levels: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find the quadrant cell of every point at a tree level, with the same
+    midpoint comparisons as get_quadrant().
+
+    Args:
+        xs (np.ndarray): The x coordinates of the points
+        ys (np.ndarray): The y coordinates of the points
+        x0 (float): The x coordinate of the extent origin
+        y0 (float): The y coordinate of the extent origin
+        x1 (float): The x coordinate of the extent end
+        y1 (float): The y coordinate of the extent end
+        levels (int): The level of the cells
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The cell key of every point, which is
+            the sequence of its quadrants in base 4, and the cell extents
+            [x0, y0, x1, y1] of shape [4, n]
+    """
+    n = len(xs)
+    key = np.zeros(n, dtype=np.int64)
+    bx0, by0 = np.full(n, x0, dtype=np.float64), np.full(n, y0, dtype=np.float64)
+    bx1, by1 = np.full(n, x1, dtype=np.float64), np.full(n, y1, dtype=np.float64)
+
+    for _ in range(levels):
+        xm = (bx0 + bx1) / 2
+        ym = (by0 + by1) / 2
+        right = xs >= xm
+        top = ys >= ym
+        key = key * 4 + right + 2 * top
+        bx0, bx1 = np.where(right, xm, bx0), np.where(right, bx1, xm)
+        by0, by1 = np.where(top, ym, by0), np.where(top, by1, ym)
+
+    return key, np.stack([bx0, by0, bx1, by1])
+
+
+def _graft_cells(
+    cells: dict[int, tuple[Union[list, dict], int, int, int, int]],
+    levels: int,
+    level: int,
+    key: int,
+    leaf_capacity: int,
+    order: np.ndarray,
+    leaves: list[dict],
+) -> tuple[Union[list, dict, None], int, int, int, int]:
+    """
+    Create the top tree above the cell subtrees. A node is only created if it
+    holds more than leaf_capacity distinct points, otherwise its leaves are
+    merged into one leaf that moves up, the same as adding the points one by
+    one.
+    """
+    if level == levels:
+        return cells.get(key, (None, 0, 0, 0, 0))
+
+    children = [
+        _graft_cells(
+            cells, levels, level + 1, key * 4 + q, leaf_capacity, order, leaves
+        )
+        for q in range(4)
+    ]
+    filled = [child for child in children if child[0] is not None]
+
+    if len(filled) == 0:
+        return None, 0, 0, 0, 0
+
+    start, stop = filled[0][3], filled[-1][4]
+
+    if len(filled) == 1 and "data" in filled[0][0]:
+        return filled[0]
+
+    if (
+        leaf_capacity > 1
+        and all("data" in child[0] for child in filled)
+        and len(
+            {(d["x"], d["y"]) for child in filled for d in _iter_chain_data(child[0])}
+        )
+        <= leaf_capacity
+    ):
+        # Chain all points of the cells, the last inserted point at the head
+        chain = [leaves[p] for p in sorted(order[start:stop].tolist(), reverse=True)]
+        for leaf, next_leaf in zip(chain, chain[1:]):
+            leaf["next"] = next_leaf
+        chain[-1].pop("next", None)
+        return chain[0], 0, 0, start, stop
+
+    return (
+        [child[0] for child in children],
+        1 + sum(child[1] for child in children),
+        1 + max(child[2] for child in filled),
+        start,
+        stop,
+    )
+
+
+def _iter_chain_data(leaf: dict):
+    """
+    Iterate through the data entries of a leaf chain.
+    """
+    while leaf is not None:
+        yield leaf["data"]
+        leaf = leaf.get("next")
+
+
+def _partition_cell(task: tuple) -> tuple:
+    """
+    Partition the points of one cell in a worker process.
+    """
+    name, n, start, stop, (x0, y0, x1, y1), leaf_capacity = task
+    shm = SharedMemory(name=name)
+    try:
+        xs, ys, order = _shared_arrays(shm, n)
+        cell = order[start:stop]
+        result = bulk_partition(xs[cell], ys[cell], x0, y0, x1, y1, leaf_capacity)
+        del xs, ys, order, cell
+    finally:
+        shm.close()
+    return result
+
+
+def _shared_arrays(shm: SharedMemory, n: int) -> tuple[np.ndarray, ...]:
+    """
+    Get the x coordinates, y coordinates and point order in a shared block.
+    """
+    return (
+        np.ndarray(n, dtype=np.float64, buffer=shm.buf, offset=0),
+        np.ndarray(n, dtype=np.float64, buffer=shm.buf, offset=8 * n),
+        np.ndarray(n, dtype=np.int64, buffer=shm.buf, offset=16 * n),
+    )
@@ -0,0 +1,172 @@
+"""Columnar data payloads whose rows are read lazily."""
+
+from collections.abc import Mapping, MutableMapping
+from typing import Iterator, Union
+
+import numpy as np
+
+from quadtreed3.bulk import paused_gc
+
+
+class ColumnTable:
+    """
+    The attributes of points stored as one NumPy column per field, instead of
+    one dict per point. The columns 'x' and 'y' hold the point coordinates.
+    """
+
+    def __init__(
+        self,
+        columns: Union[dict[str, np.ndarray], np.ndarray],
+        xs: Union[list[float], np.ndarray],
+        ys: Union[list[float], np.ndarray],
+    ):
+        """
+        Args:
+            columns (Union[dict[str, np.ndarray], np.ndarray]): A dict of
+                columns or a structured array, with one row per point
+            xs (Union[list[float], np.ndarray]): The x coordinates of the points
+            ys (Union[list[float], np.ndarray]): The y coordinates of the points
+        """
+        if isinstance(columns, np.ndarray):
+            columns = {name: columns[name] for name in columns.dtype.names}
+
+        self.columns = {name: np.asarray(column) for name, column in columns.items()}
+        self.columns["x"] = np.array(xs, dtype=np.float64)
+        self.columns["y"] = np.array(ys, dtype=np.float64)
+
+        for name, column in self.columns.items():
+            if len(column) != len(self):
+                raise ValueError(
+                    f"Column {name} has {len(column)} rows instead of {len(self)}"
+                )
+
+    def __len__(self) -> int:
+        return len(self.columns["x"])
+
+    def rows(self) -> list["Row"]:
+        """
+        Get a lazy row of every point.
+
+        Returns:
+            list[Row]: The rows in order
+        """
+        with paused_gc():
+            return [Row(self, i) for i in range(len(self))]
+
+    def row(self, index: int) -> dict:
+        """
+        Materialize a row as a dict of Python values.
+
+        Args:
+            index (int): The row index
+
+        Returns:
+            dict: The values of the row by field name
+        """
+        return {name: column[index].item() for name, column in self.columns.items()}
+
+
+class Row(MutableMapping):
+    """
+    A data entry that reads the values of one row of a ColumnTable when they are
+    accessed. It behaves like the dict of the row, and only stores the table and
+    the row index.
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: ColumnTable, index: int):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, name: str):
+        return self.table.columns[name][self.index].item()
+
+    def __setitem__(self, name: str, value):
+        if name not in self.table.columns:
+            raise KeyError(f"Columnar rows cannot add the field {name}")
+        self.table.columns[name][self.index] = value
+
+    def __delitem__(self, name: str):
+        raise TypeError("Columnar rows cannot delete fields")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.table.columns)
+
+    def __len__(self) -> int:
+        return len(self.table.columns)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Row) and other.table is self.table:
+            return other.index == self.index
+        return isinstance(other, Mapping) and self.to_dict() == dict(other.items())
+
+    def __repr__(self) -> str:
+        return f"Row({self.to_dict()})"
+
+    def to_dict(self) -> dict:
+        """
+        Materialize the row.
+
+        Returns:
+            dict: The values of the row by field name
+        """
+        return self.table.row(self.index)
+
+
+def as_rows(
+    data: Union[list[dict], dict[str, np.ndarray], np.ndarray, None],
+    xs: Union[list[float], np.ndarray],
+    ys: Union[list[float], np.ndarray],
+) -> Union[list[dict], None]:
+    """
+    Get the data entries of points. Columnar data, a dict of columns or a
+    structured array, becomes a list of lazy rows.
+
+    Args:
+        data (Union[list[dict], dict[str, np.ndarray], np.ndarray, None]): The
+            data entries or columns
+        xs (Union[list[float], np.ndarray]): The x coordinates of the points
+        ys (Union[list[float], np.ndarray]): The y coordinates of the points
+
+    Returns:
+        Union[list[dict], None]: The data entries
+    """
+    if isinstance(data, dict) or (
+        isinstance(data, np.ndarray) and data.dtype.names is not None
+    ):
+        return ColumnTable(data, xs, ys).rows()
+    return data
+
+
+def to_json_value(value):
+    """
+    Materialize lazy rows for json.dumps(default=...).
+    """
+    if isinstance(value, Row):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def gather_field(data: list, field: str) -> Union[np.ndarray, None]:
+    """
+    Read a field of data entries that are rows of one ColumnTable directly from
+    its column.
+
+    Args:
+        data (list): The data entries
+        field (str): The name of the field
+
+    Returns:
+        Union[np.ndarray, None]: The values of the field as float64, or None if
+            the entries are not all rows of one table
+    """
+    if len(data) == 0 or not isinstance(data[0], Row):
+        return None
+
+    table = data[0].table
+    if not all(isinstance(d, Row) and d.table is table for d in data):
+        return None
+
+    index = np.fromiter((d.index for d in data), dtype=np.int64, count=len(data))
+    return table.columns[field][index].astype(np.float64)
@@ -0,0 +1,420 @@
+"""Barnes-Hut many-body forces on top of the array-backed quadtree."""
+
+from typing import Union
+
+import numpy as np
+
+from quadtreed3.arraytree import ArrayQuadtree, _expand_ranges
+
+
+class ManyBodyForce:
+    """
+    The many-body force of d3-force (forceManyBody) approximated with the
+    Barnes-Hut algorithm. Every node of the tree carries the total charge of
+    its points and their center of mass weighted by the absolute charges. A
+    node far enough from a point, i.e., its width divided by the distance is
+    below theta, acts on the point as one charge at its center of mass.
+
+    The points are grouped into small subtrees, and every group walks the tree
+    once: a node that is far from the bounding box of a group is far from all
+    its points. Batches of groups walk the tree together as a frontier of
+    (group, node) pairs, one vectorized step per level. If the group is also
+    small from the node, the force of the node and its first derivatives are
+    computed once at the group center and evaluated at every point.
+
+    Unlike d3, coincident points do not push each other in random directions,
+    so the forces are deterministic.
+    """
+
+    def __init__(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        strength: Union[float, np.ndarray] = -30.0,
+        theta: float = 0.9,
+        distance_min: float = 1.0,
+        distance_max: float = np.inf,
+        group_size: int = 32,
+        batch_size: int = 65536,
+    ):
+        """
+        Args:
+            xs (np.ndarray): The x coordinates of the points
+            ys (np.ndarray): The y coordinates of the points
+            strength (Union[float, np.ndarray], optional): The charge of every
+                point, negative values repel. Defaults to -30.0.
+            theta (float, optional): The Barnes-Hut approximation criterion.
+                Defaults to 0.9.
+            distance_min (float, optional): Distances below this value are
+                limited to avoid very strong forces. Defaults to 1.0.
+            distance_max (float, optional): Points and nodes further away than
+                this distance are ignored. Defaults to infinity.
+            group_size (int, optional): The maximum number of points of the
+                subtrees that walk the tree together. Defaults to 32.
+            batch_size (int, optional): The approximate number of points whose
+                forces are computed together. Defaults to 65536.
+        """
+        self.strength = np.array(
+            np.broadcast_to(np.asarray(strength, dtype=np.float64), (len(xs),))
+        )
+        self.theta = theta
+        self.distance_min = distance_min
+        self.distance_max = distance_max
+        self.group_size = group_size
+        self.batch_size = batch_size
+
+        self.tree = None
+        self.update(xs, ys)
+
+    def update(self, xs: np.ndarray, ys: np.ndarray):
+        """
+        Move the points to new coordinates. The tree is kept if every point
+        stays in the cell of its leaf and coincident points stay coincident,
+        then only the charges and centers of mass are computed again.
+        Otherwise the tree is rebuilt in bulk.
+
+        Args:
+            xs (np.ndarray): The new x coordinates of the points
+            ys (np.ndarray): The new y coordinates of the points
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+
+        if self.tree is not None and self._keeps_tree(xs, ys):
+            self.tree.xs[:] = xs
+            self.tree.ys[:] = ys
+        else:
+            self.tree = ArrayQuadtree().add_all(xs, ys)
+            table = self._table = self.tree.node_table()
+            self._width2 = (table.x1 - table.x0) ** 2
+            self._is_leaf = table.ref < 0
+
+            # The leaf of every point
+            leaves = np.flatnonzero(self._is_leaf)
+            self._point_leaf = np.empty(len(xs), dtype=np.int64)
+            self._point_leaf[table.order] = np.repeat(leaves, table.size[leaves])
+
+            # The largest subtrees with at most group_size points, and leaves
+            # of more coincident points, tile the points in pre-order
+            parent_size = table.size[np.maximum(table.parent, 0)]
+            self._groups = np.flatnonzero(
+                ((table.size <= self.group_size) | self._is_leaf)
+                & ((table.parent < 0) | (parent_size > self.group_size))
+            )
+            self._sorted_strength = self.strength[table.order]
+
+        self._accumulate()
+        return self
+
+    def forces(self, alpha: float = 1.0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Compute the velocity change of every point, as d3's forceManyBody adds
+        to node.vx and node.vy in one tick.
+
+        Args:
+            alpha (float, optional): The simulation alpha. Defaults to 1.0.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The x and y velocity changes, ordered
+                as the points
+        """
+        table = self._table
+        groups = self._groups
+        n = self.tree.n_points
+
+        # Forces are accumulated by position in the pre-order of the points
+        vx = np.zeros(n)
+        vy = np.zeros(n)
+
+        # Batches of consecutive groups cover consecutive point positions
+        group_end = table.start[groups] + table.size[groups]
+        cuts = np.searchsorted(
+            group_end, np.arange(self.batch_size, n, self.batch_size), side="right"
+        )
+        for batch in np.split(np.arange(len(groups)), np.unique(cuts)):
+            if len(batch) > 0:
+                self._apply(batch, alpha, vx, vy)
+
+        forces_x = np.empty(n)
+        forces_y = np.empty(n)
+        forces_x[table.order] = vx
+        forces_y[table.order] = vy
+        return forces_x, forces_y
+
+    def _keeps_tree(self, xs: np.ndarray, ys: np.ndarray) -> bool:
+        """
+        Check if the current tree is still valid for the new coordinates.
+        """
+        if len(xs) != self.tree.n_points:
+            return False
+
+        table = self._table
+        leaf = self._point_leaf
+        head = table.order[table.start[leaf]]
+
+        return bool(
+            np.all(
+                (table.x0[leaf] <= xs)
+                & (xs < table.x1[leaf])
+                & (table.y0[leaf] <= ys)
+                & (ys < table.y1[leaf])
+                & (xs == xs[head])
+                & (ys == ys[head])
+            )
+        )
+
+    def _accumulate(self):
+        """
+        Compute the charge and center of mass of every node bottom-up.
+        """
+        weight = np.abs(self.strength)
+        sums = self.tree.subtree_sums(
+            np.stack(
+                [self.strength, weight, weight * self.tree.xs, weight * self.tree.ys],
+                axis=1,
+            )
+        )
+        self._charge = sums[:, 0]
+
+        table = self._table
+        self._sorted_xs = self.tree.xs[table.order]
+        self._sorted_ys = self.tree.ys[table.order]
+
+        # The tight bounding box of the points of every group, its center and
+        # squared diameter
+        starts = table.start[self._groups]
+        self._group_box = np.stack(
+            [
+                np.minimum.reduceat(self._sorted_xs, starts),
+                np.minimum.reduceat(self._sorted_ys, starts),
+                np.maximum.reduceat(self._sorted_xs, starts),
+                np.maximum.reduceat(self._sorted_ys, starts),
+            ]
+        )
+        x0, y0, x1, y1 = self._group_box
+        self._group_center = np.stack([(x0 + x1) / 2, (y0 + y1) / 2])
+        self._group_diameter2 = (x1 - x0) ** 2 + (y1 - y0) ** 2
+
+        # Nodes without charge have no effect, place them at their cell center
+        charged = sums[:, 1] > 0
+        self._cx = np.where(
+            charged,
+            sums[:, 2] / np.where(charged, sums[:, 1], 1),
+            (table.x0 + table.x1) / 2,
+        )
+        self._cy = np.where(
+            charged,
+            sums[:, 3] / np.where(charged, sums[:, 1], 1),
+            (table.y0 + table.y1) / 2,
+        )
+
+    def _apply(self, batch: np.ndarray, alpha: float, vx: np.ndarray, vy: np.ndarray):
+        """
+        Add the forces on the points of a batch of consecutive groups.
+        """
+        table = self._table
+        groups = self._groups[batch]
+        theta2 = self.theta**2
+        distance_min2 = self.distance_min**2
+        distance_max2 = self.distance_max**2
+        lo = table.start[groups[0]]
+        hi = table.start[groups[-1]] + table.size[groups[-1]]
+        batch_vx = np.zeros(hi - lo)
+        batch_vy = np.zeros(hi - lo)
+
+        # The force and its Jacobian at the center of every group, from the
+        # nodes that are far from both the points and the extent of the group
+        expansion = np.zeros((5, len(groups)))
+
+        # The frontier of (group, node) pairs to visit, starting from the root
+        pair_groups = np.arange(len(groups))
+        pair_nodes = np.zeros(len(groups), dtype=np.int64)
+        box = self._group_box[:, batch]
+        center = self._group_center[:, batch]
+        diameter2 = self._group_diameter2[batch]
+
+        while len(pair_groups) > 0:
+            cx, cy = self._cx[pair_nodes], self._cy[pair_nodes]
+            gx0, gy0, gx1, gy1 = box[:, pair_groups]
+            dx = np.maximum(np.maximum(gx0 - cx, cx - gx1), 0)
+            dy = np.maximum(np.maximum(gy0 - cy, cy - gy1), 0)
+            near2 = dx * dx + dy * dy
+
+            # Far nodes act as one charge at their center of mass, near leaves
+            # act point by point, and near internal nodes are opened
+            far = self._width2[pair_nodes] < theta2 * near2
+            leaf = ~far & self._is_leaf[pair_nodes]
+            inner = ~far & ~leaf
+
+            # Far nodes are expanded at the group center if the group is also
+            # small from the node, i.e., its diameter divided by the distance
+            # is below theta, and no distance limit applies inside the group
+            rx = cx - center[0, pair_groups]
+            ry = cy - center[1, pair_groups]
+            center2 = rx * rx + ry * ry
+            separated = (
+                far
+                & (diameter2[pair_groups] < theta2 * center2)
+                & (near2 >= distance_min2)
+            )
+            if np.isfinite(self.distance_max):
+                dx = np.maximum(np.abs(cx - gx0), np.abs(cx - gx1))
+                dy = np.maximum(np.abs(cy - gy0), np.abs(cy - gy1))
+                separated &= dx * dx + dy * dy < distance_max2
+            far &= ~separated
+
+            if separated.any():
+                _expand_at_center(
+                    expansion,
+                    pair_groups[separated],
+                    rx[separated],
+                    ry[separated],
+                    center2[separated],
+                    self._charge[pair_nodes[separated]] * alpha,
+                )
+
+            if far.any():
+                self._interact(
+                    groups[pair_groups[far]],
+                    pair_nodes[far],
+                    False,
+                    lo,
+                    alpha,
+                    batch_vx,
+                    batch_vy,
+                )
+
+            if leaf.any():
+                self._interact(
+                    groups[pair_groups[leaf]],
+                    pair_nodes[leaf],
+                    True,
+                    lo,
+                    alpha,
+                    batch_vx,
+                    batch_vy,
+                )
+
+            children = table.children[pair_nodes[inner]]
+            filled = children >= 0
+            pair_groups = np.repeat(pair_groups[inner], filled.sum(axis=1))
+            pair_nodes = children[filled]
+
+        # Evaluate the expansions at the points of every group
+        sizes = table.size[groups]
+        point_groups = np.repeat(np.arange(len(groups)), sizes)
+        fx, fy, jxx, jxy, jyy = expansion[:, point_groups]
+        ox = self._sorted_xs[lo:hi] - center[0, point_groups]
+        oy = self._sorted_ys[lo:hi] - center[1, point_groups]
+
+        vx[lo:hi] += batch_vx + fx + jxx * ox + jxy * oy
+        vy[lo:hi] += batch_vy + fy + jxy * ox + jyy * oy
+
+    def _interact(
+        self,
+        groups: np.ndarray,
+        nodes: np.ndarray,
+        point_by_point: bool,
+        lo: int,
+        alpha: float,
+        vx: np.ndarray,
+        vy: np.ndarray,
+    ):
+        """
+        Add the forces of nodes on all points of their paired groups, either
+        as one charge at the center of mass, or point by point for leaves.
+        """
+        table = self._table
+        sizes = table.size[groups]
+        xs = self._sorted_xs[lo : lo + len(vx)]
+        ys = self._sorted_ys[lo : lo + len(vy)]
+
+        # Expand every pair into the points of the group, by position in the
+        # batch
+        positions = _expand_ranges(table.start[groups] - lo, sizes)
+        dx = np.repeat(self._cx[nodes], sizes)
+        dy = np.repeat(self._cy[nodes], sizes)
+        dx -= xs[positions]
+        dy -= ys[positions]
+        length2 = dx * dx + dy * dy
+
+        if not point_by_point:
+            charge = np.repeat(self._charge[nodes] * alpha, sizes)
+            if np.isfinite(self.distance_max):
+                keep = length2 < self.distance_max**2
+                positions, dx, dy = positions[keep], dx[keep], dy[keep]
+                length2, charge = length2[keep], charge[keep]
+            self._add(vx, vy, positions, dx, dy, length2, charge)
+            return
+
+        # Expand every point into the points of the leaf, except itself
+        nodes = np.repeat(nodes, sizes)
+        if np.isfinite(self.distance_max):
+            keep = length2 < self.distance_max**2
+            positions, nodes = positions[keep], nodes[keep]
+
+        sizes = table.size[nodes]
+        others = _expand_ranges(table.start[nodes], sizes)
+        positions = np.repeat(positions, sizes)
+
+        dx = self._sorted_xs[others] - xs[positions]
+        dy = self._sorted_ys[others] - ys[positions]
+        length2 = dx * dx + dy * dy
+
+        apply = length2 > 0
+        self._add(
+            vx,
+            vy,
+            positions[apply],
+            dx[apply],
+            dy[apply],
+            length2[apply],
+            self._sorted_strength[others[apply]] * alpha,
+        )
+
+    def _add(
+        self,
+        vx: np.ndarray,
+        vy: np.ndarray,
+        points: np.ndarray,
+        dx: np.ndarray,
+        dy: np.ndarray,
+        length2: np.ndarray,
+        charge: np.ndarray,
+    ):
+        """
+        Add the forces of charges at offsets (dx, dy) to the points. The
+        offsets are overwritten.
+        """
+        distance_min2 = self.distance_min**2
+        close = length2 < distance_min2
+        if close.any():
+            length2[close] = np.sqrt(distance_min2 * length2[close])
+
+        np.divide(charge, length2, out=length2)
+        dx *= length2
+        dy *= length2
+        vx += np.bincount(points, weights=dx, minlength=len(vx))
+        vy += np.bincount(points, weights=dy, minlength=len(vy))
+
+
+def _expand_at_center(
+    expansion: np.ndarray,
+    groups: np.ndarray,
+    rx: np.ndarray,
+    ry: np.ndarray,
+    length2: np.ndarray,
+    charge: np.ndarray,
+):
+    """
+    Add the forces of charges at offsets (rx, ry) from the group centers, and
+    their Jacobians with respect to the position, to the group expansions.
+    """
+    n = expansion.shape[1]
+    w = charge / length2
+    w2 = 2 * w / length2
+    expansion[0] += np.bincount(groups, weights=rx * w, minlength=n)
+    expansion[1] += np.bincount(groups, weights=ry * w, minlength=n)
+    expansion[2] += np.bincount(groups, weights=w2 * rx * rx - w, minlength=n)
+    expansion[3] += np.bincount(groups, weights=w2 * rx * ry, minlength=n)
+    expansion[4] += np.bincount(groups, weights=w2 * ry * ry - w, minlength=n)
@@ -0,0 +1,269 @@
+"""Quadrant and extent geometry shared by Quadtree and ArrayQuadtree."""
+
+import math
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class ExtentMixin(ABC):
+    """
+    The square extent [x0, y0, x1, y1] of a quadtree and its growth. A tree
+    stores the extent in x0, y0, x1, y1 and its Instrumentation in instrument,
+    and implements _grow_root() and _extent_changed().
+    """
+
+    def extent(
+        self, point0: list[float, float] = None, point1: list[float, float] = None
+    ) -> list[list[float, float], list[float, float]]:
+        """Set the extent for this quadtree or get the current extent.
+
+        Args:
+            point0 (list[float, float], optional): Origin coordinate. Defaults
+                to None.
+            point1 (list[float, float], optional): Extent point coordinate.
+                Defaults to None.
+
+        Returns:
+            list[list[float, float], list[float, float]]: Current extent
+                [origin, extent]
+        """
+        if point0 is None:
+            return [
+                [self.x0, self.y0],
+                [self.x1, self.y1],
+            ]
+        else:
+            self.cover(point0[0], point0[1])
+            self.cover(point1[0], point1[1])
+            return self
+
+    def cover(self, x: float, y: float):
+        """
+        Extend the current boundaries to cover the data point (x, y). The number
+        of doublings is computed in closed form, see grow_extent().
+
+        Args:
+            x(float): The x coordinate of the data point
+            y(float): The y coordinate of the data point
+        """
+
+        x0, y0, x1, y1 = self.x0, self.y0, self.x1, self.y1
+
+        # Initialize the extent if there is none, make sure the extent is always
+        # integer values
+        if x0 is None:
+            x0 = int(math.floor(x))
+            y0 = int(math.floor(y))
+            x1 = x0 + 1
+            y1 = y0 + 1
+
+        # Points in range do not change anything
+        elif x0 <= x < x1 and y0 <= y < y1:
+            return self
+
+        else:
+            # Cover the new point by extending the boundaries symmetrically
+            x0, y0, x1, y1, quads = grow_extent(x0, y0, x1, y1, x, y)
+            deeper = self._grow_root(quads)
+
+            # Every leaf below an internal root moves down the new levels
+            if self.instrument is not None:
+                self.instrument.record_cover(
+                    len(quads), depth_shift=len(quads) if deeper else 0
+                )
+
+        # Record the extent
+        self._extent_changed()
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+
+        return self
+
+    def cover_all(self, xs: list[float], ys: list[float]):
+        """
+        Extend the current boundaries once to cover all data points, with the
+        vectorized minimum and maximum of the coordinates. The extent is the
+        same as the one add_all() creates for these points.
+
+        Args:
+            xs(list[float]): A list of x coordinates
+            ys(list[float]): A list of y coordinates
+        """
+        if len(xs) == 0:
+            return self
+
+        x0, y0, x1, y1 = np.min(xs), np.min(ys), np.max(xs), np.max(ys)
+        self.cover(x0, y0)
+        self.cover(x1, y1)
+        return self
+
+    @abstractmethod
+    def _grow_root(self, quads: list[int]) -> bool:
+        """
+        Put the root below new levels before the extent grows, the old extent
+        is still recorded.
+
+        Args:
+            quads (list[int]): The quadrant of the old extent in each new level
+                from the bottom, see grow_extent()
+
+        Returns:
+            bool: Whether an internal root moved down, a leaf root stays the root
+        """
+
+    @abstractmethod
+    def _extent_changed(self):
+        """Drop the structures derived from the extent and the tree."""
+
+
+def grow_extent(
+    x0: float, y0: float, x1: float, y1: float, x: float, y: float
+) -> tuple[float, float, float, float, list[int]]:
+    """
+    Double a square extent until it covers (x, y). The number of doublings is
+    computed in closed form, and the extent is the same as doubling it one step
+    at a time towards the point: each axis grows towards the point until the
+    point is covered on that axis, then away from the origin.
+
+    Args:
+        x0 (float): The x coordinate of the extent origin
+        y0 (float): The y coordinate of the extent origin
+        x1 (float): The x coordinate of the extent end
+        y1 (float): The y coordinate of the extent end
+        x (float): The x coordinate of the point
+        y (float): The y coordinate of the point
+
+    Returns:
+        tuple[float, float, float, float, list[int]]: The new extent, and the
+            quadrant of the old extent in each new level from the bottom
+    """
+    length = x1 - x0
+    kx, left = _axis_doublings(x0, x1, x, length)
+    ky, down = _axis_doublings(y0, y1, y, length)
+    k = max(kx, ky)
+
+    if k == 0:
+        return x0, y0, x1, y1, []
+
+    # Quadrant index
+    # |2|3|
+    # |0|1|
+    quads = [int(left and i < kx) + 2 * int(down and i < ky) for i in range(k)]
+
+    if left:
+        x0 = x1 - length * 2**kx
+    if not left or kx < k:
+        x1 = x0 + length * 2**k
+    if down:
+        y0 = y1 - length * 2**ky
+    if not down or ky < k:
+        y1 = y0 + length * 2**k
+
+    return x0, y0, x1, y1, quads
+
+
+def _axis_doublings(v0: float, v1: float, v: float, length: float) -> tuple[int, bool]:
+    """
+    Count the doublings that cover v on one axis of an extent, and whether the
+    axis grows towards lower values.
+    """
+    if v0 <= v < v1:
+        return 0, False
+
+    # Estimate with log2, then correct the rounding of the estimate
+    if v < v0:
+        k = max(math.ceil(math.log2((v1 - v) / length)), 1)
+        while v < v1 - length * 2**k:
+            k += 1
+        while k > 1 and v >= v1 - length * 2 ** (k - 1):
+            k -= 1
+        return k, True
+
+    k = max(math.floor(math.log2((v - v0) / length)) + 1, 1)
+    while v >= v0 + length * 2**k:
+        k += 1
+    while k > 1 and v < v0 + length * 2 ** (k - 1):
+        k -= 1
+    return k, False
+
+
+def get_quadrant(x: float, y: float, xm: float, ym: float) -> int:
+    """
+    Get the quadrant index for (x, y). The quadrant order is defined by lower x
+    to larger x, and lower y to larger y.
+
+    |2|3|\n
+    |0|1|
+
+    Args:
+        x (float): The x coordinate of point (x, y)
+        y (float): The y coordinate of point (x, y)
+        xm (float): The x coordinate of the midpoint of a square
+        ym (float): The y coordinate of the midpoint of a square
+
+    Returns:
+        int: Quadrant index
+    """
+    if x >= xm and y >= ym:
+        return 3
+
+    elif x < xm and y >= ym:
+        return 2
+
+    elif x >= xm and y < ym:
+        return 1
+
+    else:
+        return 0
+
+
+def get_quadrant_extents(
+    x0: float, y0: float, x1: float, y1: float
+) -> tuple[tuple[float, float, float, float], ...]:
+    """
+    Get the extents of the four quadrants of the cell [x0, y0, x1, y1], in the
+    same order as get_quadrant().
+
+    |2|3|\n
+    |0|1|
+
+    Args:
+        x0 (float): The x coordinate of the cell origin
+        y0 (float): The y coordinate of the cell origin
+        x1 (float): The x coordinate of the cell end
+        y1 (float): The y coordinate of the cell end
+
+    Returns:
+        tuple[tuple[float, float, float, float], ...]: The extent
+            [x0, y0, x1, y1] of each quadrant
+    """
+    xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+    return (
+        (x0, y0, xm, ym),
+        (xm, y0, x1, ym),
+        (x0, ym, xm, y1),
+        (xm, ym, x1, y1),
+    )
+
+
+def get_distance2(
+    x: float, y: float, x0: float, y0: float, x1: float, y1: float
+) -> float:
+    """
+    Get the squared distance from (x, y) to the closest point of the cell
+    [x0, y0, x1, y1].
+
+    Args:
+        x (float): The x coordinate of point (x, y)
+        y (float): The y coordinate of point (x, y)
+        x0 (float): The x coordinate of the cell origin
+        y0 (float): The y coordinate of the cell origin
+        x1 (float): The x coordinate of the cell end
+        y1 (float): The y coordinate of the cell end
+
+    Returns:
+        float: Squared distance, 0 if (x, y) is inside the cell
+    """
+    dx = max(x0 - x, 0, x - x1)
+    dy = max(y0 - y, 0, y - y1)
+    return dx * dx + dy * dy
@@ -0,0 +1,141 @@
+"""Low-overhead instrumentation of quadtree construction."""
+
+import math
+from contextlib import contextmanager
+
+from typing import Callable, Union
+
+
+class Instrumentation:
+    """
+    Counters of the work done while building a quadtree. Attach an instance to
+    Quadtree.instrument or ArrayQuadtree.instrument to enable it, the trees only
+    check that attribute against None when it is not attached.
+
+    Listeners are called as listener(event, count) after the counters are
+    updated, with the events "insert" (points inserted), "split" (new internal
+    nodes while separating two points), "double" (extent doublings in cover())
+    and "depth" (a new maximum depth).
+    """
+
+    def __init__(self, listeners: Union[list[Callable[[str, int], None]], None] = None):
+        self.points_inserted = 0
+        self.node_splits = 0
+        self.extent_doublings = 0
+        self.max_depth = 0
+        self.listeners = listeners if listeners is not None else []
+
+    def record_insert(self, count: int = 1, depth: int = 0, splits: int = 0):
+        """
+        Record inserted points.
+
+        Args:
+            count (int, optional): The number of inserted points. Defaults to 1.
+            depth (int, optional): The deepest level of the inserted points.
+                Defaults to 0.
+            splits (int, optional): The number of internal nodes created to
+                separate the points. Defaults to 0.
+        """
+        self.points_inserted += count
+        self._notify("insert", count)
+
+        if splits > 0:
+            self.node_splits += splits
+            self._notify("split", splits)
+
+        if depth > self.max_depth:
+            self.max_depth = depth
+            self._notify("depth", depth)
+
+    def record_cover(self, doublings: int, depth_shift: int = 0):
+        """
+        Record extent doublings.
+
+        Args:
+            doublings (int): The number of times the extent was doubled
+            depth_shift (int, optional): The number of levels every leaf moved
+                down, the doublings when the root was internal. Defaults to 0.
+        """
+        if doublings > 0:
+            self.extent_doublings += doublings
+            self._notify("double", doublings)
+
+        if depth_shift > 0:
+            self.max_depth += depth_shift
+            self._notify("depth", self.max_depth)
+
+    def as_dict(self) -> dict:
+        """
+        Get all counters.
+
+        Returns:
+            dict: Counter values by name
+        """
+        return {
+            "points_inserted": self.points_inserted,
+            "node_splits": self.node_splits,
+            "extent_doublings": self.extent_doublings,
+            "max_depth": self.max_depth,
+        }
+
+    def _notify(self, event: str, count: int):
+        for listener in self.listeners:
+            listener(event, count)
+
+
+class TqdmProgress:
+    """
+    An instrumentation listener that shows inserted points on a tqdm progress
+    bar. tqdm is only imported when the listener is created.
+    """
+
+    def __init__(self, total: Union[int, None] = None):
+        from tqdm import tqdm
+
+        self.bar = tqdm(total=total)
+
+    def __call__(self, event: str, count: int):
+        if event == "insert":
+            self.bar.update(count)
+
+    def close(self):
+        self.bar.close()
+
+
+def get_depth(root_length: float, cell_length: float) -> int:
+    """
+    Get the level of a cell from the side lengths of the root and the cell.
+
+    Args:
+        root_length (float): The side length of the root cell
+        cell_length (float): The side length of the cell
+
+    Returns:
+        int: Level of the cell
+    """
+    return int(round(math.log2(root_length / cell_length)))
+
+
+@contextmanager
+def progress_bar(tree, total: Union[int, None] = None):
+    """
+    Show the points inserted into a tree on a tqdm progress bar while the
+    context is open. The tree gets a temporary Instrumentation if it has none.
+
+    Args:
+        tree (Union[Quadtree, ArrayQuadtree]): The tree to report on
+        total (int, optional): The expected number of points. Defaults to None.
+    """
+    owned = tree.instrument is None
+    if owned:
+        tree.instrument = Instrumentation()
+
+    listener = TqdmProgress(total)
+    tree.instrument.listeners.append(listener)
+    try:
+        yield listener
+    finally:
+        listener.close()
+        tree.instrument.listeners.remove(listener)
+        if owned:
+            tree.instrument = None
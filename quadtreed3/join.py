@@ -0,0 +1,243 @@
+"""Spatial joins of quadtrees: all pairs of points within a distance."""
+
+from typing import Iterator, Union
+
+import numpy as np
+
+from quadtreed3.arraytree import ArrayQuadtree, NodeTable, _expand_ranges
+from quadtreed3.quadtreed3 import Quadtree
+
+
+def quadtree_join(
+    qa: Union[Quadtree, ArrayQuadtree],
+    qb: Union[Quadtree, ArrayQuadtree],
+    r: float,
+    batch_size: int = 65536,
+    brute_size: int = 64,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    Find all pairs of a point of qa and a point of qb within distance r, by
+    traversing both trees at once. Node pairs whose tight bounding boxes are
+    farther apart than r are pruned, node pairs whose boxes are entirely within
+    r are emitted without any distance test, and the remaining pairs are split
+    down to small node pairs that are tested point by point.
+
+    Points are identified by their index in the array-backed storage. For a
+    Quadtree, that is the pre-order of Quadtree.to_array(), whose data list
+    maps the indices to the data entries.
+
+    Args:
+        qa (Union[Quadtree, ArrayQuadtree]): The first tree
+        qb (Union[Quadtree, ArrayQuadtree]): The second tree
+        r (float): The maximum distance, pairs at distance r are included
+        batch_size (int, optional): The approximate number of node pairs
+            processed together. Defaults to 65536.
+        brute_size (int, optional): Node pairs with at most this many point
+            pairs are tested point by point. Defaults to 64.
+
+    Yields:
+        tuple[np.ndarray, np.ndarray]: Batches of indices (ia, ib) of the points
+            of qa and qb, pairs are in no particular order
+    """
+    yield from _DualTree(qa, qb, r, batch_size, brute_size, False).join()
+
+
+def quadtree_self_join(
+    q: Union[Quadtree, ArrayQuadtree],
+    r: float,
+    batch_size: int = 65536,
+    brute_size: int = 64,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    Find all pairs of distinct points of q within distance r, e.g., the edges
+    of a neighbor graph. Every unordered pair is reported once as (i, j) with
+    i < j. Coincident points are pairs at distance 0.
+
+    Args:
+        q (Union[Quadtree, ArrayQuadtree]): The tree
+        r (float): The maximum distance, pairs at distance r are included
+        batch_size (int, optional): The approximate number of node pairs
+            processed together. Defaults to 65536.
+        brute_size (int, optional): Node pairs with at most this many point
+            pairs are tested point by point. Defaults to 64.
+
+    Yields:
+        tuple[np.ndarray, np.ndarray]: Batches of point indices (i, j), see
+            quadtree_join()
+    """
+    yield from _DualTree(q, q, r, batch_size, brute_size, True).join()
+
+
+class _DualTree:
+    """
+    The state of a dual-tree traversal. The frontier of (node of a, node of b)
+    pairs is processed in batches, one vectorized step per batch, and the split
+    pairs are pushed back on a stack so the memory stays bounded.
+    """
+
+    def __init__(
+        self,
+        qa: Union[Quadtree, ArrayQuadtree],
+        qb: Union[Quadtree, ArrayQuadtree],
+        r: float,
+        batch_size: int,
+        brute_size: int,
+        same: bool,
+    ):
+        self.a = _Side(qa)
+        self.b = self.a if same else _Side(qb)
+        self.r2 = r * r
+        self.batch_size = batch_size
+        self.brute_size = brute_size
+        self.same = same
+
+    def join(self) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        if self.a.n_points == 0 or self.b.n_points == 0:
+            return
+
+        stack = [(np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64))]
+        while len(stack) > 0:
+            nodes_a, nodes_b = stack.pop()
+            pairs, split = self._step(nodes_a, nodes_b)
+            if len(pairs[0]) > 0:
+                yield pairs
+
+            split_a, split_b = split
+            for i in range(0, len(split_a), self.batch_size):
+                stack.append(
+                    (
+                        split_a[i : i + self.batch_size],
+                        split_b[i : i + self.batch_size],
+                    )
+                )
+
+    def _step(self, nodes_a: np.ndarray, nodes_b: np.ndarray):
+        """
+        Classify a batch of node pairs, emit the pairs of points of the pairs
+        that are resolved, and split the others.
+        """
+        a, b = self.a, self.b
+        near2, far2 = _box_distances(a.box[:, nodes_a], b.box[:, nodes_b])
+
+        # Pairs farther apart than r are pruned
+        keep = near2 <= self.r2
+        nodes_a, nodes_b, far2 = nodes_a[keep], nodes_b[keep], far2[keep]
+
+        # A self pair is a node paired with itself
+        self_pair = nodes_a == nodes_b if self.same else np.zeros(len(nodes_a), bool)
+        size_a = a.table.size[nodes_a]
+        size_b = b.table.size[nodes_b]
+        inside = far2 <= self.r2
+        leaves = (a.table.ref[nodes_a] < 0) & (b.table.ref[nodes_b] < 0)
+        brute = ~inside & (leaves | (size_a * size_b <= self.brute_size))
+        split = ~inside & ~brute
+
+        # Every pair of points of the pairs within r, or tested one by one
+        ia, ib = self._cross(nodes_a[inside], nodes_b[inside], self_pair[inside])
+        ja, jb = self._cross(nodes_a[brute], nodes_b[brute], self_pair[brute])
+        dx = a.xs[ja] - b.xs[jb]
+        dy = a.ys[ja] - b.ys[jb]
+        close = dx * dx + dy * dy <= self.r2
+        pairs = (
+            np.concatenate([ia, ja[close]]),
+            np.concatenate([ib, jb[close]]),
+        )
+
+        return pairs, self._split(nodes_a[split], nodes_b[split], self_pair[split])
+
+    def _cross(self, nodes_a: np.ndarray, nodes_b: np.ndarray, self_pair: np.ndarray):
+        """
+        Expand node pairs into the point index pairs of their subtrees. Self
+        pairs keep each unordered pair of distinct points once, and the pairs of
+        a self join are ordered as i < j.
+        """
+        a, b = self.a, self.b
+        size_a = a.table.size[nodes_a]
+        size_b = b.table.size[nodes_b]
+        counts = size_a * size_b
+
+        pair = np.repeat(np.arange(len(nodes_a)), counts)
+        offset = _expand_ranges(np.zeros(len(counts), dtype=np.int64), counts)
+        pa = a.table.start[nodes_a][pair] + offset // size_b[pair]
+        pb = b.table.start[nodes_b][pair] + offset % size_b[pair]
+
+        if self.same:
+            keep = ~self_pair[pair] | (pa < pb)
+            pa, pb = pa[keep], pb[keep]
+
+        ia = a.table.order[pa]
+        ib = b.table.order[pb]
+        if self.same:
+            ia, ib = np.minimum(ia, ib), np.maximum(ia, ib)
+        return ia, ib
+
+    def _split(self, nodes_a: np.ndarray, nodes_b: np.ndarray, self_pair: np.ndarray):
+        """
+        Replace node pairs by the pairs of their children. The larger internal
+        node of a pair is opened, and self pairs are opened on both sides, with
+        each unordered pair of children once.
+        """
+        a, b = self.a, self.b
+        width_a = a.table.x1[nodes_a] - a.table.x0[nodes_a]
+        width_b = b.table.x1[nodes_b] - b.table.x0[nodes_b]
+        open_a = (a.table.ref[nodes_a] >= 0) & (
+            (b.table.ref[nodes_b] < 0) | (width_a >= width_b)
+        )
+        open_a &= ~self_pair
+        open_b = ~open_a & ~self_pair
+
+        split_a, split_b = [], []
+
+        children = a.table.children[nodes_a[open_a]]
+        filled = children >= 0
+        split_a.append(children[filled])
+        split_b.append(np.repeat(nodes_b[open_a], filled.sum(axis=1)))
+
+        children = b.table.children[nodes_b[open_b]]
+        filled = children >= 0
+        split_a.append(np.repeat(nodes_a[open_b], filled.sum(axis=1)))
+        split_b.append(children[filled])
+
+        # Children i <= j of the same node
+        children = a.table.children[nodes_a[self_pair]]
+        for i in range(4):
+            for j in range(i, 4):
+                filled = (children[:, i] >= 0) & (children[:, j] >= 0)
+                split_a.append(children[filled, i])
+                split_b.append(children[filled, j])
+
+        return np.concatenate(split_a), np.concatenate(split_b)
+
+
+class _Side:
+    """
+    The columns of one tree of a join.
+    """
+
+    def __init__(self, tree: Union[Quadtree, ArrayQuadtree]):
+        array = tree._array_snapshot() if isinstance(tree, Quadtree) else tree
+        self.n_points = array.n_points
+        if self.n_points == 0:
+            return
+
+        # Quadtrees cache their aggregates
+        aggregates = tree.aggregates()
+        self.xs = array.xs
+        self.ys = array.ys
+        self.table: NodeTable = array.node_table()
+        self.box = np.stack(
+            [aggregates.x0, aggregates.y0, aggregates.x1, aggregates.y1]
+        )
+
+
+def _box_distances(box_a: np.ndarray, box_b: np.ndarray):
+    """
+    The squared minimum and maximum distances between points of boxes.
+    """
+    ax0, ay0, ax1, ay1 = box_a
+    bx0, by0, bx1, by1 = box_b
+    dx = np.maximum(np.maximum(bx0 - ax1, ax0 - bx1), 0)
+    dy = np.maximum(np.maximum(by0 - ay1, ay0 - by1), 0)
+    fx = np.maximum(ax1 - bx0, bx1 - ax0)
+    fy = np.maximum(ay1 - by0, by1 - ay0)
+    return dx * dx + dy * dy, fx * fx + fy * fy
@@ -1,17 +1,72 @@
 """Main module."""
 
-from tqdm import tqdm
-from json import load, dump
+from json import dumps
 
-from typing import Union
+import gzip
+import heapq
+import io
+import itertools
+import random
+from array import array
+from collections.abc import Mapping
+
+from typing import Callable, NamedTuple, Union
 
 import numpy as np
 
 import math
 
+from quadtreed3.arraytree import REDUCTIONS, ArrayQuadtree, NodeAggregates
+from quadtreed3.bulk import (
+    bulk_partition,
+    nested_from_arrays,
+    parallel_build,
+    paused_gc,
+)
+from quadtreed3.columns import as_rows, to_json_value
+from quadtreed3.geometry import (
+    ExtentMixin,
+    get_distance2,
+    get_quadrant,
+    get_quadrant_extents,
+)
+from quadtreed3.instrument import get_depth, progress_bar
+
+
+class Quadtree(ExtentMixin):
+    def __init__(
+        self, leaf_capacity: int = 1, compress: bool = False, counted: bool = False
+    ):
+        """
+        Create an empty quadtree.
+
+        Args:
+            leaf_capacity(int): The maximum number of distinct positions in a
+                leaf before it is split. Points of a leaf are chained through
+                "next" like coincident points, newest first. Defaults to 1,
+                the layout of d3-quadtree; expanded() converts bucket leaves
+                back to it.
+            compress(bool): Store every run of single-child internal nodes as
+                one skip node {"skip": levels, "extent": [x0, y0, x1, y1],
+                "node": node}, where `node` is the first node below the run
+                and `extent` its cell. uncompressed_root() and the exports
+                restore the runs. Defaults to False.
+            counted(bool): Store coincident points as one leaf {"data": newest,
+                "count": n, "duplicates": [oldest, ...]} instead of a chain
+                linked through "next", so adding a coincident point is O(1).
+                The exports write the chains of d3-quadtree. Requires
+                leaf_capacity 1. Defaults to False.
+        """
+        if leaf_capacity < 1:
+            raise ValueError(f"leaf_capacity must be at least 1: {leaf_capacity}")
+
+        if counted and leaf_capacity > 1:
+            raise ValueError("Counted leaves require leaf_capacity 1")
+
+        self.leaf_capacity = leaf_capacity
+        self.compress = compress
+        self.counted = counted
 
-class Quadtree:
-    def __init__(self):
         # The tree is fully initialized after self.add_all() call
         self.x0 = None
         self.y0 = None
@@ -19,6 +74,16 @@ class Quadtree:
         self.y1 = None
         self.root = None
 
+        # Derived structures (e.g., the array snapshot) cached until the tree
+        # changes
+        self._cache = {}
+
+        # User reductions {name: (field, reduction)} computed by aggregates()
+        self._reductions = {}
+
+        # Optional Instrumentation that counts inserts, splits and doublings
+        self.instrument = None
+
     def add(self, x: float, y: float, d: Union[dict, None] = None):
         """
         Add a data point into the quadtree.
@@ -47,6 +112,9 @@ class Quadtree:
                 value is {'x': x, 'y': y}.
         """
 
+        if self._cache:
+            self._cache.clear()
+
         # Create a leaf node
         if d:
             leaf = {"data": d}
@@ -64,6 +132,8 @@ class Quadtree:
         # Case (1)
         if self.root is None:
             self.root = leaf
+            if self.instrument is not None:
+                self.instrument.record_insert()
             return self
 
         # Case (2) & (3)
@@ -74,6 +144,15 @@ class Quadtree:
         quad = None
 
         while "data" not in node:
+            # Jump over a compressed run if the point is inside the cell below
+            # it, otherwise split the run where the point leaves it
+            if "skip" in node:
+                ex0, ey0, ex1, ey1 = node["extent"]
+                if not (ex0 <= x < ex1 and ey0 <= y < ey1):
+                    return self._split_skip(leaf, node, parent, quad, x0, y0, x1, y1)
+                x0, y0, x1, y1 = ex0, ey0, ex1, ey1
+                node = node["node"]
+
             xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
             quad = get_quadrant(x, y, xm, ym)
             # Quadrant index
@@ -98,26 +177,51 @@ class Quadtree:
             # Case (2): Empty slot to plug in this data point
             if node is None:
                 parent[quad] = leaf
+                if self.instrument is not None:
+                    self.instrument.record_insert(
+                        depth=get_depth(self.x1 - self.x0, x1 - x0)
+                    )
                 return self
 
         # Case (3): The current `node` is a leaf node where the data point
-        # should go to. First check if the current `node` shares the exact x
-        # and y for the data point
+        # should go to. A bucket leaf takes the point unless it overflows
+        if self.leaf_capacity > 1:
+            return self._add_to_bucket(leaf, node, parent, quad, x0, y0, x1, y1)
+
+        # First check if the current `node` shares the exact x and y for the
+        # data point
         x_old, y_old = node["data"]["x"], node["data"]["y"]
 
         if x == x_old and y == y_old:
+            # Count the new point in place
+            if self.counted:
+                _add_duplicate(node, leaf["data"])
+                if self.instrument is not None:
+                    self.instrument.record_insert(
+                        depth=get_depth(self.x1 - self.x0, x1 - x0)
+                    )
+                return self
+
             # Link these two points
             leaf["next"] = node
             if parent is None:
                 self.root = leaf
             else:
                 parent[quad] = leaf
+            if self.instrument is not None:
+                self.instrument.record_insert(
+                    depth=get_depth(self.x1 - self.x0, x1 - x0)
+                )
             return self
 
+        if self.compress:
+            return self._split_compressed(leaf, node, parent, quad, x0, y0, x1, y1)
+
         # If two points are not the same, we keep splitting the current node
         # until two data points are separated in different quadrants
         quad_new = quad
         quad_old = quad
+        leaf_length = x1 - x0
 
         while quad_new == quad_old:
             if parent is None:
@@ -147,8 +251,174 @@ class Quadtree:
         # Insert two nodes as leaves in two different quadrants
         parent[quad_old] = node
         parent[quad_new] = leaf
+        if self.instrument is not None:
+            self.instrument.record_insert(
+                depth=get_depth(self.x1 - self.x0, x1 - x0),
+                splits=get_depth(leaf_length, x1 - x0),
+            )
+        return self
+
+    def _add_to_bucket(
+        self,
+        leaf: dict,
+        node: dict,
+        parent: Union[list, None],
+        quad: Union[int, None],
+        x0: float,
+        y0: float,
+        x1: float,
+        y1: float,
+    ):
+        """
+        Add a new leaf to the head of a bucket leaf, and split the bucket into
+        quadrants if it has more than leaf_capacity distinct positions.
+
+        Args:
+            leaf(dict): The new leaf
+            node(dict): The head of the bucket leaf
+            parent(list): The parent of the bucket, None for the root
+            quad(int): The quadrant of the bucket in its parent
+            x0(float): The x coordinate of the bucket origin
+            y0(float): The y coordinate of the bucket origin
+            x1(float): The x coordinate of the bucket end
+            y1(float): The y coordinate of the bucket end
+        """
+        leaf["next"] = node
+        depth = get_depth(self.x1 - self.x0, x1 - x0)
+        splits = 0
+
+        if _count_positions(leaf, self.leaf_capacity) > self.leaf_capacity:
+            leaf, levels, splits = _split_bucket(
+                leaf, x0, y0, x1, y1, self.leaf_capacity
+            )
+            depth += levels
+            if self.compress:
+                leaf = _compress_subtree(leaf, x0, y0, x1, y1)
+
+        if parent is None:
+            self.root = leaf
+        else:
+            parent[quad] = leaf
+
+        if self.instrument is not None:
+            self.instrument.record_insert(depth=depth, splits=splits)
+        return self
+
+    def _split_compressed(
+        self,
+        leaf: dict,
+        node: dict,
+        parent: Union[list, None],
+        quad: Union[int, None],
+        x0: float,
+        y0: float,
+        x1: float,
+        y1: float,
+    ):
+        """
+        Separate a new leaf from the leaf of a distinct point with one internal
+        node, and a skip node for the levels where both points share a cell.
+
+        Args:
+            leaf(dict): The new leaf
+            node(dict): The existing leaf
+            parent(list): The parent of the existing leaf, None for the root
+            quad(int): The quadrant of the existing leaf in its parent
+            x0(float): The x coordinate of the existing leaf origin
+            y0(float): The y coordinate of the existing leaf origin
+            x1(float): The x coordinate of the existing leaf end
+            y1(float): The y coordinate of the existing leaf end
+        """
+        x, y = leaf["data"]["x"], leaf["data"]["y"]
+        x_old, y_old = node["data"]["x"], node["data"]["y"]
+        levels = 0
+
+        # Find the cell that separates the points without creating nodes
+        while True:
+            xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+            quad_new = get_quadrant(x, y, xm, ym)
+            quad_old = get_quadrant(x_old, y_old, xm, ym)
+            if quad_new != quad_old:
+                break
+            x0, y0, x1, y1 = get_quadrant_extents(x0, y0, x1, y1)[quad_new]
+            levels += 1
+
+        split = [None, None, None, None]
+        split[quad_old] = node
+        split[quad_new] = leaf
+        self._replace_child(parent, quad, _skip(levels, split, x0, y0, x1, y1))
+
+        if self.instrument is not None:
+            self.instrument.record_insert(
+                depth=get_depth(self.x1 - self.x0, (x1 - x0) / 2),
+                splits=levels + 1,
+            )
+        return self
+
+    def _split_skip(
+        self,
+        leaf: dict,
+        skip: dict,
+        parent: Union[list, None],
+        quad: Union[int, None],
+        x0: float,
+        y0: float,
+        x1: float,
+        y1: float,
+    ):
+        """
+        Add a new leaf that leaves a compressed run. The run is split into an
+        internal node at the cell where the leaf leaves it, with the skip nodes
+        of the remaining levels above and below it.
+
+        Args:
+            leaf(dict): The new leaf
+            skip(dict): The skip node
+            parent(list): The parent of the skip node, None for the root
+            quad(int): The quadrant of the skip node in its parent
+            x0(float): The x coordinate of the skip node origin
+            y0(float): The y coordinate of the skip node origin
+            x1(float): The x coordinate of the skip node end
+            y1(float): The y coordinate of the skip node end
+        """
+        x, y = leaf["data"]["x"], leaf["data"]["y"]
+        ex0, ey0, ex1, ey1 = skip["extent"]
+        levels = 0
+
+        # The run follows the quadrants of the origin of its extent
+        while True:
+            xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+            quad_new = get_quadrant(x, y, xm, ym)
+            quad_run = get_quadrant(ex0, ey0, xm, ym)
+            if quad_new != quad_run:
+                break
+            x0, y0, x1, y1 = get_quadrant_extents(x0, y0, x1, y1)[quad_new]
+            levels += 1
+
+        split = [None, None, None, None]
+        split[quad_new] = leaf
+        split[quad_run] = _skip(
+            skip["skip"] - levels - 1, skip["node"], ex0, ey0, ex1, ey1
+        )
+        self._replace_child(parent, quad, _skip(levels, split, x0, y0, x1, y1))
+
+        if self.instrument is not None:
+            self.instrument.record_insert(
+                depth=get_depth(self.x1 - self.x0, (x1 - x0) / 2), splits=1
+            )
         return self
 
+    def _replace_child(
+        self, parent: Union[list, None], quad: Union[int, None], node: Union[list, dict]
+    ):
+        """
+        Put a node into a slot of its parent, or make it the root.
+        """
+        if parent is None:
+            self.root = node
+        else:
+            parent[quad] = node
+
     def add_all_data(self, data: list[dict]):
         """
         Add all data points into the quadtree.
@@ -170,7 +440,12 @@ class Quadtree:
         return self
 
     def add_all(
-        self, xs: list[float], ys: list[float], data: Union[list[dict], None] = None
+        self,
+        xs: list[float],
+        ys: list[float],
+        data: Union[list[dict], dict[str, np.ndarray], np.ndarray, None] = None,
+        progress: bool = False,
+        workers: int = 1,
     ):
         """
         Add all data points into the quadtree. This function is a syntax sugar
@@ -179,266 +454,2275 @@ class Quadtree:
         Args:
             xs(list[float]): A list of x coordinates
             ys(list[float]): A list of y coordinates
-            data(list[dict]): A list of data entries. Each data entry is a
-                dictionary with at least two keys 'x' and 'y'.
+            data(Union[list[dict], dict[str, np.ndarray], np.ndarray]): A list
+                of data entries. Each data entry is a dictionary with at least
+                two keys 'x' and 'y'. Columnar data, a dict of NumPy columns or
+                a structured array, is kept as columns and every point gets a
+                lazy Row of it, which reads the values when accessed.
+            progress(bool): Show the inserted points on a tqdm progress bar,
+                which requires tqdm. Defaults to False.
+            workers(int): Build an empty tree with this many processes, the
+                tree is identical to the one built by one process. Defaults
+                to 1.
         """
+        if progress:
+            with progress_bar(self, len(xs)):
+                return self.add_all(xs, ys, data, workers=workers)
 
         # Initialize the extent by (min_x, min_y) and (max_x, max_y)
-        x0, y0, x1, y1 = np.min(xs), np.min(ys), np.max(xs), np.max(ys)
-
-        if x0 > x1 or y0 > y1:
+        if len(xs) == 0:
             return self
 
-        self.cover(x0, y0)
-        self.cover(x1, y1)
+        data = as_rows(data, xs, ys)
 
-        # Add new points one by one
-        for i, _ in tqdm(enumerate(xs)):
-            self.add(xs[i], ys[i], data[i] if data else None)
+        self.cover_all(xs, ys)
+
+        # Build an empty tree in bulk, the tree is identical to the one created
+        # by adding the points one by one
+        if self.root is None:
+            return self._add_all_bulk(xs, ys, data, workers)
+
+        # Add new points one by one, they are already covered
+        for i, _ in enumerate(xs):
+            self._add_skip_cover(xs[i], ys[i], data[i] if data else None)
 
         return self
 
-    def extent(
-        self, point0: list[float, float] = None, point1: list[float, float] = None
-    ) -> list[list[float, float], list[float, float]]:
-        """Set the extent for this quadtree or get the current extent.
+    def _add_all_bulk(
+        self,
+        xs: list[float],
+        ys: list[float],
+        data: Union[list[dict], None] = None,
+        workers: int = 1,
+    ):
+        """
+        Build the tree from all data points at once. This method should only be
+        called in add_all() when the tree is empty and the extent already covers
+        all data points.
 
         Args:
-            point0 (list[float, float], optional): Origin coordinate. Defaults to None.
-            point1 (list[float, float], optional): Extent point coordinate. Defaults to None.
-
-        Returns:
-            list[list[float, float], list[float, float]]: Current extent [origin, extent]
+            xs(list[float]): A list of x coordinates
+            ys(list[float]): A list of y coordinates
+            data(list[dict]): A list of data entries. Each data entry is a
+                dictionary with at least two keys 'x' and 'y'.
+            workers(int): The number of processes. Defaults to 1.
         """
-        if point0 is None:
-            return [
-                [self.x0, self.y0],
-                [self.x1, self.y1],
-            ]
-        else:
-            self.cover(point0[0], point0[1])
-            self.cover(point1[0], point1[1])
-            return self
 
-    def cover(self, x: float, y: float):
+        self._cache.clear()
+        if workers <= 1:
+            children, point_index, next_point, root_ref, depth = bulk_partition(
+                xs, ys, self.x0, self.y0, self.x1, self.y1, self.leaf_capacity
+            )
+
+        x_list = xs.tolist() if isinstance(xs, np.ndarray) else xs
+        y_list = ys.tolist() if isinstance(ys, np.ndarray) else ys
+
+        with paused_gc():
+            if data:
+                leaves = [
+                    {"data": d} if d else {"data": {"x": x_list[i], "y": y_list[i]}}
+                    for i, d in enumerate(data)
+                ]
+            else:
+                leaves = [{"data": {"x": x, "y": y}} for x, y in zip(x_list, y_list)]
+
+            if workers <= 1:
+                self.root = nested_from_arrays(
+                    children, point_index, next_point, root_ref, leaves
+                )
+                n_internal = len(children)
+            else:
+                self.root, n_internal, depth = parallel_build(
+                    xs,
+                    ys,
+                    self.x0,
+                    self.y0,
+                    self.x1,
+                    self.y1,
+                    leaves,
+                    workers,
+                    self.leaf_capacity,
+                )
+
+            if self.counted:
+                _count_duplicates(self.root)
+
+            if self.compress:
+                self.root = _compress_subtree(
+                    self.root, self.x0, self.y0, self.x1, self.y1
+                )
+
+        if self.instrument is not None:
+            self.instrument.record_insert(len(leaves), depth, n_internal)
+        return self
+
+    def remove(self, d: dict):
         """
-        Extend the current boundaries to cover the data point (x, y).
+        Remove a data entry from the quadtree. Internal nodes that are left with
+        a single leaf are collapsed into that leaf, the extent is not changed.
+        With bucket leaves, internal nodes left with at most leaf_capacity
+        distinct positions are collapsed into one bucket.
 
         Args:
-            x(float): The x coordinate of the data point
-            y(float): The y coordinate of the data point
+            d(dict): The data entry to remove, a dictionary with at least two
+                keys 'x' and 'y'. The newest entry at (x, y) that is or equals
+                `d` is removed. Nothing happens if there is no such entry.
         """
+        node = self.root
+        if node is None:
+            return self
 
-        x0, y0, x1, y1 = self.x0, self.y0, self.x1, self.y1
+        if self.leaf_capacity > 1 or self.compress or self.counted:
+            return self.remove_all([d])
 
-        # Initialize the extent if there is none, make sure the extent is always
-        # integer values
-        if x0 is None:
-            x0 = int(math.floor(x))
-            y0 = int(math.floor(y))
-            x1 = x0 + 1
-            y1 = y0 + 1
+        # Find the leaf this data point belongs to, and remember the deepest
+        # ancestor that has other children as the target of a collapse
+        x, y = d["x"], d["y"]
+        x0, y0, x1, y1 = self.x0, self.y0, self.x1, self.y1
+        parent = None
+        quad = None
+        retainer = None
+        retainer_quad = None
 
-        else:
-            # Cover the new point by extending the boundaries symmetrically
-            length = x1 - x0
-            node = self.root
+        while "data" not in node:
+            quad = get_quadrant(x, y, (x0 + x1) / 2, (y0 + y1) / 2)
+            x0, y0, x1, y1 = get_quadrant_extents(x0, y0, x1, y1)[quad]
 
-            while x < x0 or x >= x1 or y < y0 or y >= y1:
-                # Quadrant index
-                # |2|3|
-                # |0|1|
-                length *= 2
-                parent = [None for _ in range(4)]
+            parent = node
+            node = parent[quad]
 
-                if x < x0 and y < y0:
-                    # Point is at bottom left, the original extent will be at top right
-                    parent[3] = node
-                    node = parent
+            if node is None:
+                return self
 
-                    x0 = x1 - length
-                    y0 = y1 - length
+            if "data" in node:
+                break
 
-                elif x >= x0 and y < y0:
-                    # Point is at bottom, the original extent will be at top
-                    parent[2] = node
-                    node = parent
+            if any(parent[i] is not None for i in range(4) if i != quad):
+                retainer, retainer_quad = parent, quad
 
-                    x1 = x0 + length
-                    y0 = y1 - length
+        # Find the entry in the chain of coincident points
+        previous = None
+        while not (node["data"] is d or node["data"] == d):
+            previous = node
+            node = node.get("next")
+            if node is None:
+                return self
 
-                elif x < x0 and y >= y0:
-                    # Point is at left, the original extent will be at bottom right
-                    parent[1] = node
-                    node = parent
+        if self._cache:
+            self._cache.clear()
 
-                    x0 = x1 - length
-                    y1 = y0 + length
+        next_leaf = node.pop("next", None)
 
-                else:
-                    # Point is in range in terms of (x0, y0), the original extent
-                    # will be at the bottom left
-                    parent[0] = node
-                    node = parent
+        # Case (1): Unlink the entry from the chain of coincident points
+        if previous is not None:
+            if next_leaf is None:
+                del previous["next"]
+            else:
+                previous["next"] = next_leaf
+            return self
 
-                    x1 = x0 + length
-                    y1 = y0 + length
+        # Case (2): The leaf is the root
+        if parent is None:
+            self.root = next_leaf
+            return self
 
-            # Update the root to point to the root node
-            if self.root is not None and "data" not in self.root:
-                self.root = node
+        # Case (3): Remove the leaf, and collapse its parent if the parent only
+        # has one leaf left
+        parent[quad] = next_leaf
+        remaining = [child for child in parent if child is not None]
 
-        # Record the extent
-        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        if len(remaining) == 1 and "data" in remaining[0]:
+            if retainer is None:
+                self.root = remaining[0]
+            else:
+                retainer[retainer_quad] = remaining[0]
 
         return self
 
-    def get_node_representation(self):
-        """
-        Create a copy of this Quadtree using a linked node data structure instead
-        of the basic array-based structure.
+    def remove_all(self, data: list[dict]):
         """
+        Remove all data entries from the quadtree. The removals are grouped by
+        subtree, so every path is only walked once. The result is the same as
+        calling remove() for each data entry.
 
-        root = self.root
+        Args:
+            data(list[dict]): A list of data entries. Each data entry is a
+                dictionary with at least two keys 'x' and 'y'.
+        """
+        if self.root is None or len(data) == 0:
+            return self
 
-        new_root = Node(
-            nid=0,
-            level=0,
-            position=[self.x0, self.y0, self.x1, self.y1],
+        if self._cache:
+            self._cache.clear()
+
+        self.root = _remove_from_subtree(
+            self.root,
+            self.x0,
+            self.y0,
+            self.x1,
+            self.y1,
+            [(d["x"], d["y"], d) for d in data],
+            self.leaf_capacity,
+            self.compress,
         )
+        return self
 
-        # Each item in the stack is (cur_node[old], parent[new], position_quad)
-        stack = [(root, None, None)]
-        stack_post = []
-        node_counter = 1
+    def update(
+        self,
+        old_xy: tuple[float, float],
+        new_xy: tuple[float, float],
+        d: Union[dict, None] = None,
+    ):
+        """
+        Move a data point to new coordinates. A point that is alone in its leaf
+        and stays in the cell of that leaf is moved in place, and the cached
+        aggregates are only updated along its path. Other points are removed
+        and added again.
 
-        while len(stack) > 0:
-            cur_node, parent, cur_quad = stack.pop()
+        Args:
+            old_xy(tuple[float, float]): The current coordinates of the point
+            new_xy(tuple[float, float]): The new coordinates of the point
+            d(dict): The data entry of the point, the newest entry at old_xy
+                that is or equals `d` is moved. The default value is
+                {'x': x, 'y': y} of the current coordinates. The 'x' and 'y'
+                keys of the moved entry are set to the new coordinates.
+        """
+        return self.update_many([old_xy], [new_xy], [d] if d else None)
 
-            if cur_node is None:
-                # Empty child (position placeholder)
-                parent.children.append(None)
+    def update_many(
+        self,
+        old_xys: list[tuple[float, float]],
+        new_xys: list[tuple[float, float]],
+        data: Union[list[dict], None] = None,
+    ):
+        """
+        Move many data points to new coordinates, see update(). Points that stay
+        in their cells are moved in place first, then the other points are
+        removed with one pass over their subtrees and added again in order.
+        Points that are not found are ignored.
+
+        Args:
+            old_xys(list[tuple[float, float]]): The current coordinates
+            new_xys(list[tuple[float, float]]): The new coordinates
+            data(list[dict]): The data entries of the points. The default value
+                is {'x': x, 'y': y} of the current coordinates for every point.
+        """
+        if self.root is None:
+            return self
+
+        in_place = []
+        moved = []
+        claimed = set()
+
+        for i, ((x_old, y_old), (x, y)) in enumerate(zip(old_xys, new_xys)):
+            d = data[i] if data and data[i] else {"x": x_old, "y": y_old}
+            found = self._find_entry(x_old, y_old, d, claimed)
+            if found is None:
                 continue
 
-            # Create a new Node object
-            if parent is None:
-                # Root node
-                cur_new_node = new_root
+            quads, (x0, y0, x1, y1), leaf, entry, key = found
+            claimed.add(key)
+
+            # The point keeps its leaf if it has no coincident points and stays
+            # in the cell, the tree structure does not change
+            alone = entry is leaf and "next" not in entry and "count" not in entry
+            if alone and x0 <= x < x1 and y0 <= y < y1:
+                entry["data"]["x"], entry["data"]["y"] = x, y
+                in_place.append((quads, entry["data"]))
             else:
-                # Compute the position based on its quad and parent's position
-                # |2|3|
-                # |0|1|
+                moved.append((x_old, y_old, x, y, entry["data"]))
 
-                x0, y0, x1, y1 = parent.position
-                xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+        if len(moved) == 0:
+            if self._cache and in_place:
+                self._update_cached_paths(in_place)
+            return self
 
-                if cur_quad == 0:
-                    cur_position = [x0, y0, xm, ym]
-                elif cur_quad == 1:
-                    cur_position = [xm, y0, x1, ym]
-                elif cur_quad == 2:
-                    cur_position = [x0, ym, xm, y1]
-                elif cur_quad == 3:
-                    cur_position = [xm, ym, x1, y1]
-                else:
-                    print("Unknown cur_quad: ", cur_quad)
+        if self._cache:
+            self._cache.clear()
+
+        self.root = _remove_from_subtree(
+            self.root,
+            self.x0,
+            self.y0,
+            self.x1,
+            self.y1,
+            [(x_old, y_old, d) for x_old, y_old, _, _, d in moved],
+            self.leaf_capacity,
+            self.compress,
+        )
 
-                cur_new_node = Node(
-                    nid=node_counter, level=parent.level + 1, position=cur_position
-                )
-                node_counter += 1
+        for _, _, x, y, d in moved:
+            d["x"], d["y"] = x, y
+            self.add(x, y, d)
 
-                # Add itself to its parent's children list
-                parent.children.append(cur_new_node)
+        return self
 
-            # Leaf node
-            if "data" in cur_node:
-                cur_new_node.data.append(cur_node["data"])
-                cur_new_node.size = 1
-            else:
-                # The positions are shown below (computed in Cartesian coordinate)
-                # We need to push them reversely so that the next item in the stack
-                # is the first item in the children list
-                # |2|3|
-                # |0|1|
-                stack.append((cur_node[3], cur_new_node, 3))
-                stack.append((cur_node[2], cur_new_node, 2))
-                stack.append((cur_node[1], cur_new_node, 1))
-                stack.append((cur_node[0], cur_new_node, 0))
+    def _find_entry(
+        self, x: float, y: float, d: dict, claimed: Union[set, None] = None
+    ) -> Union[
+        tuple[list[int], tuple[float, float, float, float], dict, dict, object], None
+    ]:
+        """
+        Find the leaf entry of a data point.
 
-                # Will visit this non-leaf node again to calculate its size
-                stack_post.append(cur_new_node)
+        Args:
+            x(float): The x coordinate of the data point
+            y(float): The y coordinate of the data point
+            d(dict): The data entry, the newest entry that is or equals `d` is
+                returned
+            claimed(set): The keys of entries to skip. Defaults to None.
 
-        # Second visit to calculate subtree sizes
-        while len(stack_post) > 0:
-            cur_node = stack_post.pop()
-            max_c_height = 0
-            for c in cur_node.children:
-                if c is not None:
-                    max_c_height = max(max_c_height, c.height)
-                    cur_node.size += c.size
-            cur_node.height = max_c_height + 1
+        Returns:
+            Union[tuple[list[int], tuple[float, float, float, float], dict, dict,
+                object], None]: The quadrants on the path to the leaf, the cell
+                of the leaf, the leaf, the entry in its chain and the key of the
+                entry, or None if there is no such entry. The older entries of a
+                counted leaf are returned as new {"data": ...} dicts.
+        """
+        node = self.root
+        x0, y0, x1, y1 = self.x0, self.y0, self.x1, self.y1
+        quads = []
+
+        while node is not None and "data" not in node:
+            # Follow the point through a compressed run
+            if "skip" in node:
+                for _ in range(node["skip"]):
+                    quad = get_quadrant(x, y, (x0 + x1) / 2, (y0 + y1) / 2)
+                    x0, y0, x1, y1 = get_quadrant_extents(x0, y0, x1, y1)[quad]
+                    quads.append(quad)
+                if [x0, y0, x1, y1] != node["extent"]:
+                    return None
+                node = node["node"]
+                continue
 
-        return new_root
+            quad = get_quadrant(x, y, (x0 + x1) / 2, (y0 + y1) / 2)
+            x0, y0, x1, y1 = get_quadrant_extents(x0, y0, x1, y1)[quad]
+            quads.append(quad)
+            node = node[quad]
+
+        leaf = node
+        while node is not None:
+            if (node["data"] is d or node["data"] == d) and (
+                claimed is None or id(node) not in claimed
+            ):
+                return quads, (x0, y0, x1, y1), leaf, node, id(node)
+            node = node.get("next")
+
+        # The older entries of a counted leaf, newest first
+        if leaf is not None and "duplicates" in leaf:
+            duplicates = leaf["duplicates"]
+            for i in range(len(duplicates) - 1, -1, -1):
+                key = (id(leaf), i)
+                if (duplicates[i] is d or duplicates[i] == d) and (
+                    claimed is None or key not in claimed
+                ):
+                    return quads, (x0, y0, x1, y1), leaf, {"data": duplicates[i]}, key
+
+        return None
+
+    def _update_cached_paths(self, moves: list[tuple[list[int], dict]]):
+        """
+        Update the cached array snapshot and aggregates after points of
+        single-point leaves moved inside their cells. Only the nodes on the
+        paths to these leaves are recomputed, level by level from the bottom,
+        from the aggregates of their children.
 
+        Args:
+            moves(list[tuple[list[int], dict]]): The quadrants on the path to
+                the leaf and the data entry of every moved point
+        """
+        array = self._cache.get("array")
+        if array is None:
+            self._cache.clear()
+            return
+
+        table = array.node_table()
+        leaves = []
+        ancestors = set()
+
+        for quads, _ in moves:
+            nid = 0
+            for quad in quads:
+                ancestors.add(nid)
+                nid = int(table.children[nid, quad])
+            leaves.append(nid)
+
+        leaves = np.array(leaves, dtype=np.int64)
+        xs = np.array([d["x"] for _, d in moves], dtype=np.float64)
+        ys = np.array([d["y"] for _, d in moves], dtype=np.float64)
+
+        points = table.order[table.start[leaves]]
+        array.xs[points], array.ys[points] = xs, ys
+
+        aggregates = self._cache.get("aggregates")
+        if aggregates is None:
+            return
+
+        aggregates.cx[leaves], aggregates.cy[leaves] = xs, ys
+        aggregates.x0[leaves], aggregates.y0[leaves] = xs, ys
+        aggregates.x1[leaves], aggregates.y1[leaves] = xs, ys
+        for name, (field, _) in self._reductions.items():
+            aggregates.reductions[name][leaves] = [d[field] for _, d in moves]
+
+        # Fold the children of the ancestors into them from the bottom
+        ancestors = np.array(sorted(ancestors), dtype=np.int64)
+        levels = table.level[ancestors]
+
+        for level in np.unique(levels)[::-1]:
+            nodes = ancestors[levels == level]
+            children = table.children[nodes]
+            filled = children >= 0
+            children = np.where(filled, children, 0)
+            weights = np.where(filled, aggregates.count[children], 0) / (
+                aggregates.count[nodes][:, None]
+            )
+
+            for values, reduce in [
+                (aggregates.cx, "mean"),
+                (aggregates.cy, "mean"),
+                (aggregates.x0, "min"),
+                (aggregates.y0, "min"),
+                (aggregates.x1, "max"),
+                (aggregates.y1, "max"),
+            ] + [
+                (aggregates.reductions[name], reduce)
+                for name, (_, reduce) in self._reductions.items()
+            ]:
+                values[nodes] = _fold_children(
+                    values[children], filled, weights, reduce
+                )
 
-def get_quadrant(x: float, y: float, xm: float, ym: float) -> int:
-    """
-    Get the quadrant index for (x, y). The quadrant order is defined by lower x
-    to larger x, and lower y to larger y.
+    def _grow_root(self, quads: list[int]) -> bool:
+        # Put the root below the new levels, a leaf root stays the root
+        node = self.root
+        if node is None or "data" in node:
+            return False
 
-    |2|3|\n
-    |0|1|
+        if self.compress:
+            node = _skip(len(quads), node, self.x0, self.y0, self.x1, self.y1)
+        else:
+            for quad in quads:
+                parent = [None for _ in range(4)]
+                parent[quad] = node
+                node = parent
+        self.root = node
+        return True
 
-    Args:
-        x (float): The x coordinate of point (x, y)
-        y (float): The y coordinate of point (x, y)
-        xm (float): The x coordinate of the midpoint of a square
-        ym (float): The y coordinate of the midpoint of a square
+    def _extent_changed(self):
+        if self._cache:
+            self._cache.clear()
 
-    Returns:
-        int: Quadrant index
-    """
-    if x >= xm and y >= ym:
-        return 3
+    def query_rect(self, x0: float, y0: float, x1: float, y1: float):
+        """
+        Find all data points inside the rectangle [x0, x1] x [y0, y1]. Quadrants
+        that do not intersect the rectangle are skipped.
+
+        Args:
+            x0 (float): The minimum x coordinate of the rectangle
+            y0 (float): The minimum y coordinate of the rectangle
+            x1 (float): The maximum x coordinate of the rectangle
+            y1 (float): The maximum y coordinate of the rectangle
 
-    elif x < xm and y >= ym:
-        return 2
+        Yields:
+            dict: Data entries inside the rectangle, in the pre-order of the tree
+        """
+        if self.root is None:
+            return
 
-    elif x >= xm and y < ym:
-        return 1
+        # Each item in the stack is (cur_node, [x0, y0, x1, y1] of cur_node)
+        stack = [(self.root, (self.x0, self.y0, self.x1, self.y1))]
 
-    else:
-        return 0
+        while len(stack) > 0:
+            cur_node, position = stack.pop()
 
+            # The points of a bucket leaf are checked one by one
+            if "data" in cur_node:
+                for d in iter_leaf_data(cur_node):
+                    if x0 <= d["x"] <= x1 and y0 <= d["y"] <= y1:
+                        yield d
+                continue
 
-class Node:
-    """
-    An object-based representation of a Quadtree.
-    """
+            if "skip" in cur_node:
+                cx0, cy0, cx1, cy1 = cur_node["extent"]
+                if cx0 <= x1 and x0 < cx1 and cy0 <= y1 and y0 < cy1:
+                    stack.append((cur_node["node"], tuple(cur_node["extent"])))
+                continue
 
-    def __init__(self, nid: int, level: int, position: list[int]):
-        self.children: list[Node] = []
-        self.size = 0
-        self.height = 0
-        self.level = level
-        self.data = []
-        self.nid = nid
-        # A list of 4 items: [x0, y0, x1, y1]
-        self.position = position
+            # Cells cover [cx0, cx1) x [cy0, cy1), push the intersecting ones
+            # reversely so that they are visited in quadrant order
+            quad_positions = get_quadrant_extents(*position)
+            for quad in (3, 2, 1, 0):
+                child = cur_node[quad]
+                cx0, cy0, cx1, cy1 = quad_positions[quad]
+                if (
+                    child is not None
+                    and cx0 <= x1
+                    and x0 < cx1
+                    and cy0 <= y1
+                    and y0 < cy1
+                ):
+                    stack.append((child, quad_positions[quad]))
+
+    def query_rect_batch(self, rects: np.ndarray) -> list[list[dict]]:
+        """
+        Find all data points inside each of many rectangles in one traversal.
+        Every node is visited at most once, with the indices of all rectangles
+        that intersect it.
 
-    def __str__(self):
-        children_num = len([c for c in self.children if c is not None])
+        Args:
+            rects (np.ndarray): An array of shape [n, 4], each row is a rectangle
+                [x0, y0, x1, y1]
 
-        data_string = f"{self.data}"
-        if len(self.data) > 1:
-            data_string = f"[{self.data[0]}...]"
+        Returns:
+            list[list[dict]]: Data entries inside each rectangle, in the
+                pre-order of the tree
+        """
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        results = [[] for _ in range(len(rects))]
 
-        return (
-            f"Node(children={children_num}, size={self.size}, "
-            + f"height={self.height}, level={self.level}, data={data_string}, "
-            + f"id={self.nid})"
+        if self.root is None:
+            return results
+
+        qx0, qy0, qx1, qy1 = rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]
+        active = np.flatnonzero(
+            (self.x0 <= qx1) & (qx0 < self.x1) & (self.y0 <= qy1) & (qy0 < self.y1)
+        )
+
+        # Each item in the stack is (cur_node, position, intersecting rectangles)
+        stack = [(self.root, (self.x0, self.y0, self.x1, self.y1), active)]
+
+        while len(stack) > 0:
+            cur_node, position, active = stack.pop()
+
+            if "data" in cur_node:
+                for d in iter_leaf_data(cur_node):
+                    x, y = d["x"], d["y"]
+                    hits = active[
+                        (qx0[active] <= x)
+                        & (x <= qx1[active])
+                        & (qy0[active] <= y)
+                        & (y <= qy1[active])
+                    ]
+                    for i in hits.tolist():
+                        results[i].append(d)
+                continue
+
+            if "skip" in cur_node:
+                cx0, cy0, cx1, cy1 = cur_node["extent"]
+                active = active[
+                    (cx0 <= qx1[active])
+                    & (qx0[active] < cx1)
+                    & (cy0 <= qy1[active])
+                    & (qy0[active] < cy1)
+                ]
+                if len(active) > 0:
+                    stack.append((cur_node["node"], tuple(cur_node["extent"]), active))
+                continue
+
+            # The rectangles already intersect this node, so only the sides of
+            # the midpoint need to be checked
+            x0, y0, x1, y1 = position
+            xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+            left = qx0[active] < xm
+            right = qx1[active] >= xm
+            bottom = qy0[active] < ym
+            top = qy1[active] >= ym
+            quad_masks = (left & bottom, right & bottom, left & top, right & top)
+
+            quad_positions = get_quadrant_extents(x0, y0, x1, y1)
+            for quad in (3, 2, 1, 0):
+                if cur_node[quad] is not None and quad_masks[quad].any():
+                    stack.append(
+                        (cur_node[quad], quad_positions[quad], active[quad_masks[quad]])
+                    )
+
+        return results
+
+    def find(self, x: float, y: float, radius: Union[float, None] = None):
+        """
+        Find the data point closest to (x, y) within the search radius, the
+        same as quadtree.find() in d3-quadtree.
+
+        Args:
+            x (float): The x coordinate of the query point
+            y (float): The y coordinate of the query point
+            radius (float, optional): The search radius. Defaults to None, which
+                means an infinite radius.
+
+        Returns:
+            Union[dict, None]: The closest data entry, or None if there is no data
+                point within the search radius
+        """
+        nearest = self.knn(x, y, 1, radius)
+        return nearest[0] if nearest else None
+
+    def knn(
+        self, x: float, y: float, k: int, radius: Union[float, None] = None
+    ) -> list[dict]:
+        """
+        Find the k data points closest to (x, y). Nodes are visited best-first
+        from a priority queue ordered by their distance to (x, y).
+
+        Args:
+            x (float): The x coordinate of the query point
+            y (float): The y coordinate of the query point
+            k (int): The number of data points to find
+            radius (float, optional): The search radius. Defaults to None, which
+                means an infinite radius.
+
+        Returns:
+            list[dict]: Up to k data entries, sorted by their distance to (x, y)
+        """
+        results = []
+
+        if self.root is None or k <= 0:
+            return results
+
+        radius2 = math.inf if radius is None else radius * radius
+
+        # Each item in the heap is (squared distance, tie breaker, cur_node,
+        # [x0, y0, x1, y1] of cur_node). A data entry whose distance is already
+        # exact has no position.
+        counter = itertools.count()
+        heap = [(0, next(counter), self.root, (self.x0, self.y0, self.x1, self.y1))]
+
+        while len(heap) > 0:
+            _, _, cur_node, position = heapq.heappop(heap)
+
+            if position is None:
+                results.append(cur_node)
+                if len(results) == k:
+                    return results
+                continue
+
+            if "data" in cur_node:
+                for d in iter_leaf_data(cur_node):
+                    dx = d["x"] - x
+                    dy = d["y"] - y
+                    d2 = dx * dx + dy * dy
+                    if d2 < radius2:
+                        heapq.heappush(heap, (d2, next(counter), d, None))
+                continue
+
+            if "skip" in cur_node:
+                d2 = get_distance2(x, y, *cur_node["extent"])
+                if d2 < radius2:
+                    heapq.heappush(
+                        heap,
+                        (
+                            d2,
+                            next(counter),
+                            cur_node["node"],
+                            tuple(cur_node["extent"]),
+                        ),
+                    )
+                continue
+
+            quad_positions = get_quadrant_extents(*position)
+            for quad in range(4):
+                if cur_node[quad] is not None:
+                    d2 = get_distance2(x, y, *quad_positions[quad])
+                    if d2 < radius2:
+                        heapq.heappush(
+                            heap,
+                            (d2, next(counter), cur_node[quad], quad_positions[quad]),
+                        )
+
+        return results
+
+    def knn_batch(
+        self, xs: np.ndarray, ys: np.ndarray, k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest data points of many query points at once, see
+        ArrayQuadtree.knn_batch().
+
+        Args:
+            xs (np.ndarray): The x coordinates of the query points
+            ys (np.ndarray): The y coordinates of the query points
+            k (int): The number of neighbors
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The distances and indices of the
+                neighbors, both of shape [n_queries, k] and sorted by distance.
+                Indices refer to the list returned by self.data(). Missing
+                neighbors have distance inf and index -1.
+        """
+        return self._array_snapshot().knn_batch(xs, ys, k)
+
+    def query_radius(self, x: float, y: float, r: float) -> np.ndarray:
+        """
+        Find all data points within distance r of (x, y), see
+        ArrayQuadtree.query_radius().
+
+        Args:
+            x (float): The x coordinate of the circle center
+            y (float): The y coordinate of the circle center
+            r (float): The radius, points at distance r are included
+
+        Returns:
+            np.ndarray: Indices of the points inside the circle, they refer to
+                the list returned by self.data()
+        """
+        return self._array_snapshot().query_radius(x, y, r)
+
+    def query_polygon(
+        self, vertices: Union[list[list[float]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Find all data points inside a polygon, see
+        ArrayQuadtree.query_polygon().
+
+        Args:
+            vertices (Union[list[list[float]], np.ndarray]): The [x, y]
+                coordinates of the polygon vertices
+
+        Returns:
+            np.ndarray: Indices of the points inside the polygon, they refer to
+                the list returned by self.data()
+        """
+        return self._array_snapshot().query_polygon(vertices)
+
+    def histogram(
+        self, bounds: Union[list[float], None] = None, nx: int = 256, ny: int = 256
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Count the data points in the pixels of a regular grid from the cached
+        subtree sizes, see ArrayQuadtree.histogram().
+
+        Args:
+            bounds (list[float], optional): The grid [x0, y0, x1, y1]. Defaults
+                to the extent of the tree.
+            nx (int, optional): The number of pixels along x. Defaults to 256.
+            ny (int, optional): The number of pixels along y. Defaults to 256.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The counts of shape
+                [nx, ny], and the pixel edges along x and y, as returned by
+                numpy.histogram2d()
+        """
+        return self._array_snapshot().histogram(bounds, nx, ny)
+
+    def data(self) -> list[dict]:
+        """
+        Get all data entries in the quadtree, the same as quadtree.data() in
+        d3-quadtree.
+
+        Returns:
+            list[dict]: Data entries in the pre-order of the tree, each chain of
+                coincident points from its head
+        """
+        results = []
+
+        if self.root is None:
+            return results
+
+        stack = [self.root]
+        while len(stack) > 0:
+            cur_node = stack.pop()
+            if "data" in cur_node:
+                results.extend(iter_leaf_data(cur_node))
+            elif "skip" in cur_node:
+                stack.append(cur_node["node"])
+            else:
+                stack.extend(c for c in reversed(cur_node) if c is not None)
+
+        return results
+
+    def visit(
+        self, callback: Callable[[Union[list, dict], float, float, float, float], bool]
+    ):
+        """
+        Visit the nodes in pre-order, the same as quadtree.visit() in
+        d3-quadtree. The callback is called as callback(node, x0, y0, x1, y1)
+        with the node (a list for internal nodes, a dict for leaves) and its
+        cell. If the callback returns True, the children of the node are not
+        visited. The tree is walked with an explicit stack, so deep trees do not
+        hit the recursion limit.
+
+        Args:
+            callback (Callable): The function called for every visited node
+        """
+        root = self.uncompressed_root()
+        if root is None:
+            return self
+
+        stack = [(root, self.x0, self.y0, self.x1, self.y1)]
+
+        while len(stack) > 0:
+            node, x0, y0, x1, y1 = stack.pop()
+            if callback(node, x0, y0, x1, y1) or "data" in node:
+                continue
+
+            # Push the quadrants in reverse so that quadrant 0 is visited first
+            xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+            if node[3] is not None:
+                stack.append((node[3], xm, ym, x1, y1))
+            if node[2] is not None:
+                stack.append((node[2], x0, ym, xm, y1))
+            if node[1] is not None:
+                stack.append((node[1], xm, y0, x1, ym))
+            if node[0] is not None:
+                stack.append((node[0], x0, y0, xm, ym))
+
+        return self
+
+    def visit_after(
+        self, callback: Callable[[Union[list, dict], float, float, float, float], None]
+    ):
+        """
+        Visit the nodes in post-order, the same as quadtree.visitAfter() in
+        d3-quadtree. The callback is called as callback(node, x0, y0, x1, y1)
+        after all children of the node were visited. The tree is walked with an
+        explicit stack.
+
+        Args:
+            callback (Callable): The function called for every node
+        """
+        root = self.uncompressed_root()
+        if root is None:
+            return self
+
+        # Collect the nodes in reversed post-order: each node comes before its
+        # children, which come in reversed quadrant order
+        stack = [(root, self.x0, self.y0, self.x1, self.y1)]
+        visited = []
+
+        while len(stack) > 0:
+            item = stack.pop()
+            node, x0, y0, x1, y1 = item
+            if "data" not in node:
+                xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+                if node[0] is not None:
+                    stack.append((node[0], x0, y0, xm, ym))
+                if node[1] is not None:
+                    stack.append((node[1], xm, y0, x1, ym))
+                if node[2] is not None:
+                    stack.append((node[2], x0, ym, xm, y1))
+                if node[3] is not None:
+                    stack.append((node[3], xm, ym, x1, y1))
+            visited.append(item)
+
+        for item in reversed(visited):
+            callback(*item)
+
+        return self
+
+    def visit_levels(
+        self,
+        callback: Callable[
+            [np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+            Union[np.ndarray, None],
+        ],
+    ):
+        """
+        Visit the nodes one level at a time with NumPy arrays, see
+        ArrayQuadtree.visit_levels(). Node ids are the pre-order ids (Node.nid),
+        and the aggregates() of the visited nodes can be read with them.
+
+        Args:
+            callback (Callable): The function called for the visited nodes of
+                every level
+        """
+        self._array_snapshot().visit_levels(callback)
+        return self
+
+    def add_reduction(self, name: str, field: str, reduce: str = "sum"):
+        """
+        Register a reduction of a data field, which aggregates() computes for
+        every node.
+
+        Args:
+            name (str): The name of the reduction result
+            field (str): The data field to reduce
+            reduce (str, optional): One of "sum", "min", "max" and "mean".
+                Defaults to "sum".
+        """
+        if reduce not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction: {reduce}")
+
+        self._reductions[name] = (field, reduce)
+        self._cache.pop("aggregates", None)
+        return self
+
+    def aggregates(self) -> NodeAggregates:
+        """
+        Get the per-node aggregates: count, centroid, tight bounding box and the
+        registered reductions, see ArrayQuadtree.aggregates(). They are computed
+        in one vectorized pass and cached until the tree changes, so reading the
+        aggregates of a node is O(1).
+
+        Returns:
+            NodeAggregates: Aggregates indexed by the node id (Node.nid)
+        """
+        if "aggregates" not in self._cache:
+            self._cache["aggregates"] = self._array_snapshot().aggregates(
+                self._reductions
+            )
+        return self._cache["aggregates"]
+
+    def _array_snapshot(self) -> ArrayQuadtree:
+        """
+        Get an array-backed copy of this tree for vectorized algorithms. The copy
+        is cached until the tree changes.
+        """
+        if "array" not in self._cache:
+            self._cache["array"] = self.to_array()
+        return self._cache["array"]
+
+    def iter_tiles(
+        self,
+        level: Union[int, None] = None,
+        max_points: Union[int, None] = None,
+        sample: Union[int, None] = None,
+        seed: Union[int, None] = None,
+    ):
+        """
+        Cut the tree into level-of-detail tiles and stream them in pre-order.
+        Tiles are either all nodes at `level` or the frontier of largest nodes
+        holding at most `max_points` points. Leaves above the cut are tiles too,
+        so every point belongs to exactly one tile.
+
+        The cut is computed while walking the root, without creating Node
+        objects, so the memory is bounded by the tree depth and the tile data.
+
+        Args:
+            level (int, optional): Cut the tree at this level. Defaults to None.
+            max_points (int, optional): Cut the tree at the largest nodes with at
+                most this many points. Defaults to None.
+            sample (int, optional): Keep a uniform random sample of at most this
+                many data entries per tile. Defaults to None, which keeps all
+                data entries.
+            seed (int, optional): The random seed for sampling. Defaults to None.
+
+        Yields:
+            Tile: Tiles with their node id (Node.nid), level, position, size,
+                centroid and data entries
+        """
+        if (level is None) == (max_points is None):
+            raise ValueError("Exactly one of level and max_points is required")
+
+        root = self.uncompressed_root()
+        if root is None:
+            return
+
+        rng = random.Random(seed)
+        nid = 0
+
+        # Each item in the stack is (cur_node, position, level)
+        stack = [(root, [self.x0, self.y0, self.x1, self.y1], 0)]
+
+        while len(stack) > 0:
+            cur_node, position, cur_level = stack.pop()
+
+            summary = None
+            if "data" in cur_node or cur_level == level:
+                summary = _summarize_subtree(cur_node, None, sample, rng)
+            elif max_points is not None:
+                summary = _summarize_subtree(cur_node, max_points, sample, rng)
+
+            if summary is not None:
+                size, n_nodes, sum_x, sum_y, data = summary
+                yield Tile(
+                    nid=nid,
+                    level=cur_level,
+                    position=position,
+                    size=size,
+                    cx=sum_x / size,
+                    cy=sum_y / size,
+                    data=data,
+                )
+                nid += n_nodes
+                continue
+
+            nid += 1
+            quad_positions = get_quadrant_extents(*position)
+            for quad in (3, 2, 1, 0):
+                if cur_node[quad] is not None:
+                    stack.append(
+                        (cur_node[quad], list(quad_positions[quad]), cur_level + 1)
+                    )
+
+    def save(self, path: str):
+        """
+        Save this tree in the compact binary layout of ArrayQuadtree.save().
+
+        Args:
+            path (str): The file path
+        """
+        self._array_snapshot().save(path)
+        return self
+
+    @staticmethod
+    def load(path: str, mmap: bool = True) -> ArrayQuadtree:
+        """
+        Load a tree saved by save(). The tree stays in the array-backed storage,
+        so with `mmap` it opens in O(1) and serves read-only queries (e.g.,
+        query_rect(), find(), knn()) from the memory-mapped file. Call
+        to_quadtree() on it to get the nested-list structure.
+
+        Args:
+            path (str): The file path
+            mmap (bool, optional): Memory-map the arrays instead of reading them.
+                Defaults to True.
+
+        Returns:
+            ArrayQuadtree: The loaded tree
+        """
+        return ArrayQuadtree.load(path, mmap)
+
+    def dump_d3_json(
+        self,
+        fp,
+        compress: bool = False,
+        precision: Union[int, None] = None,
+        chunk_size: int = 65536,
+        expand: bool = False,
+    ):
+        """
+        Write the root as JSON for d3-quadtree, the same structure as
+        json.dump(self.root, fp) with compact separators. The tree is walked
+        iteratively and written in chunks, so the memory is bounded by the tree
+        depth instead of the size of the JSON string. Chains of coincident
+        points are written without recursion.
+
+        Args:
+            fp: A writable text or binary file object
+            compress (bool, optional): Write a gzip stream, `fp` must be binary.
+                Defaults to False.
+            precision (int, optional): Round floats in the data entries to this
+                many significant digits. Defaults to None, which keeps the exact
+                values.
+            chunk_size (int, optional): The number of characters buffered before
+                each write. Defaults to 65536.
+            expand (bool, optional): Write bucket leaves as the subtrees of
+                expanded(), one position per leaf. Defaults to False.
+        """
+        out = gzip.GzipFile(fileobj=fp, mode="wb") if compress else fp
+        binary = not isinstance(out, io.TextIOBase)
+        buffer = []
+        buffered = 0
+
+        def write(text: str):
+            nonlocal buffered
+            buffer.append(text)
+            buffered += len(text)
+            if buffered >= chunk_size:
+                flush()
+
+        def flush():
+            nonlocal buffered
+            chunk = "".join(buffer)
+            out.write(chunk.encode("utf-8") if binary else chunk)
+            buffer.clear()
+            buffered = 0
+
+        # Each item in the stack is either (node, [x0, y0, x1, y1] of node) or a
+        # literal separator
+        stack = [(self.root, (self.x0, self.y0, self.x1, self.y1))]
+
+        while len(stack) > 0:
+            item = stack.pop()
+
+            if isinstance(item, str):
+                write(item)
+                continue
+
+            # Write the run of a skip node as single-child internal nodes
+            cur_node, position = item
+            if cur_node is not None and "skip" in cur_node:
+                run, run_end, run_quad = _expand_skip(cur_node, *position)
+                run_end[run_quad] = cur_node["node"]
+                cur_node = run
+
+            if (
+                expand
+                and cur_node is not None
+                and "data" in cur_node
+                and _count_positions(cur_node, 1) > 1
+            ):
+                cur_node = _expand_leaf(cur_node, *position)
+
+            if cur_node is None:
+                write("null")
+            elif "data" in cur_node:
+                # Counted leaves are written as chains
+                depth = 0
+                for data in iter_leaf_data(cur_node):
+                    if depth > 0:
+                        write(',"next":')
+                    if precision is not None:
+                        data = _round_floats(data, precision)
+                    write(
+                        '{"data":'
+                        + dumps(data, separators=(",", ":"), default=to_json_value)
+                    )
+                    depth += 1
+                write("}" * depth)
+            else:
+                write("[")
+                stack.append("]")
+                quad_positions = get_quadrant_extents(*position)
+                for quad in (3, 2, 1, 0):
+                    stack.append((cur_node[quad], quad_positions[quad]))
+                    if quad > 0:
+                        stack.append(",")
+
+        flush()
+        if compress:
+            out.close()
+
+        return self
+
+    def uncompressed_root(self) -> Union[list, dict, None]:
+        """
+        Get the root with every skip node of a compressed tree expanded into
+        its run of single-child internal nodes, the same nested-list structure
+        as a tree built without compression. Leaves are shared with this tree.
+        The result is cached until the tree changes.
+
+        Returns:
+            Union[list, dict, None]: The uncompressed root
+        """
+        if not self.compress:
+            return self.root
+
+        if "uncompressed" in self._cache:
+            return self._cache["uncompressed"]
+
+        root = None
+        if self.root is not None:
+            # Each item in the stack is (cur_node, position, new parent, quad)
+            stack = [(self.root, (self.x0, self.y0, self.x1, self.y1), None, None)]
+
+            while len(stack) > 0:
+                cur_node, position, parent, quad = stack.pop()
+
+                if "data" in cur_node:
+                    new_node = cur_node
+                elif "skip" in cur_node:
+                    # Expand the run above a copy of the node below it
+                    new_node, run_end, run_quad = _expand_skip(cur_node, *position)
+                    stack.append(
+                        (cur_node["node"], tuple(cur_node["extent"]), run_end, run_quad)
+                    )
+                else:
+                    new_node = [None, None, None, None]
+                    quad_positions = get_quadrant_extents(*position)
+                    for child_quad in range(4):
+                        if cur_node[child_quad] is not None:
+                            stack.append(
+                                (
+                                    cur_node[child_quad],
+                                    quad_positions[child_quad],
+                                    new_node,
+                                    child_quad,
+                                )
+                            )
+
+                if parent is None:
+                    root = new_node
+                else:
+                    parent[quad] = new_node
+
+        self._cache["uncompressed"] = root
+        return root
+
+    def expanded(self) -> "Quadtree":
+        """
+        Get a copy of this tree in the layout of d3-quadtree, one position per
+        leaf. Bucket leaves are replaced by the subtrees that adding their
+        points one by one creates, and skip nodes by their runs, so the copy is
+        the tree built with leaf_capacity 1 and without compression. The data
+        entries are shared with this tree.
+
+        Returns:
+            Quadtree: The expanded tree
+        """
+        tree = Quadtree()
+        tree.x0, tree.y0, tree.x1, tree.y1 = self.x0, self.y0, self.x1, self.y1
+
+        if self.root is None:
+            return tree
+
+        # Each item in the stack is (cur_node, position, new parent, quad)
+        stack = [(self.root, (self.x0, self.y0, self.x1, self.y1), None, None)]
+
+        while len(stack) > 0:
+            cur_node, position, parent, quad = stack.pop()
+
+            if "skip" in cur_node:
+                run, run_end, run_quad = _expand_skip(cur_node, *position)
+                run_end[run_quad] = cur_node["node"]
+                cur_node = run
+
+            if "data" in cur_node:
+                new_node = _expand_leaf(cur_node, *position)
+            else:
+                new_node = [None, None, None, None]
+                quad_positions = get_quadrant_extents(*position)
+                for child_quad in range(4):
+                    if cur_node[child_quad] is not None:
+                        stack.append(
+                            (
+                                cur_node[child_quad],
+                                quad_positions[child_quad],
+                                new_node,
+                                child_quad,
+                            )
+                        )
+
+            if parent is None:
+                tree.root = new_node
+            else:
+                parent[quad] = new_node
+
+        return tree
+
+    def to_array(self) -> ArrayQuadtree:
+        """
+        Create a copy of this Quadtree using the compact array-backed storage.
+        Points are numbered in the pre-order of the tree.
+
+        Returns:
+            ArrayQuadtree: The equivalent array-backed quadtree
+        """
+        return ArrayQuadtree.from_quadtree(self)
+
+    def get_node_representation(self, lazy: bool = False):
+        """
+        Create a copy of this Quadtree using a linked node data structure instead
+        of the basic array-based structure.
+
+        Args:
+            lazy (bool, optional): Return a NodeView of the root instead, which
+                creates the children of a node on first access and reads the
+                id, size and height from the cached node table. Inspecting the
+                top levels of a large tree then only creates these levels.
+                Defaults to False.
+        """
+        if lazy:
+            return NodeView(self.root, 0, [self.x0, self.y0, self.x1, self.y1], self)
+
+        root = self.uncompressed_root()
+
+        new_root = Node(
+            nid=0,
+            level=0,
+            position=[self.x0, self.y0, self.x1, self.y1],
+        )
+
+        # Each item in the stack is (cur_node[old], parent[new], position_quad)
+        stack = [(root, None, None)]
+        stack_post = []
+        node_counter = 1
+
+        while len(stack) > 0:
+            cur_node, parent, cur_quad = stack.pop()
+
+            if cur_node is None:
+                # Empty child (position placeholder)
+                parent.children.append(None)
+                continue
+
+            # Create a new Node object
+            if parent is None:
+                # Root node
+                cur_new_node = new_root
+            else:
+                # Compute the position based on its quad and parent's position
+                # |2|3|
+                # |0|1|
+
+                x0, y0, x1, y1 = parent.position
+                xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+
+                if cur_quad == 0:
+                    cur_position = [x0, y0, xm, ym]
+                elif cur_quad == 1:
+                    cur_position = [xm, y0, x1, ym]
+                elif cur_quad == 2:
+                    cur_position = [x0, ym, xm, y1]
+                elif cur_quad == 3:
+                    cur_position = [xm, ym, x1, y1]
+                else:
+                    print("Unknown cur_quad: ", cur_quad)
+
+                cur_new_node = Node(
+                    nid=node_counter, level=parent.level + 1, position=cur_position
+                )
+                node_counter += 1
+
+                # Add itself to its parent's children list
+                parent.children.append(cur_new_node)
+
+            # Leaf node
+            if "data" in cur_node:
+                cur_new_node.data.append(cur_node["data"])
+                cur_new_node.size = 1
+            else:
+                # The positions are shown below (computed in Cartesian coordinate)
+                # We need to push them reversely so that the next item in the stack
+                # is the first item in the children list
+                # |2|3|
+                # |0|1|
+                stack.append((cur_node[3], cur_new_node, 3))
+                stack.append((cur_node[2], cur_new_node, 2))
+                stack.append((cur_node[1], cur_new_node, 1))
+                stack.append((cur_node[0], cur_new_node, 0))
+
+                # Will visit this non-leaf node again to calculate its size
+                stack_post.append(cur_new_node)
+
+        # Second visit to calculate subtree sizes
+        while len(stack_post) > 0:
+            cur_node = stack_post.pop()
+            max_c_height = 0
+            for c in cur_node.children:
+                if c is not None:
+                    max_c_height = max(max_c_height, c.height)
+                    cur_node.size += c.size
+            cur_node.height = max_c_height + 1
+
+        return new_root
+
+    def iter_nodes(self, order: str = "pre"):
+        """
+        Stream the nodes of get_node_representation() as flat records, without
+        creating the linked Node objects. Post-order records are computed in one
+        pass with a stack bounded by the tree depth. Pre-order records need the
+        subtree sizes first, so they take a post-order pass that only keeps two
+        integers per node.
+
+        Args:
+            order (str, optional): "pre" or "post". Defaults to "pre".
+
+        Yields:
+            NodeRecord: Node records with the same nid, level, position, size,
+                height and data as the Node objects
+        """
+        if order == "post":
+            yield from self._iter_nodes_post_order()
+            return
+
+        if order != "pre":
+            raise ValueError(f"Unknown order: {order}")
+
+        root = self.uncompressed_root()
+        if root is None:
+            return
+
+        sizes = array("q")
+        heights = array("q")
+        for record in self._iter_nodes_post_order():
+            if record.nid >= len(sizes):
+                sizes.extend([0] * (record.nid + 1 - len(sizes)))
+                heights.extend([0] * (record.nid + 1 - len(heights)))
+            sizes[record.nid] = record.size
+            heights[record.nid] = record.height
+
+        nid = 0
+
+        # Each item in the stack is (cur_node, position, level)
+        stack = [(root, [self.x0, self.y0, self.x1, self.y1], 0)]
+
+        while len(stack) > 0:
+            cur_node, position, level = stack.pop()
+
+            if "data" in cur_node:
+                data = [cur_node["data"]]
+            else:
+                data = []
+                quad_positions = get_quadrant_extents(*position)
+                for quad in (3, 2, 1, 0):
+                    if cur_node[quad] is not None:
+                        stack.append(
+                            (cur_node[quad], list(quad_positions[quad]), level + 1)
+                        )
+
+            yield NodeRecord(
+                nid=nid,
+                level=level,
+                position=position,
+                size=sizes[nid],
+                height=heights[nid],
+                data=data,
+            )
+            nid += 1
+
+    def _iter_nodes_post_order(self):
+        """
+        Stream the node records in post-order, see iter_nodes().
+        """
+        root = self.uncompressed_root()
+        if root is None:
+            return
+
+        nid = 0
+
+        # Each frame in the stack is [cur_node, position, level, nid, size,
+        # height, next quad to visit]
+        stack = [[root, [self.x0, self.y0, self.x1, self.y1], 0, 0, 0, 0, 0]]
+
+        while len(stack) > 0:
+            frame = stack[-1]
+            cur_node, position, level = frame[0], frame[1], frame[2]
+
+            if "data" in cur_node:
+                frame[4], data = 1, [cur_node["data"]]
+            else:
+                # Descend into the next non-empty child
+                quad = frame[6]
+                while quad < 4 and cur_node[quad] is None:
+                    quad += 1
+
+                if quad < 4:
+                    frame[6] = quad + 1
+                    nid += 1
+                    child_position = list(get_quadrant_extents(*position)[quad])
+                    stack.append(
+                        [cur_node[quad], child_position, level + 1, nid, 0, 0, 0]
+                    )
+                    continue
+
+                data = []
+
+            stack.pop()
+            record = NodeRecord(
+                nid=frame[3],
+                level=level,
+                position=position,
+                size=frame[4],
+                height=frame[5],
+                data=data,
+            )
+
+            if len(stack) > 0:
+                parent = stack[-1]
+                parent[4] += record.size
+                parent[5] = max(parent[5], record.height + 1)
+
+            yield record
+
+    def iter_node_batches(self, batch_size: int = 65536, order: str = "pre"):
+        """
+        Stream the node records as NumPy record arrays of at most `batch_size`
+        nodes, see iter_nodes(). The batches hold the numeric fields (nid,
+        level, x0, y0, x1, y1, size, height), so they can be written to a file or
+        a socket directly.
+
+        Args:
+            batch_size (int, optional): The number of nodes per batch. Defaults
+                to 65536.
+            order (str, optional): "pre" or "post". Defaults to "pre".
+
+        Yields:
+            np.ndarray: Record arrays with the dtype NODE_RECORD_DTYPE
+        """
+        batch = np.empty(batch_size, dtype=NODE_RECORD_DTYPE)
+        i = 0
+
+        for record in self.iter_nodes(order):
+            batch[i] = (
+                record.nid,
+                record.level,
+                *record.position,
+                record.size,
+                record.height,
+            )
+            i += 1
+
+            if i == batch_size:
+                yield batch
+                batch = np.empty(batch_size, dtype=NODE_RECORD_DTYPE)
+                i = 0
+
+        if i > 0:
+            yield batch[:i]
+
+
+def iter_leaf_data(leaf: dict):
+    """
+    Iterate through the data entries of a leaf node and all its coincident
+    points chained through "next", or counted in "duplicates", newest first.
+
+    Args:
+        leaf (dict): A leaf node {"data": ..., "next": ...}
+
+    Yields:
+        dict: Data entries
+    """
+    while leaf is not None:
+        yield leaf["data"]
+        if "duplicates" in leaf:
+            yield from reversed(leaf["duplicates"])
+        leaf = leaf.get("next")
+
+
+def _fold_children(
+    values: np.ndarray, filled: np.ndarray, weights: np.ndarray, reduce: str
+) -> np.ndarray:
+    """
+    Reduce the aggregates of the children of nodes into the nodes.
+
+    Args:
+        values (np.ndarray): The aggregates of the four children of each node
+        filled (np.ndarray): Whether each child exists
+        weights (np.ndarray): The share of each child in the points of its parent
+        reduce (str): One of "sum", "min", "max" and "mean"
+
+    Returns:
+        np.ndarray: The aggregates of the nodes
+    """
+    if reduce == "sum":
+        return np.where(filled, values, 0).sum(axis=1)
+    if reduce == "mean":
+        return (values * weights).sum(axis=1)
+    if reduce == "min":
+        return np.where(filled, values, np.inf).min(axis=1)
+    return np.where(filled, values, -np.inf).max(axis=1)
+
+
+def _remove_from_subtree(
+    node: Union[list, dict],
+    x0: float,
+    y0: float,
+    x1: float,
+    y1: float,
+    points: list[tuple[float, float, dict]],
+    leaf_capacity: int = 1,
+    compress: bool = False,
+) -> Union[list, dict, None]:
+    """
+    Remove data entries from a subtree, and collapse the internal nodes that are
+    left with a single leaf, or with bucket leaves that fit in one bucket. In a
+    compressed tree, internal nodes left with a single internal child join the
+    skip node of their run.
+
+    Args:
+        node (Union[list, dict]): The root of the subtree
+        x0 (float): The x coordinate of the subtree origin
+        y0 (float): The y coordinate of the subtree origin
+        x1 (float): The x coordinate of the subtree end
+        y1 (float): The y coordinate of the subtree end
+        points (list[tuple[float, float, dict]]): The coordinates and data
+            entries of the points to remove from this subtree
+        leaf_capacity (int, optional): The maximum number of distinct positions
+            in a leaf. Defaults to 1.
+        compress (bool, optional): Whether the subtree is compressed. Defaults
+            to False.
+
+    Returns:
+        Union[list, dict, None]: The new root of the subtree
+    """
+    if "data" in node:
+        return _remove_from_chain(node, [d for _, _, d in points])
+
+    if "skip" in node:
+        ex0, ey0, ex1, ey1 = node["extent"]
+        points = [p for p in points if ex0 <= p[0] < ex1 and ey0 <= p[1] < ey1]
+        if len(points) == 0:
+            return node
+
+        child = _remove_from_subtree(
+            node["node"], ex0, ey0, ex1, ey1, points, leaf_capacity, compress
+        )
+        if child is None or "data" in child:
+            return child
+        return _skip(node["skip"], child, ex0, ey0, ex1, ey1)
+
+    # Group the points by quadrant, and walk every child once
+    xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+    groups = [[], [], [], []]
+    for point in points:
+        groups[get_quadrant(point[0], point[1], xm, ym)].append(point)
+
+    extents = get_quadrant_extents(x0, y0, x1, y1)
+    for quad, group in enumerate(groups):
+        if group and node[quad] is not None:
+            node[quad] = _remove_from_subtree(
+                node[quad], *extents[quad], group, leaf_capacity, compress
+            )
+
+    remaining = [child for child in node if child is not None]
+
+    if len(remaining) == 0:
+        return None
+
+    if len(remaining) == 1 and "data" in remaining[0]:
+        return remaining[0]
+
+    if len(remaining) == 1 and compress:
+        quad = next(quad for quad in range(4) if node[quad] is not None)
+        return _skip(1, remaining[0], *extents[quad])
+
+    # An internal child has more than leaf_capacity positions, so only leaves
+    # can be merged
+    if leaf_capacity > 1 and all("data" in child for child in remaining):
+        positions = set()
+        for child in remaining:
+            positions.update((d["x"], d["y"]) for d in iter_leaf_data(child))
+        if len(positions) <= leaf_capacity:
+            return _merge_chains(remaining)
+
+    return node
+
+
+def _skip(
+    levels: int, node: Union[list, dict], x0: float, y0: float, x1: float, y1: float
+) -> Union[list, dict]:
+    """
+    Put a compressed run of single-child levels above a node. Runs above a skip
+    node are merged into it.
+
+    Args:
+        levels (int): The number of single-child levels above the node
+        node (Union[list, dict]): An internal node or a skip node
+        x0 (float): The x coordinate of the node origin
+        y0 (float): The y coordinate of the node origin
+        x1 (float): The x coordinate of the node end
+        y1 (float): The y coordinate of the node end
+
+    Returns:
+        Union[list, dict]: The skip node, or the node itself without levels
+    """
+    if levels == 0:
+        return node
+    if "skip" in node:
+        return {
+            "skip": levels + node["skip"],
+            "extent": node["extent"],
+            "node": node["node"],
+        }
+    return {"skip": levels, "extent": [x0, y0, x1, y1], "node": node}
+
+
+def _expand_skip(
+    skip: dict, x0: float, y0: float, x1: float, y1: float
+) -> tuple[list, list, int]:
+    """
+    Create the run of single-child internal nodes of a skip node. The slot of
+    the node below the run is left empty.
+
+    Args:
+        skip (dict): The skip node
+        x0 (float): The x coordinate of the skip node origin
+        y0 (float): The y coordinate of the skip node origin
+        x1 (float): The x coordinate of the skip node end
+        y1 (float): The y coordinate of the skip node end
+
+    Returns:
+        tuple[list, list, int]: The first and the last internal node of the
+            run, and the quadrant of the node below the run in the last one
+    """
+    ex0, ey0 = skip["extent"][0], skip["extent"][1]
+    run = [[None, None, None, None] for _ in range(skip["skip"])]
+    quad = None
+
+    for i, node in enumerate(run):
+        if i > 0:
+            run[i - 1][quad] = node
+        quad = get_quadrant(ex0, ey0, (x0 + x1) / 2, (y0 + y1) / 2)
+        x0, y0, x1, y1 = get_quadrant_extents(x0, y0, x1, y1)[quad]
+
+    return run[0], run[-1], quad
+
+
+def _compress_subtree(
+    node: Union[list, dict, None], x0: float, y0: float, x1: float, y1: float
+) -> Union[list, dict, None]:
+    """
+    Replace every run of single-child internal nodes of a subtree with a skip
+    node.
+
+    Args:
+        node (Union[list, dict, None]): The root of the subtree
+        x0 (float): The x coordinate of the subtree origin
+        y0 (float): The y coordinate of the subtree origin
+        x1 (float): The x coordinate of the subtree end
+        y1 (float): The y coordinate of the subtree end
+
+    Returns:
+        Union[list, dict, None]: The new root of the subtree
+    """
+    if node is None or "data" in node:
+        return node
+
+    root, node, position = _compress_run(node, x0, y0, x1, y1)
+    stack = [(node, position)]
+
+    while len(stack) > 0:
+        node, position = stack.pop()
+        quad_positions = get_quadrant_extents(*position)
+        for quad in range(4):
+            child = node[quad]
+            if child is not None and "data" not in child:
+                node[quad], child, child_position = _compress_run(
+                    child, *quad_positions[quad]
+                )
+                stack.append((child, child_position))
+
+    return root
+
+
+def _compress_run(
+    node: list, x0: float, y0: float, x1: float, y1: float
+) -> tuple[Union[list, dict], list, tuple[float, float, float, float]]:
+    """
+    Compress the run of single-child internal nodes that starts at a node.
+
+    Returns:
+        tuple[Union[list, dict], list, tuple[float, float, float, float]]: The
+            node or skip node replacing the run, the first node below the run
+            and its cell
+    """
+    levels = 0
+    while True:
+        filled = [quad for quad in range(4) if node[quad] is not None]
+        if len(filled) != 1 or "data" in node[filled[0]]:
+            break
+        x0, y0, x1, y1 = get_quadrant_extents(x0, y0, x1, y1)[filled[0]]
+        node = node[filled[0]]
+        levels += 1
+
+    return _skip(levels, node, x0, y0, x1, y1), node, (x0, y0, x1, y1)
+
+
+def _expand_leaf(
+    leaf: dict, x0: float, y0: float, x1: float, y1: float
+) -> Union[list, dict]:
+    """
+    Copy a leaf chain into the layout of d3-quadtree. A bucket leaf becomes the
+    subtree of its cell that adding its points one by one creates.
+
+    Args:
+        leaf (dict): The head of the chain
+        x0 (float): The x coordinate of the leaf origin
+        y0 (float): The y coordinate of the leaf origin
+        x1 (float): The x coordinate of the leaf end
+        y1 (float): The y coordinate of the leaf end
+
+    Returns:
+        Union[list, dict]: The root of the new subtree
+    """
+    data = list(iter_leaf_data(leaf))
+    leaves = [{"data": d} for d in data]
+
+    if _count_positions(leaf, 1) == 1:
+        return _merge_chains(leaves)
+
+    # The chain is newest first, insert the points in their original order
+    leaves.reverse()
+    children, point_index, next_point, root_ref, _ = bulk_partition(
+        [d["x"] for d in reversed(data)],
+        [d["y"] for d in reversed(data)],
+        x0,
+        y0,
+        x1,
+        y1,
+    )
+    return nested_from_arrays(children, point_index, next_point, root_ref, leaves)
+
+
+def _count_positions(leaf: dict, limit: Union[int, None] = None) -> int:
+    """
+    Count the distinct positions in a leaf chain.
+
+    Args:
+        leaf (dict): The head of the chain
+        limit (int, optional): Stop counting once there are more positions.
+            Defaults to None.
+
+    Returns:
+        int: The number of distinct positions, at most limit + 1
+    """
+    positions = set()
+    for d in iter_leaf_data(leaf):
+        positions.add((d["x"], d["y"]))
+        if limit is not None and len(positions) > limit:
+            break
+    return len(positions)
+
+
+def _merge_chains(leaves: list[dict]) -> dict:
+    """
+    Link leaf chains into one chain, in the given order.
+
+    Args:
+        leaves (list[dict]): The heads of the chains
+
+    Returns:
+        dict: The head of the merged chain
+    """
+    for leaf, next_leaf in zip(leaves, leaves[1:]):
+        while "next" in leaf:
+            leaf = leaf["next"]
+        leaf["next"] = next_leaf
+    return leaves[0]
+
+
+def _split_bucket(
+    leaf: dict, x0: float, y0: float, x1: float, y1: float, leaf_capacity: int
+) -> tuple[list, int, int]:
+    """
+    Split a bucket leaf with more than leaf_capacity distinct positions into
+    quadrants, until every new leaf fits. The chain of every new leaf keeps the
+    order of the bucket, newest first.
+
+    Args:
+        leaf (dict): The head of the bucket chain
+        x0 (float): The x coordinate of the bucket origin
+        y0 (float): The y coordinate of the bucket origin
+        x1 (float): The x coordinate of the bucket end
+        y1 (float): The y coordinate of the bucket end
+        leaf_capacity (int): The maximum number of distinct positions in a leaf
+
+    Returns:
+        tuple[list, int, int]: The new internal node, the number of levels
+            below the bucket of its deepest new leaf, and the number of new
+            internal nodes
+    """
+    xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+    groups = [[], [], [], []]
+    while leaf is not None:
+        groups[get_quadrant(leaf["data"]["x"], leaf["data"]["y"], xm, ym)].append(leaf)
+        leaf = leaf.pop("next", None)
+
+    node = [None, None, None, None]
+    levels, splits = 1, 1
+    extents = get_quadrant_extents(x0, y0, x1, y1)
+
+    for quad, group in enumerate(groups):
+        if len(group) == 0:
+            continue
+
+        child = _merge_chains(group)
+        if _count_positions(child, leaf_capacity) > leaf_capacity:
+            child, child_levels, child_splits = _split_bucket(
+                child, *extents[quad], leaf_capacity
+            )
+            levels = max(levels, child_levels + 1)
+            splits += child_splits
+        node[quad] = child
+
+    return node, levels, splits
+
+
+def _remove_from_chain(leaf: dict, data: list[dict]) -> Union[dict, None]:
+    """
+    Remove data entries from a chain of coincident points. Each data entry
+    removes the newest remaining entry that is or equals it.
+
+    Args:
+        leaf (dict): The head of the chain
+        data (list[dict]): The data entries to remove
+
+    Returns:
+        Union[dict, None]: The new head of the chain
+    """
+    if "count" in leaf:
+        entries = list(iter_leaf_data(leaf))
+        kept = list(entries)
+        for d in data:
+            for i, entry in enumerate(kept):
+                if entry is d or entry == d:
+                    del kept[i]
+                    break
+
+        if len(kept) == len(entries):
+            return leaf
+        return _counted_leaf(kept) if kept else None
+
+    chain = []
+    while leaf is not None:
+        chain.append(leaf)
+        leaf = leaf.get("next")
+
+    kept = list(chain)
+    for d in data:
+        for i, entry in enumerate(kept):
+            if entry["data"] is d or entry["data"] == d:
+                del kept[i]
+                break
+
+    if len(kept) == len(chain):
+        return chain[0]
+
+    for entry in chain:
+        entry.pop("next", None)
+
+    for entry, next_entry in zip(kept, kept[1:]):
+        entry["next"] = next_entry
+
+    return kept[0] if kept else None
+
+
+def _add_duplicate(leaf: dict, d: dict):
+    """
+    Add a coincident data entry to a leaf in place, as its newest entry.
+
+    Args:
+        leaf (dict): A leaf without "next"
+        d (dict): The new data entry
+    """
+    if "count" in leaf:
+        leaf["duplicates"].append(leaf["data"])
+        leaf["count"] += 1
+    else:
+        leaf["count"] = 2
+        leaf["duplicates"] = [leaf["data"]]
+    leaf["data"] = d
+
+
+def _counted_leaf(entries: list[dict]) -> dict:
+    """
+    Create a counted leaf of coincident data entries.
+
+    Args:
+        entries (list[dict]): The data entries, newest first
+
+    Returns:
+        dict: The leaf, a plain {"data": ...} leaf for a single entry
+    """
+    leaf = {"data": entries[0]}
+    if len(entries) > 1:
+        leaf["count"] = len(entries)
+        leaf["duplicates"] = entries[:0:-1]
+    return leaf
+
+
+def _count_duplicates(node: Union[list, dict, None]):
+    """
+    Replace the chains of coincident points of a subtree by counted leaves, in
+    place. The heads of the chains become the counted leaves.
+
+    Args:
+        node (Union[list, dict, None]): The root of the subtree, without skip
+            nodes
+    """
+    stack = [node] if node is not None else []
+
+    while len(stack) > 0:
+        cur_node = stack.pop()
+
+        if "data" not in cur_node:
+            stack.extend(child for child in cur_node if child is not None)
+        elif "next" in cur_node:
+            entries = list(iter_leaf_data(cur_node))
+            del cur_node["next"]
+            cur_node["count"] = len(entries)
+            cur_node["duplicates"] = entries[:0:-1]
+
+
+def _round_floats(value, precision: int):
+    """
+    Round all floats in a JSON-like value to `precision` significant digits.
+    """
+    if isinstance(value, float):
+        return float(format(value, f".{precision}g"))
+    if isinstance(value, Mapping):
+        return {k: _round_floats(v, precision) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_round_floats(v, precision) for v in value]
+    return value
+
+
+def _summarize_subtree(
+    node: Union[list, dict],
+    limit: Union[int, None],
+    sample: Union[int, None],
+    rng: random.Random,
+) -> Union[tuple[int, int, float, float, list[dict]], None]:
+    """
+    Count the points and nodes of a subtree, sum their coordinates and collect
+    (a reservoir sample of) their data entries.
+
+    Args:
+        node (Union[list, dict]): The root of the subtree
+        limit (int, optional): Give up once the subtree has more points
+        sample (int, optional): The reservoir size, None keeps all data entries
+        rng (random.Random): The random generator for sampling
+
+    Returns:
+        Union[tuple[int, int, float, float, list[dict]], None]: (number of
+            points, number of nodes, sum of x, sum of y, data entries), or None
+            if the subtree has more than `limit` points
+    """
+    size, n_nodes, sum_x, sum_y = 0, 0, 0, 0
+    data = []
+    stack = [node]
+
+    while len(stack) > 0:
+        cur_node = stack.pop()
+        n_nodes += 1
+
+        if "data" not in cur_node:
+            stack.extend(c for c in reversed(cur_node) if c is not None)
+            continue
+
+        for d in iter_leaf_data(cur_node):
+            size += 1
+            if limit is not None and size > limit:
+                return None
+
+            sum_x += d["x"]
+            sum_y += d["y"]
+
+            if sample is None or len(data) < sample:
+                data.append(d)
+            else:
+                # Reservoir sampling: keep each point with probability sample/size
+                slot = rng.randrange(size)
+                if slot < sample:
+                    data[slot] = d
+
+    return size, n_nodes, sum_x, sum_y, data
+
+
+def _subtree_shape(node: Union[list, dict]) -> tuple[int, int]:
+    """
+    Measure a subtree as get_node_representation() does, where every leaf has
+    size 1 and height 0. Skip nodes count as their runs of internal nodes.
+
+    Args:
+        node (Union[list, dict]): The root of the subtree
+
+    Returns:
+        tuple[int, int]: The size and the height
+    """
+    if "data" in node:
+        return 1, 0
+
+    size, height = 0, 0
+
+    # Each item in the stack is (internal or skip node, depth below the subtree
+    # root), leaves are counted when their parent is visited
+    stack = [(node, 0)]
+    while len(stack) > 0:
+        cur_node, depth = stack.pop()
+        if type(cur_node) is dict:
+            cur_node, depth = [cur_node["node"]], depth + cur_node["skip"] - 1
+
+        depth += 1
+        for child in cur_node:
+            if child is None:
+                continue
+            if type(child) is dict and "data" in child:
+                size += 1
+                if depth > height:
+                    height = depth
+            else:
+                stack.append((child, depth))
+
+    return size, height
+
+
+class NodeRecord(NamedTuple):
+    """
+    A flat record of a Node, see Quadtree.iter_nodes().
+    """
+
+    nid: int
+    level: int
+    # A list of 4 items: [x0, y0, x1, y1]
+    position: list[float]
+    size: int
+    height: int
+    data: list[dict]
+
+
+# The NumPy dtype of the node record batches from Quadtree.iter_node_batches()
+NODE_RECORD_DTYPE = np.dtype(
+    [
+        ("nid", np.int64),
+        ("level", np.int32),
+        ("x0", np.float64),
+        ("y0", np.float64),
+        ("x1", np.float64),
+        ("y1", np.float64),
+        ("size", np.int64),
+        ("height", np.int32),
+    ]
+)
+
+
+class Tile(NamedTuple):
+    """
+    A level-of-detail tile of a Quadtree, see Quadtree.iter_tiles().
+    """
+
+    nid: int
+    level: int
+    # A list of 4 items: [x0, y0, x1, y1]
+    position: list[float]
+    size: int
+    # The centroid of all points in the tile
+    cx: float
+    cy: float
+    data: list[dict]
+
+
+class Node:
+    """
+    An object-based representation of a Quadtree.
+    """
+
+    def __init__(self, nid: int, level: int, position: list[int]):
+        self.children: list[Node] = []
+        self.size = 0
+        self.height = 0
+        self.level = level
+        self.data = []
+        self.nid = nid
+        # A list of 4 items: [x0, y0, x1, y1]
+        self.position = position
+
+    def __str__(self):
+        children_num = len([c for c in self.children if c is not None])
+
+        data_string = f"{self.data}"
+        if len(self.data) > 1:
+            data_string = f"[{self.data[0]}...]"
+
+        return (
+            f"Node(children={children_num}, size={self.size}, "
+            + f"height={self.height}, level={self.level}, data={data_string}, "
+            + f"id={self.nid})"
         )
 
     def __repr__(self):
         return self.__str__()
+
+
+class NodeView:
+    """
+    A lazy view of a Quadtree node with the attributes of Node, see
+    Quadtree.get_node_representation(lazy=True). The children are created from
+    the nested-list structure on first access. The size and height of a node
+    are computed from one walk of each child subtree and memoized on the child
+    views, so reading them costs O(subtree) once per node and nothing for the
+    children afterwards. The id is read from the node table of the cached array
+    snapshot, so the first id read after the tree changes rebuilds the snapshot
+    in O(n). The view reads the tree, so it is only valid until the tree
+    changes.
+    """
+
+    __slots__ = (
+        "level",
+        "position",
+        "_node",
+        "_tree",
+        "_parent",
+        "_quad",
+        "_nid",
+        "_children",
+        "_shape",
+    )
+
+    def __init__(
+        self,
+        node: Union[list, dict, None],
+        level: int,
+        position: list[float],
+        tree: Quadtree,
+        parent: Union["NodeView", None] = None,
+        quad: Union[int, None] = None,
+    ):
+        self.level = level
+        # A list of 4 items: [x0, y0, x1, y1]
+        self.position = position
+        self._node = node
+        self._tree = tree
+        self._parent = parent
+        self._quad = quad
+        self._nid = 0 if parent is None else None
+        self._children = None
+        self._shape = None
+
+    @property
+    def children(self) -> list[Union["NodeView", None]]:
+        """The four children of an internal node, None for empty quadrants."""
+        if self._children is None:
+            node = self._node
+            if node is None or "data" in node:
+                self._children = []
+            else:
+                x0, y0, x1, y1 = self.position
+                quad_positions = get_quadrant_extents(x0, y0, x1, y1)
+                if "skip" in node:
+                    # A skip node is the first node of its run
+                    quads = [None, None, None, None]
+                    quad = get_quadrant(
+                        node["extent"][0],
+                        node["extent"][1],
+                        (x0 + x1) / 2,
+                        (y0 + y1) / 2,
+                    )
+                    quads[quad] = node["node"]
+                    if node["skip"] > 1:
+                        quads[quad] = dict(node, skip=node["skip"] - 1)
+                    node = quads
+
+                self._children = [
+                    (
+                        None
+                        if node[quad] is None
+                        else NodeView(
+                            node[quad],
+                            self.level + 1,
+                            list(quad_positions[quad]),
+                            self._tree,
+                            self,
+                            quad,
+                        )
+                    )
+                    for quad in range(4)
+                ]
+        return self._children
+
+    @property
+    def data(self) -> list[dict]:
+        """The data entry of a leaf in a list, empty for internal nodes."""
+        if self._node is not None and "data" in self._node:
+            return [self._node["data"]]
+        return []
+
+    @property
+    def size(self) -> int:
+        """The number of leaves in the subtree."""
+        return self._get_shape()[0]
+
+    @property
+    def height(self) -> int:
+        """The height of the subtree, 0 for leaves."""
+        return self._get_shape()[1]
+
+    @property
+    def nid(self) -> int:
+        """The pre-order id of the node, the same as Node.nid."""
+        if self._nid is None:
+            table = self._tree._array_snapshot().node_table()
+            self._nid = int(table.children[self._parent.nid, self._quad])
+        return self._nid
+
+    def _get_shape(self) -> tuple[int, int]:
+        if self._shape is None:
+            node = self._node
+            if node is None:
+                self._shape = (0, 0)
+            elif "data" in node:
+                self._shape = (1, 0)
+            else:
+                # Fold the children, which keep their shapes for later reads
+                children = [c for c in self.children if c is not None]
+                for child in children:
+                    if child._shape is None:
+                        child._shape = _subtree_shape(child._node)
+                self._shape = (
+                    sum(c._shape[0] for c in children),
+                    1 + max(c._shape[1] for c in children),
+                )
+        return self._shape
+
+    __str__ = Node.__str__
+    __repr__ = Node.__repr__
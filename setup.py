@@ -7,7 +7,11 @@ from setuptools import setup, find_packages
 with open("README.md") as readme_file:
     readme = readme_file.read()
 
-requirements = ["tqdm", "numpy"]
+requirements = ["numpy"]
+
+extra_requirements = {
+    "progress": ["tqdm"],
+}
 
 test_requirements = [
     "pytest>=3",
@@ -29,6 +33,7 @@ setup(
     ],
     description="Quadtree implementation in Python following the d3-quadtree's structure",
     install_requires=requirements,
+    extras_require=extra_requirements,
     license="MIT license",
     long_description=readme,
     long_description_content_type="text/markdown",
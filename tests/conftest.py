@@ -0,0 +1,20 @@
+"""Shared fixtures for the `quadtreed3` tests."""
+
+import numpy as np
+import pytest
+
+from quadtreed3 import Quadtree
+
+
+@pytest.fixture
+def n_points():
+    # Modules override this fixture to change the size of `quadtree`
+    return 300
+
+
+@pytest.fixture
+def quadtree(n_points):
+    rng = np.random.default_rng(0)
+    xs = np.round(rng.normal(size=n_points) * 5, 1)
+    ys = np.round(rng.normal(size=n_points) * 5, 1)
+    return Quadtree().add_all(xs, ys)
@@ -0,0 +1,30 @@
+"""Helpers shared by the `quadtreed3` tests."""
+
+from quadtreed3 import Quadtree
+
+
+def as_points(xs, ys):
+    # Data entries of the coordinates, numbered in order by "i"
+    return [
+        {"x": float(x), "y": float(y), "i": i} for i, (x, y) in enumerate(zip(xs, ys))
+    ]
+
+
+def build(points, extent=None, **options):
+    # Points are added one by one, without an extent it grows with cover()
+    tree = Quadtree(**options)
+    if extent is not None:
+        tree.extent(*extent)
+    for d in points:
+        tree.add(d["x"], d["y"], d)
+    return tree
+
+
+def get_nodes(quadtree: Quadtree, lazy: bool = False):
+    # All nodes of the node representation in pre-order
+    nodes, stack = [], [quadtree.get_node_representation(lazy)]
+    while len(stack) > 0:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(c for c in reversed(node.children) if c is not None)
+    return nodes
@@ -2,6 +2,11 @@
 
 """Tests for `quadtreed3` package."""
 
+from json import dumps
+
+import numpy as np
+import pytest
+
 from quadtreed3 import Quadtree
 
 
@@ -182,3 +187,49 @@ def test_random_extent_before_add_all():
             None,
         ],
     ]
+
+
+def test_add_all_same_as_add():
+    rng = np.random.default_rng(0)
+    xs = np.round(rng.normal(size=200), 1)
+    ys = np.round(rng.normal(size=200), 1)
+
+    q = Quadtree().extent([xs.min(), ys.min()], [xs.max(), ys.max()])
+    for i, _ in enumerate(xs):
+        q.add(xs[i], ys[i])
+
+    assert Quadtree().add_all(xs, ys).root == q.root
+
+
+def test_add_all_coincident():
+    q = Quadtree().add_all([0.5, 0.5, 0.5], [0.5, 0.5, 0.5], [{}, {"i": 1}, {"i": 2}])
+    assert q.root == {
+        "data": {"i": 2},
+        "next": {"data": {"i": 1}, "next": {"data": {"x": 0.5, "y": 0.5}}},
+    }
+
+
+@pytest.mark.parametrize("workers", [2, 5])
+def test_add_all_workers_same_as_serial(workers):
+    rng = np.random.default_rng(workers)
+    xs = np.round(rng.normal(size=3000), 2)
+    ys = np.round(rng.normal(size=3000), 2)
+    data = [{"x": x, "y": y, "i": i} for i, (x, y) in enumerate(zip(xs, ys))]
+
+    serial = Quadtree().add_all(xs, ys, data)
+    parallel = Quadtree().add_all(xs, ys, data, workers=workers)
+    assert dumps(parallel.root) == dumps(serial.root)
+
+
+def test_add_all_workers_few_cells():
+    # Both points fall into cells deep below the root, and coincident points
+    # end up in a single leaf
+    serial = Quadtree().add_all([0, 0.01, 0.01], [0, 0.01, 0.01])
+    parallel = Quadtree().add_all([0, 0.01, 0.01], [0, 0.01, 0.01], workers=4)
+    assert parallel.root == serial.root
+
+    parallel = Quadtree().add_all([0.5, 0.5], [0.5, 0.5], workers=4)
+    assert parallel.root == {
+        "data": {"x": 0.5, "y": 0.5},
+        "next": {"data": {"x": 0.5, "y": 0.5}},
+    }
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+import pytest
+from quadtreed3 import Quadtree
+
+
+def subtree_data(node):
+    stack, data = [node], []
+    while len(stack) > 0:
+        cur = stack.pop()
+        data.extend(cur.data)
+        stack.extend(c for c in cur.children if c is not None)
+    return data
+
+
+def test_aggregates_simple():
+    q = Quadtree().add_all([0, 0.9, 0.9, 0.0, 0.4], [0, 0.9, 0, 0.9, 0.4])
+    agg = q.aggregates()
+    assert agg.count.tolist() == [5, 2, 1, 1, 1, 1, 1]
+    assert agg.cx[0] == pytest.approx(0.44)
+    assert agg.cy[1] == pytest.approx(0.2)
+    assert [agg.x0[1], agg.y0[1], agg.x1[1], agg.y1[1]] == [0, 0, 0.4, 0.4]
+
+
+def test_aggregates_reductions():
+    rng = np.random.default_rng(0)
+    data = [
+        {"x": float(x), "y": float(y), "w": float(w)}
+        for x, y, w in rng.normal(size=(100, 3))
+    ]
+    q = Quadtree().add_all_data(data)
+    q.add_reduction("total", "w").add_reduction("lightest", "w", "min")
+    agg = q.aggregates()
+    assert q.aggregates() is agg
+
+    stack = [q.get_node_representation()]
+    while len(stack) > 0:
+        node = stack.pop()
+        weights = [d["w"] for d in subtree_data(node)]
+        assert agg.count[node.nid] == len(weights)
+        assert agg.reductions["total"][node.nid] == pytest.approx(sum(weights))
+        assert agg.reductions["lightest"][node.nid] == min(weights)
+        stack.extend(c for c in node.children if c is not None)
+
+    q.add(0.5, 0.5, {"x": 0.5, "y": 0.5, "w": 1.0})
+    assert q.aggregates().count[0] == 101
+
+
+def test_aggregates_unknown_reduction():
+    with pytest.raises(ValueError):
+        Quadtree().add_reduction("median", "w", "median")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+from quadtreed3 import ArrayQuadtree, Quadtree
+
+
+def test_array_add_simple():
+    q = ArrayQuadtree()
+
+    assert q.add(0, 0).root == {"data": {"x": 0, "y": 0}}
+    assert q.add(0.9, 0.9).root == [
+        {"data": {"x": 0, "y": 0}},
+        None,
+        None,
+        {"data": {"x": 0.9, "y": 0.9}},
+    ]
+    assert q.add(0.4, 0.4).add(0.4, 0.4).root == [
+        [
+            {"data": {"x": 0, "y": 0}},
+            None,
+            None,
+            {"data": {"x": 0.4, "y": 0.4}, "next": {"data": {"x": 0.4, "y": 0.4}}},
+        ],
+        None,
+        None,
+        {"data": {"x": 0.9, "y": 0.9}},
+    ]
+    assert q.children.shape == (2, 4)
+    assert q.point_index.dtype == np.int32
+
+
+def test_array_cover():
+    q = ArrayQuadtree().cover(0, 0).cover(2, 2).cover(-1, -1)
+    assert q.extent() == [[-4, -4], [4, 4]]
+
+
+def test_array_add_all_same_as_quadtree():
+    rng = np.random.default_rng(0)
+    xs = np.round(rng.normal(size=200), 1)
+    ys = np.round(rng.normal(size=200), 1)
+
+    q = Quadtree().add_all(xs, ys)
+    a = ArrayQuadtree().add_all(xs, ys)
+    assert a.extent() == q.extent()
+    assert a.root == q.root
+
+
+def test_array_round_trip():
+    data = [{"x": 0.4, "y": 0.4, "i": 0}, {"x": 0, "y": 0, "i": 1}]
+    q = Quadtree().add_all_data(data).add(0.9, 0.9)
+    a = q.to_array()
+    assert a.root == q.root
+    assert a.to_quadtree().root == q.root
+    assert a.to_quadtree().extent() == q.extent()
+
+
+def test_node_table_matches_node_representation():
+    q = Quadtree().add_all([0, 0.9, 0.9, 0.0, 0.4, 0.4], [0, 0.9, 0, 0.9, 0.4, 0.4])
+    table = q.to_array().node_table()
+
+    stack = [q.get_node_representation()]
+    while len(stack) > 0:
+        node = stack.pop()
+        assert table.level[node.nid] == node.level
+        assert table.height[node.nid] == node.height
+        assert table.x0[node.nid] == node.position[0]
+        assert table.y1[node.nid] == node.position[3]
+        stack.extend(c for c in node.children if c is not None)
+
+    assert table.size.tolist() == [6, 3, 1, 2, 1, 1, 1]
+    assert table.order.tolist() == list(range(6))
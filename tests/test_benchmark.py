@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import copy
+import json
+
+import numpy as np
+import pytest
+
+from benchmarks.benchmark import (
+    CASES,
+    DISTRIBUTIONS,
+    compare_results,
+    main,
+    run_benchmarks,
+)
+
+
+@pytest.mark.parametrize("distribution", list(DISTRIBUTIONS))
+def test_distributions(distribution):
+    xs, ys = DISTRIBUTIONS[distribution](1001, np.random.default_rng(0))
+    assert len(xs) == len(ys) == 1001
+    assert np.all(np.isfinite(xs)) and np.all(np.isfinite(ys))
+
+    # Data sets only depend on the seed
+    xs2, ys2 = DISTRIBUTIONS[distribution](1001, np.random.default_rng(0))
+    assert np.array_equal(xs, xs2) and np.array_equal(ys, ys2)
+
+
+def test_run_benchmarks():
+    results = run_benchmarks([200, 300], ["uniform", "outliers"], list(CASES), 1)
+    assert json.loads(json.dumps(results)) == results
+    assert len(results["results"]) == 2 * 2 * len(CASES)
+
+    for record in results["results"]:
+        assert record["time"] > 0
+        assert record["peak_memory"] >= 0
+        assert record["depth"] > 0
+        assert record["leaf_nodes"] == record["size"]
+        assert record["internal_nodes"] > 0
+
+
+def test_compare_results(tmp_path):
+    baseline = run_benchmarks([500], ["clusters"], ["add_all", "add"], 1)
+    assert compare_results(baseline, baseline) == []
+
+    current = copy.deepcopy(baseline)
+    current["results"][0]["time"] = baseline["results"][0]["time"] * 2 + 1
+    current["results"][1]["depth"] += 1
+    regressions = compare_results(baseline, current)
+    assert [(r["case"], r["metric"]) for r in regressions] == [
+        ("add_all", "time"),
+        ("add", "depth"),
+    ]
+
+    paths = [str(tmp_path / "baseline.json"), str(tmp_path / "current.json")]
+    for path, results in zip(paths, [baseline, current]):
+        with open(path, "w", encoding="utf8") as fp:
+            json.dump(results, fp)
+    assert main(["compare", paths[0], paths[0]]) == 0
+    assert main(["compare"] + paths) == 1
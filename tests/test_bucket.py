@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import io
+from json import dumps
+
+import numpy as np
+import pytest
+
+from quadtreed3 import ArrayQuadtree, Quadtree
+
+from .helpers import as_points, build
+
+
+def clustered_points(seed, n=400):
+    # Tight clusters with duplicates, plus uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, 10, (4, 2))
+    xs = np.concatenate(
+        [centers[rng.integers(0, 4, n // 2), 0] + rng.normal(0, 1e-6, n // 2)]
+        + [rng.integers(0, 40, n // 2) / 4]
+    )
+    ys = np.concatenate(
+        [centers[rng.integers(0, 4, n // 2), 1] + rng.normal(0, 1e-6, n // 2)]
+        + [rng.integers(0, 40, n // 2) / 4]
+    )
+    order = rng.permutation(n)
+    return as_points(xs[order], ys[order])
+
+
+def bounds(points):
+    return [
+        [min(d["x"] for d in points), min(d["y"] for d in points)],
+        [max(d["x"] for d in points), max(d["y"] for d in points)],
+    ]
+
+
+def max_depth(node):
+    if node is None or "data" in node:
+        return 0
+    return 1 + max(max_depth(child) for child in node)
+
+
+def test_leaf_capacity_bucket():
+    tree = Quadtree(leaf_capacity=3)
+    tree.add_all([0, 1, 1], [0, 0, 1])
+    assert tree.root == {
+        "data": {"x": 1, "y": 1},
+        "next": {"data": {"x": 1, "y": 0}, "next": {"data": {"x": 0, "y": 0}}},
+    }
+
+    # Coincident points do not count towards the capacity
+    tree.add(1, 1)
+    assert "data" in tree.root
+
+    # The fourth position splits the bucket
+    tree.add(0, 1)
+    assert tree.root == [
+        {"data": {"x": 0, "y": 0}},
+        {"data": {"x": 1, "y": 0}},
+        {"data": {"x": 0, "y": 1}},
+        {"data": {"x": 1, "y": 1}, "next": {"data": {"x": 1, "y": 1}}},
+    ]
+
+
+def test_leaf_capacity_invalid():
+    with pytest.raises(ValueError):
+        Quadtree(leaf_capacity=0)
+
+
+@pytest.mark.parametrize("leaf_capacity", [2, 4, 16])
+def test_bucket_bulk_equals_add(leaf_capacity):
+    points = clustered_points(leaf_capacity)
+    xs = [d["x"] for d in points]
+    ys = [d["y"] for d in points]
+
+    bulk = Quadtree(leaf_capacity).add_all(xs, ys, points)
+    added = build(points, bounds(points), leaf_capacity=leaf_capacity)
+    assert dumps(bulk.root) == dumps(added.root)
+
+    parallel = Quadtree(leaf_capacity).add_all(xs, ys, points, workers=2)
+    assert dumps(parallel.root) == dumps(bulk.root)
+
+
+@pytest.mark.parametrize("leaf_capacity", [2, 8])
+def test_bucket_expanded(leaf_capacity):
+    points = clustered_points(10 + leaf_capacity)
+    xs = [d["x"] for d in points]
+    ys = [d["y"] for d in points]
+
+    classic = Quadtree().add_all(xs, ys, points)
+    bucketed = Quadtree(leaf_capacity).add_all(xs, ys, points)
+    assert max_depth(bucketed.root) < max_depth(classic.root)
+
+    expanded = bucketed.expanded()
+    assert expanded.leaf_capacity == 1
+    assert expanded.extent() == classic.extent()
+    assert dumps(expanded.root) == dumps(classic.root)
+
+    fp = io.StringIO()
+    bucketed.dump_d3_json(fp, expand=True)
+    assert fp.getvalue() == dumps(classic.root, separators=(",", ":"))
+
+    # The bucketed tree itself is not changed
+    assert dumps(bucketed.root) == dumps(
+        Quadtree(leaf_capacity).add_all(xs, ys, points).root
+    )
+
+
+def test_bucket_queries():
+    points = clustered_points(3)
+    xs = [d["x"] for d in points]
+    ys = [d["y"] for d in points]
+    classic = Quadtree().add_all(xs, ys, points)
+    bucketed = Quadtree(leaf_capacity=6).add_all(xs, ys, points)
+    array = bucketed.to_array()
+
+    def ids(data):
+        return sorted(d["i"] for d in data)
+
+    rects = [(0, 0, 5, 5), (2.5, 1, 7.25, 9), (-1, -1, 11, 11)]
+    for rect in rects:
+        expected = ids(classic.query_rect(*rect))
+        assert ids(bucketed.query_rect(*rect)) == expected
+        assert ids(array.data[p] for p in array.query_rect(*rect)) == expected
+    assert [ids(r) for r in bucketed.query_rect_batch(rects)] == [
+        ids(r) for r in classic.query_rect_batch(rects)
+    ]
+
+    def dist(d, x, y):
+        return (d["x"] - x) ** 2 + (d["y"] - y) ** 2
+
+    for x, y in [(1.3, 4.2), (5, 5), (9.9, 0.1)]:
+        expected = [dist(d, x, y) for d in classic.knn(x, y, 7)]
+        assert [dist(d, x, y) for d in bucketed.knn(x, y, 7)] == expected
+        assert [dist(array.data[p], x, y) for p in array.knn(x, y, 7)] == expected
+        assert dist(bucketed.find(x, y), x, y) == expected[0]
+
+
+def test_bucket_remove():
+    points = clustered_points(7, 200)
+    tree = build(points, [[0, 0], [16, 16]], leaf_capacity=4)
+
+    removed, kept = points[::2], points[1::2]
+    for d in removed[:50]:
+        tree.remove(d)
+    tree.remove_all(removed[50:])
+
+    # The collapsed buckets expand to the tree of the remaining points
+    assert sorted(d["i"] for d in tree.data()) == [d["i"] for d in kept]
+    rebuilt = build(kept, [[0, 0], [16, 16]])
+    assert dumps(tree.expanded().root) == dumps(rebuilt.root)
+
+    for d in kept:
+        tree.remove(d)
+    assert tree.root is None
+
+
+def test_bucket_update():
+    points = clustered_points(5, 100)
+    tree = build(points, [[0, 0], [16, 16]], leaf_capacity=4)
+    moved = points[:30]
+    tree.update_many(
+        [(d["x"], d["y"]) for d in moved],
+        [(15 - d["x"], 15 - d["y"]) for d in moved],
+        moved,
+    )
+
+    rebuilt = build(points[30:] + moved, [[0, 0], [16, 16]])
+    assert dumps(tree.expanded().root) == dumps(rebuilt.root)
+
+
+def test_bucket_array_round_trip(tmp_path):
+    points = clustered_points(9, 100)
+    xs = [d["x"] for d in points]
+    ys = [d["y"] for d in points]
+    tree = Quadtree(leaf_capacity=5).add_all(xs, ys, points)
+
+    path = str(tmp_path / "tree.qt")
+    tree.save(path)
+    loaded = ArrayQuadtree.load(path)
+    assert loaded.leaf_capacity == 5
+
+    copy = loaded.to_quadtree()
+    assert copy.leaf_capacity == 5
+    assert dumps(copy.root) == dumps(tree.root)
+
+    with pytest.raises(ValueError):
+        loaded.add(1, 1)
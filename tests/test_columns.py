@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import io
+from json import dumps, loads
+
+import numpy as np
+import pytest
+
+from quadtreed3 import ArrayQuadtree, Quadtree
+from quadtreed3.columns import ColumnTable, Row
+
+
+@pytest.fixture
+def columns():
+    rng = np.random.default_rng(0)
+    n = 200
+    xs = np.round(rng.uniform(0, 10, n), 1)
+    ys = np.round(rng.uniform(0, 10, n), 1)
+    table = {
+        "id": np.arange(n),
+        "weight": rng.uniform(0, 1, n),
+        "label": np.array([f"p{i}" for i in range(n)]),
+    }
+    records = [
+        {
+            "id": i,
+            "weight": float(table["weight"][i]),
+            "label": f"p{i}",
+            "x": float(xs[i]),
+            "y": float(ys[i]),
+        }
+        for i in range(n)
+    ]
+    return xs, ys, table, records
+
+
+def test_row():
+    table = ColumnTable(
+        {"a": np.array([1, 2]), "b": np.array([0.5, 1.5])}, [0, 1], [2, 3]
+    )
+    row = Row(table, 1)
+    assert row["a"] == 2 and isinstance(row["a"], int)
+    assert dict(row) == {"a": 2, "b": 1.5, "x": 1.0, "y": 3.0}
+    assert row == {"a": 2, "b": 1.5, "x": 1.0, "y": 3.0}
+    assert row != Row(table, 0)
+
+    row["x"] = 4
+    assert table.columns["x"].tolist() == [0, 4]
+    with pytest.raises(KeyError):
+        row["c"] = 1
+
+    with pytest.raises(ValueError):
+        ColumnTable({"a": np.arange(3)}, [0, 1], [2, 3])
+
+
+@pytest.mark.parametrize("structured", [False, True])
+def test_columnar_add_all(columns, structured):
+    xs, ys, table, records = columns
+    if structured:
+        array = np.zeros(
+            len(xs), dtype=[("id", "i8"), ("weight", "f8"), ("label", "U8")]
+        )
+        for name in table:
+            array[name] = table[name]
+        table = array
+
+    classic = Quadtree().add_all(xs, ys, records)
+    tree = Quadtree().add_all(xs, ys, table)
+
+    # Leaves hold lazy rows, the exports write the same JSON
+    leaf = tree.data()[0]
+    assert isinstance(leaf, Row)
+    assert tree.data() == classic.data()
+
+    fp, classic_fp = io.StringIO(), io.StringIO()
+    tree.dump_d3_json(fp, precision=4)
+    classic.dump_d3_json(classic_fp, precision=4)
+    assert loads(fp.getvalue()) == loads(classic_fp.getvalue())
+
+    assert tree.get_node_representation().children[0].data is not None
+    assert [d["id"] for d in tree.query_rect(2, 2, 5, 5)] == [
+        d["id"] for d in classic.query_rect(2, 2, 5, 5)
+    ]
+
+    # Points added to a non-empty tree also get rows
+    more = Quadtree().add(0, 0).add_all(xs, ys, table)
+    assert sorted(d["id"] for d in more.data() if "id" in d) == list(range(len(xs)))
+
+
+def test_columnar_array(columns, tmp_path):
+    xs, ys, table, records = columns
+    tree = ArrayQuadtree().add_all(xs, ys, table)
+    classic = ArrayQuadtree().add_all(xs, ys, records)
+
+    assert np.array_equal(tree.get_field("weight"), classic.get_field("weight"))
+    assert np.array_equal(
+        tree.aggregates({"w": ("weight", "sum")}).reductions["w"],
+        classic.aggregates({"w": ("weight", "sum")}).reductions["w"],
+    )
+
+    path = str(tmp_path / "tree.qt")
+    tree.save(path)
+    assert ArrayQuadtree.load(path).data == loads(dumps(records))
+
+
+def test_columnar_update(columns):
+    xs, ys, table, records = columns
+    tree = Quadtree().add_all(xs, ys, table)
+    classic = Quadtree().add_all(xs, ys, records)
+
+    moved = [(float(xs[i]), float(ys[i])) for i in range(0, 200, 7)]
+    new = [(x + 0.05, 9.9 - y) for x, y in moved]
+    tree.update_many(moved, new, [tree.data()[0]] + [None] * (len(moved) - 1))
+    classic.update_many(moved, new, [classic.data()[0]] + [None] * (len(moved) - 1))
+    assert tree.data() == classic.data()
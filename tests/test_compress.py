@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import io
+from json import dumps
+
+import numpy as np
+import pytest
+
+from quadtreed3 import Quadtree
+
+from .helpers import as_points, build
+
+
+def close_points(seed, n=300):
+    # Pairs of points that separate deep in the tree, plus uniform noise
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(-20, 20, n)
+    ys = rng.uniform(-20, 20, n)
+    xs[1::3] = xs[::3][: len(xs[1::3])] + rng.normal(0, 1e-9, len(xs[1::3]))
+    ys[1::3] = ys[::3][: len(ys[1::3])]
+    xs[2::7] = xs[::7][: len(xs[2::7])]
+    ys[2::7] = ys[::7][: len(ys[2::7])]
+    return as_points(xs, ys)
+
+
+def count_internal(node):
+    if node is None or "data" in node:
+        return 0
+    if "skip" in node:
+        return count_internal(node["node"])
+    return 1 + sum(count_internal(child) for child in node)
+
+
+def test_compress_skip():
+    tree = Quadtree(compress=True)
+    tree.add_all([0, 1e-12], [0, 0])
+    assert tree.root == {
+        "skip": 39,
+        "extent": [0, 0, 2**-39, 2**-39],
+        "node": [
+            {"data": {"x": 0, "y": 0}},
+            {"data": {"x": 1e-12, "y": 0}},
+            None,
+            None,
+        ],
+    }
+
+    # A point that leaves the run splits it into two skip nodes
+    tree.add(0, 0.5**20)
+    assert tree.root["skip"] == 19
+    split = tree.root["node"]
+    assert split[2] == {"data": {"x": 0, "y": 0.5**20}}
+    assert split[0]["skip"] == 19
+    assert split[0]["node"] is tree.root["node"][0]["node"]
+
+    classic = Quadtree().add_all([0, 1e-12], [0, 0]).add(0, 0.5**20)
+    assert tree.uncompressed_root() == classic.root
+
+
+@pytest.mark.parametrize("leaf_capacity", [1, 3])
+def test_compress_equals_classic(leaf_capacity):
+    points = close_points(leaf_capacity)
+    classic = build(points, leaf_capacity=leaf_capacity)
+    compressed = build(points, leaf_capacity=leaf_capacity, compress=True)
+
+    assert compressed.extent() == classic.extent()
+    assert dumps(compressed.uncompressed_root()) == dumps(classic.root)
+    assert count_internal(compressed.root) <= count_internal(classic.root)
+
+    # Bulk builds compress the same runs
+    xs = [d["x"] for d in points]
+    ys = [d["y"] for d in points]
+    bulk = Quadtree(leaf_capacity, compress=True).add_all(xs, ys, points)
+    added = Quadtree(leaf_capacity, compress=True).extent(
+        [min(xs), min(ys)], [max(xs), max(ys)]
+    )
+    for d in points:
+        added.add(d["x"], d["y"], d)
+    assert dumps(bulk.root) == dumps(added.root)
+
+
+def test_compress_cover():
+    tree = Quadtree(compress=True)
+    tree.add(0, 0).add(0.75, 0.25)
+    assert "skip" not in tree.root
+
+    tree.cover(100, 100)
+    assert tree.root["skip"] == 7
+    tree.cover(-1000, 5)
+    classic = Quadtree().add(0, 0).add(0.75, 0.25).cover(100, 100).cover(-1000, 5)
+    assert tree.extent() == classic.extent()
+    assert tree.uncompressed_root() == classic.root
+
+
+def test_compress_export():
+    points = close_points(4)
+    classic = build(points)
+    compressed = build(points, compress=True)
+
+    assert count_internal(compressed.root) < count_internal(classic.root) / 4
+
+    fp = io.StringIO()
+    compressed.dump_d3_json(fp)
+    assert fp.getvalue() == dumps(classic.root, separators=(",", ":"))
+    assert dumps(compressed.expanded().root) == dumps(classic.root)
+
+    # Node ids follow the uncompressed tree
+    assert list(compressed.iter_nodes()) == list(classic.iter_nodes())
+    assert compressed.aggregates().count.tolist() == classic.aggregates().count.tolist()
+
+
+def test_compress_queries():
+    points = close_points(5)
+    classic = build(points)
+    compressed = build(points, compress=True)
+
+    def ids(data):
+        return [d["i"] for d in data]
+
+    rects = [(-5, -5, 5, 5), (0, -20, 20, 3), (-30, -30, 30, 30)]
+    for rect in rects:
+        assert ids(compressed.query_rect(*rect)) == ids(classic.query_rect(*rect))
+    assert [ids(r) for r in compressed.query_rect_batch(rects)] == [
+        ids(r) for r in classic.query_rect_batch(rects)
+    ]
+    assert ids(compressed.data()) == ids(classic.data())
+
+    for x, y in [(0, 0), (13.1, -7.5), (-19, 19)]:
+        assert ids(compressed.knn(x, y, 5)) == ids(classic.knn(x, y, 5))
+
+
+def test_compress_remove_update():
+    points = close_points(6, 150)
+    classic = build(points)
+    compressed = build(points, compress=True)
+
+    removed = points[::3]
+    for d in removed[:20]:
+        classic.remove(d)
+        compressed.remove(d)
+    classic.remove_all(removed[20:])
+    compressed.remove_all(removed[20:])
+    assert dumps(compressed.uncompressed_root()) == dumps(classic.root)
+
+    moved = points[1::3]
+    old_xys = [(d["x"], d["y"]) for d in moved]
+    new_xys = [(d["x"] + 1e-10, -d["y"]) for d in moved]
+    classic.update_many(old_xys, new_xys, moved)
+    compressed.update_many(old_xys, new_xys, moved)
+    assert dumps(compressed.uncompressed_root()) == dumps(classic.root)
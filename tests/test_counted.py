@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import io
+from json import dumps
+
+import numpy as np
+import pytest
+
+from quadtreed3 import Quadtree
+
+from .helpers import as_points, build
+
+
+def snapped_points(seed, n=400):
+    # Points snapped to a coarse grid, with many coincident points
+    rng = np.random.default_rng(seed)
+    xs = np.round(rng.normal(0, 3, n))
+    ys = np.round(rng.normal(0, 3, n))
+    return as_points(xs, ys)
+
+
+def d3_json(tree):
+    fp = io.StringIO()
+    tree.dump_d3_json(fp)
+    return fp.getvalue()
+
+
+def test_counted_leaf():
+    tree = (
+        Quadtree(counted=True)
+        .add(1, 1)
+        .add(0, 0)
+        .add(1, 1)
+        .add(1, 1, {"x": 1, "y": 1, "z": 3})
+    )
+    assert tree.root[3] == {
+        "data": {"x": 1, "y": 1, "z": 3},
+        "count": 3,
+        "duplicates": [{"x": 1, "y": 1}, {"x": 1, "y": 1}],
+    }
+    assert tree.root[0] == {"data": {"x": 0, "y": 0}}
+
+    classic = (
+        Quadtree().add(1, 1).add(0, 0).add(1, 1).add(1, 1, {"x": 1, "y": 1, "z": 3})
+    )
+    assert d3_json(tree) == d3_json(classic)
+    assert dumps(tree.expanded().root) == dumps(classic.root)
+
+    with pytest.raises(ValueError):
+        Quadtree(leaf_capacity=2, counted=True)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_counted_equals_classic(compress):
+    points = snapped_points(0)
+    xs = [d["x"] for d in points]
+    ys = [d["y"] for d in points]
+    classic = Quadtree().add_all(xs, ys, points)
+    counted = Quadtree(counted=True, compress=compress).add_all(xs, ys, points)
+
+    # Bulk builds count the same duplicates as adding points one by one
+    added = Quadtree(counted=True, compress=compress).extent(
+        [min(xs), min(ys)], [max(xs), max(ys)]
+    )
+    for d in points:
+        added.add(d["x"], d["y"], d)
+    assert dumps(added.root) == dumps(counted.root)
+    assert '"next"' not in dumps(counted.root)
+
+    assert d3_json(counted) == d3_json(classic)
+    assert counted.data() == classic.data()
+    assert counted.to_array().data == classic.to_array().data
+    assert counted.aggregates().count.tolist() == classic.aggregates().count.tolist()
+
+    def ids(data):
+        return [d["i"] for d in data]
+
+    for rect in [(-2, -2, 2, 2), (0, -10, 10, 1)]:
+        assert ids(counted.query_rect(*rect)) == ids(classic.query_rect(*rect))
+    for x, y in [(0, 0), (2.5, -1)]:
+        assert ids(counted.knn(x, y, 30)) == ids(classic.knn(x, y, 30))
+
+
+def test_counted_remove_update():
+    points = snapped_points(1, 300)
+    classic = build(points)
+    counted = build(points, counted=True)
+
+    removed = points[::4]
+    for d in removed[:20]:
+        classic.remove(d)
+        counted.remove(d)
+    classic.remove_all(removed[20:])
+    counted.remove_all(removed[20:])
+    assert d3_json(counted) == d3_json(classic)
+
+    moved = points[1::4]
+    old_xys = [(d["x"], d["y"]) for d in moved]
+    new_xys = [(d["y"], d["x"] + 0.5) for d in moved]
+    classic.update_many(old_xys, new_xys, moved)
+    counted.update_many(old_xys, new_xys, moved)
+    assert d3_json(counted) == d3_json(classic)
+
+    # Updating coincident entries that are equal moves each of them once
+    tree = Quadtree(counted=True).add(0, 0).add(0, 0).add(0, 0).add(3, 3)
+    tree.update_many([(0, 0), (0, 0)], [(1, 1), (2, 2)])
+    assert sorted((d["x"], d["y"]) for d in tree.data()) == [
+        (0, 0),
+        (1, 1),
+        (2, 2),
+        (3, 3),
+    ]
@@ -2,8 +2,11 @@
 
 """Tests for `quadtreed3` package."""
 
+import copy
+
+import numpy as np
 import pytest
-from quadtreed3 import Quadtree
+from quadtreed3 import ArrayQuadtree, Instrumentation, Quadtree
 
 
 @pytest.fixture
@@ -43,3 +46,78 @@ def test_content_double():
     assert Quadtree().cover(0, 0).cover(2, 2).cover(3, 5).extent() == [[0, 0], [8, 8]]
     assert Quadtree().cover(0, 0).cover(2, 2).cover(-3, 5).extent() == [[-4, 0], [4, 8]]
     assert Quadtree().cover(0, 0).cover(2, 2).cover(-3, 3).extent() == [[-4, 0], [4, 8]]
+
+
+def cover_step_by_step(x0, y0, x1, y1, x, y, root=None):
+    # The extent doubled one step at a time towards the point, with the root
+    # wrapped in one new parent per doubling like the original loop
+    length = x1 - x0
+    doublings = 0
+    node = root
+    while x < x0 or x >= x1 or y < y0 or y >= y1:
+        length *= 2
+        doublings += 1
+        parent = [None for _ in range(4)]
+        parent[int(x < x0) + 2 * int(y < y0)] = node
+        node = parent
+        if x < x0:
+            x0 = x1 - length
+        else:
+            x1 = x0 + length
+        if y < y0:
+            y0 = y1 - length
+        else:
+            y1 = y0 + length
+    if root is None or "data" in root:
+        node = root
+    return [[x0, y0], [x1, y1]], doublings, node
+
+
+@pytest.mark.parametrize("cls", [Quadtree, ArrayQuadtree])
+def test_cover_closed_form(cls):
+    rng = np.random.default_rng(0)
+    scales = 10.0 ** rng.integers(-3, 12, 200)
+    points = rng.uniform(-1, 1, (200, 2)) * scales[:, None]
+    for x, y in points:
+        instrument = Instrumentation()
+        tree = cls()
+        tree.instrument = instrument
+        tree.add(0.25, 0.5).add(0.75, 0.5)
+        expected, doublings, _ = cover_step_by_step(0, 0, 1, 1, x, y)
+
+        tree.cover(x, y)
+        assert tree.extent() == expected
+        assert instrument.extent_doublings == doublings
+        assert len(list(tree.query_rect(0, 0, 1, 1))) == 2
+
+
+def test_cover_closed_form_nodes():
+    # The new levels keep the root in the same quadrant as the loop did
+    for x, y in [(-1e6, 3), (7, -0.5), (1e9, 1e9), (-2.5, -1e4)]:
+        tree = Quadtree().add(0, 0).add(0.5, 0.5)
+        root = copy.deepcopy(tree.root)
+        extent, _, expected = cover_step_by_step(0, 0, 1, 1, x, y, root)
+
+        tree.cover(x, y)
+        assert tree.extent() == extent
+        assert tree.root == expected
+
+    # A leaf root is not wrapped
+    tree = Quadtree().add(0.5, 0.5).cover(-3, 9)
+    assert tree.root == {"data": {"x": 0.5, "y": 0.5}}
+
+
+@pytest.mark.parametrize("cls", [Quadtree, ArrayQuadtree])
+def test_cover_all(cls):
+    rng = np.random.default_rng(1)
+    xs = rng.uniform(-500, 300, 100)
+    ys = rng.uniform(20, 40, 100)
+
+    tree = cls().cover_all(xs, ys)
+    stepped = cls().cover(xs.min(), ys.min()).cover(xs.max(), ys.max())
+    assert tree.extent() == stepped.extent()
+    assert cls().cover_all([], []).extent() == [[None, None], [None, None]]
+
+    # Points in range leave the extent unchanged
+    extent = tree.extent()
+    assert tree.cover_all(xs[:10], ys[:10]).extent() == extent
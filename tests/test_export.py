@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import gzip
+import io
+import json
+
+import numpy as np
+from quadtreed3 import Quadtree
+
+
+def test_dump_d3_json():
+    rng = np.random.default_rng(0)
+    xs = np.round(rng.normal(size=300) * 5, 1)
+    ys = np.round(rng.normal(size=300) * 5, 1)
+    q = Quadtree().add_all(xs, ys)
+
+    fp = io.StringIO()
+    q.dump_d3_json(fp, chunk_size=100)
+    assert fp.getvalue() == json.dumps(q.root, separators=(",", ":"))
+
+
+def test_dump_d3_json_gzip():
+    q = Quadtree().add_all([0, 0.9, 0.4, 0.4], [0, 0.9, 0.4, 0.4])
+    fp = io.BytesIO()
+    q.dump_d3_json(fp, compress=True)
+    assert json.loads(gzip.decompress(fp.getvalue())) == q.root
+
+
+def test_dump_d3_json_precision():
+    q = Quadtree().add(1 / 3, 2 / 3).add(0.123456789, 0.5)
+    fp = io.BytesIO()
+    q.dump_d3_json(fp, precision=3)
+    assert fp.getvalue() == (
+        b'[null,null,[{"data":{"x":0.123,"y":0.5}},'
+        b'{"data":{"x":0.333,"y":0.667}},null,null],null]'
+    )
+
+
+def test_dump_d3_json_long_chain():
+    q = Quadtree().add_all([0.5] * 5000, [0.5] * 5000)
+    fp = io.StringIO()
+    q.dump_d3_json(fp)
+    assert fp.getvalue().count('"next"') == 4999
+
+
+def test_dump_d3_json_empty():
+    fp = io.StringIO()
+    Quadtree().dump_d3_json(fp)
+    assert fp.getvalue() == "null"
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+from quadtreed3 import Quadtree
+
+
+def test_find_simple():
+    q = Quadtree().add_all([0, 0.9, 0.9, 0.0, 0.4], [0, 0.9, 0, 0.9, 0.4])
+    assert q.find(0.1, 0.1) == {"x": 0, "y": 0}
+    assert q.find(0.5, 0.5) == {"x": 0.4, "y": 0.4}
+    assert q.find(0.5, 0.5, 0.1) is None
+    assert Quadtree().find(0, 0) is None
+
+
+def test_knn(quadtree: Quadtree):
+    data = quadtree.data()
+    xs = np.array([d["x"] for d in data])
+    ys = np.array([d["y"] for d in data])
+
+    for x, y, k in [(0, 0, 1), (3.3, -2.1, 5), (20, 20, 12)]:
+        expected = np.sort(np.hypot(xs - x, ys - y))[:k]
+        found = [np.hypot(d["x"] - x, d["y"] - y) for d in quadtree.knn(x, y, k)]
+        assert np.allclose(found, expected)
+
+
+def test_knn_coincident():
+    q = Quadtree().add_all([0, 0, 0.9], [0, 0, 0.9])
+    assert q.knn(0.1, 0.1, 2) == [{"x": 0, "y": 0}, {"x": 0, "y": 0}]
+    assert len(q.knn(0.1, 0.1, 10)) == 3
+
+
+def test_knn_batch(quadtree: Quadtree):
+    data = quadtree.data()
+    xs = np.array([d["x"] for d in data])
+    ys = np.array([d["y"] for d in data])
+
+    rng = np.random.default_rng(1)
+    qx, qy = rng.normal(size=(2, 40)) * 6
+    dist, index = quadtree.knn_batch(qx, qy, 7)
+    assert dist.shape == index.shape == (40, 7)
+
+    all_dist = np.hypot(xs[None, :] - qx[:, None], ys[None, :] - qy[:, None])
+    assert np.allclose(dist, np.sort(all_dist, axis=1)[:, :7])
+    assert np.allclose(np.take_along_axis(all_dist, index, axis=1), dist)
+
+
+def test_knn_batch_too_few_points():
+    dist, index = Quadtree().add_all([0, 0.5], [0, 0.5]).knn_batch([0], [0], 3)
+    assert index.tolist() == [[0, 1, -1]]
+    assert np.isinf(dist[0, 2])
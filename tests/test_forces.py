@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+import pytest
+
+from quadtreed3 import ManyBodyForce
+
+
+def brute_force(xs, ys, strength, alpha, distance_min=1.0, distance_max=np.inf):
+    dx = xs[None, :] - xs[:, None]
+    dy = ys[None, :] - ys[:, None]
+    length2 = dx * dx + dy * dy
+    length2 = np.where(
+        length2 < distance_min**2, np.sqrt(distance_min**2 * length2), length2
+    )
+    w = np.where(
+        (length2 > 0) & (dx * dx + dy * dy < distance_max**2),
+        strength[None, :] * alpha / np.where(length2 > 0, length2, 1),
+        0,
+    )
+    return (dx * w).sum(axis=1), (dy * w).sum(axis=1)
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(14)
+    xs = rng.normal(size=1500) * 50
+    ys = rng.normal(size=1500) * 50
+    strength = rng.uniform(-50, -1, 1500)
+
+    # Coincident points do not push each other
+    xs[1], ys[1] = xs[0], ys[0]
+    return xs, ys, strength
+
+
+def test_forces_exact(points):
+    xs, ys, strength = points
+    vx, vy = ManyBodyForce(xs, ys, strength, theta=0, batch_size=300).forces(0.5)
+    bx, by = brute_force(xs, ys, strength, 0.5)
+    np.testing.assert_allclose(vx, bx, atol=1e-9)
+    np.testing.assert_allclose(vy, by, atol=1e-9)
+
+    force = ManyBodyForce(xs, ys, strength, theta=0, distance_min=3, distance_max=40)
+    vx, vy = force.forces()
+    bx, by = brute_force(xs, ys, strength, 1, 3, 40)
+    np.testing.assert_allclose(vx, bx, atol=1e-9)
+    np.testing.assert_allclose(vy, by, atol=1e-9)
+
+
+@pytest.mark.parametrize("theta", [0.5, 0.9])
+def test_forces_approximate(points, theta):
+    xs, ys, strength = points
+    vx, vy = ManyBodyForce(xs, ys, strength, theta=theta).forces()
+    bx, by = brute_force(xs, ys, strength, 1)
+    assert np.linalg.norm(vx - bx) < 0.02 * np.linalg.norm(bx)
+    assert np.linalg.norm(vy - by) < 0.02 * np.linalg.norm(by)
+
+
+def test_forces_update(points):
+    xs, ys, strength = points
+    force = ManyBodyForce(xs, ys, strength)
+    tree = force.tree
+
+    # Tiny moves keep the tree
+    xs = xs + 1e-9
+    force.update(xs, ys)
+    assert force.tree is tree
+    vx, vy = force.forces()
+    ex, ey = ManyBodyForce(xs, ys, strength).forces()
+    np.testing.assert_allclose(vx, ex)
+    np.testing.assert_allclose(vy, ey)
+
+    # Large moves rebuild it
+    xs = xs + vx
+    force.update(xs, ys)
+    assert force.tree is not tree
+    vx, vy = force.forces()
+    ex, ey = ManyBodyForce(xs, ys, strength).forces()
+    np.testing.assert_array_equal(vx, ex)
+    np.testing.assert_array_equal(vy, ey)
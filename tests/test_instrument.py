@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+import pytest
+
+from quadtreed3 import ArrayQuadtree, Instrumentation, Quadtree
+
+
+def make_tree(cls, instrument):
+    tree = cls()
+    tree.instrument = instrument
+    return tree
+
+
+@pytest.mark.parametrize("cls", [Quadtree, ArrayQuadtree])
+def test_instrument_add(cls):
+    instrument = Instrumentation()
+    tree = make_tree(cls, instrument)
+    tree.add(0, 0)
+    assert instrument.as_dict() == {
+        "points_inserted": 1,
+        "node_splits": 0,
+        "extent_doublings": 0,
+        "max_depth": 0,
+    }
+
+    # Extent [0, 1) doubles twice to cover x = 3
+    tree.add(3, 0)
+    assert instrument.extent_doublings == 2
+    assert instrument.node_splits == 1
+    assert instrument.max_depth == 1
+
+    # A point close to (0, 0) splits the cell of (0, 0) until they separate
+    tree.add(0.1, 0.1)
+    assert instrument.points_inserted == 3
+    assert instrument.node_splits == 1 + 5
+    assert instrument.max_depth == 6
+
+    # Coincident points are linked in a leaf
+    tree.add(3, 0)
+    assert instrument.points_inserted == 4
+    assert instrument.node_splits == 6
+
+
+@pytest.mark.parametrize("cls", [Quadtree, ArrayQuadtree])
+def test_instrument_bulk_same_as_add(cls):
+    rng = np.random.default_rng(10)
+    xs = rng.random(500) * 100
+    ys = rng.random(500) * 100
+
+    bulk = Instrumentation()
+    make_tree(cls, bulk).add_all(xs, ys)
+
+    # Insert the points one by one into the same extent
+    serial = Instrumentation()
+    tree = cls()
+    tree.cover(xs.min(), ys.min())
+    tree.cover(xs.max(), ys.max())
+    tree.instrument = serial
+    for x, y in zip(xs, ys):
+        tree.add(x, y)
+
+    assert bulk.points_inserted == serial.points_inserted == 500
+    assert bulk.node_splits == serial.node_splits
+    assert bulk.max_depth == serial.max_depth
+
+
+def test_instrument_listeners():
+    events = []
+    instrument = Instrumentation([lambda event, count: events.append((event, count))])
+    tree = make_tree(Quadtree, instrument)
+    tree.add(0, 0)
+    tree.add(0.3, 0.3)
+    tree.add(2, 2)
+    assert events == [
+        ("insert", 1),
+        ("insert", 1),
+        ("split", 2),
+        ("depth", 2),
+        ("double", 2),
+        ("depth", 4),
+        ("insert", 1),
+    ]
+
+
+@pytest.mark.parametrize("cls", [Quadtree, ArrayQuadtree])
+def test_add_all_progress(cls):
+    pytest.importorskip("tqdm")
+    xs = [0, 1, 2, 3]
+    ys = [3, 2, 1, 0]
+
+    tree = cls().add_all(xs, ys, progress=True)
+    assert tree.instrument is None
+
+    instrument = Instrumentation()
+    tree = make_tree(cls, instrument)
+    tree.add_all(xs, ys, progress=True)
+    assert tree.instrument is instrument
+    assert instrument.listeners == []
+    assert instrument.points_inserted == 4
+
+
+def leaf_depth(tree):
+    if isinstance(tree, Quadtree):
+        tree = tree.to_array()
+    table = tree.node_table()
+    return int(table.level[table.ref < 0].max())
+
+
+@pytest.mark.parametrize(
+    "make, depth",
+    [
+        (lambda: Quadtree(), 8),
+        (lambda: Quadtree(compress=True), 8),
+        (lambda: Quadtree(leaf_capacity=3), 0),
+        (lambda: ArrayQuadtree(), 8),
+    ],
+)
+def test_instrument_depth_after_cover(make, depth):
+    # The leaves of an internal root move down when the extent grows
+    instrument = Instrumentation()
+    tree = make_tree(make, instrument)
+    depths = []
+    instrument.listeners.append(
+        lambda event, count: depths.append(count) if event == "depth" else None
+    )
+    tree.add(0.1, 0.1).add(0.6, 0.6).add(100, 100)
+    assert instrument.max_depth == leaf_depth(tree) == depth
+    assert depths == ([1, 8] if depth else [])
+
+    rng = np.random.default_rng(11)
+    for _ in range(10):
+        scale = 10.0 ** rng.integers(0, 6)
+        for x, y in rng.normal(size=(20, 2)) * scale:
+            tree.add(x, y)
+        assert instrument.max_depth == leaf_depth(tree)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+import pytest
+from quadtreed3 import ArrayQuadtree, Quadtree
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load(quadtree: Quadtree, tmp_path, mmap):
+    path = tmp_path / "tree.qt"
+    quadtree.save(path)
+
+    loaded = Quadtree.load(path, mmap=mmap)
+    assert isinstance(loaded._xs, np.memmap) == mmap
+    assert loaded.extent() == quadtree.extent()
+    assert loaded.to_quadtree().root == quadtree.root
+
+
+def test_save_load_default_data(tmp_path):
+    path = tmp_path / "tree.qt"
+    ArrayQuadtree().add_all([0, 0.9, 0.4], [0, 0.9, 0.4]).save(path)
+    loaded = ArrayQuadtree.load(path)
+    assert loaded.data is None
+    assert loaded.add(0.4, 0.4).root == [
+        [
+            {"data": {"x": 0, "y": 0}},
+            None,
+            None,
+            {"data": {"x": 0.4, "y": 0.4}, "next": {"data": {"x": 0.4, "y": 0.4}}},
+        ],
+        None,
+        None,
+        {"data": {"x": 0.9, "y": 0.9}},
+    ]
+
+
+def test_load_queries(quadtree: Quadtree, tmp_path):
+    path = tmp_path / "tree.qt"
+    quadtree.save(path)
+    loaded = Quadtree.load(path)
+    data = quadtree.data()
+
+    found = [data[i] for i in loaded.query_rect(-2, -3, 4, 1)]
+    assert found == list(quadtree.query_rect(-2, -3, 4, 1))
+
+    assert data[loaded.find(1.23, -0.7)] == quadtree.find(1.23, -0.7)
+    assert [data[i] for i in loaded.knn(3, 3, 6)] == quadtree.knn(3, 3, 6)
+    assert loaded.find(100, 100, radius=1) == -1
+
+
+def test_load_empty(tmp_path):
+    path = tmp_path / "tree.qt"
+    Quadtree().save(path)
+    loaded = Quadtree.load(path)
+    assert loaded.root is None
+    assert len(loaded.query_rect(0, 0, 1, 1)) == 0
+
+
+def test_save_skips_default_data(quadtree: Quadtree, tmp_path):
+    # Default entries are rebuilt from the columns instead of being stored
+    path = tmp_path / "tree.qt"
+    quadtree.save(path)
+    array = quadtree.to_array()
+    assert path.stat().st_size < array.xs.nbytes * 2 + array.children.nbytes + 4096
+
+    loaded = Quadtree.load(path)
+    assert loaded.data == quadtree.data()
+    assert loaded.to_quadtree().root == quadtree.root
+
+
+def test_save_data_chunks(quadtree: Quadtree, tmp_path):
+    data = [dict(d, i=i) for i, d in enumerate(quadtree.data())]
+    xs = [d["x"] for d in data]
+    ys = [d["y"] for d in data]
+    tree = ArrayQuadtree().add_all(xs, ys, data)
+
+    path = tmp_path / "tree.qt"
+    tree.save(path, chunk_size=7)
+    assert ArrayQuadtree.load(path).data == tree.data
+
+    # Moved points no longer match their default entries
+    data = [{"x": x + 1, "y": y} for x, y in zip(xs, ys)]
+    ArrayQuadtree().add_all(xs, ys, data).save(path)
+    assert ArrayQuadtree.load(path, mmap=False).data == data
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+import pytest
+
+from quadtreed3 import ArrayQuadtree, Quadtree, quadtree_join, quadtree_self_join
+
+
+def points(seed, n):
+    # Clusters with coincident points, plus uniform noise
+    rng = np.random.default_rng(seed)
+    xs = np.concatenate([rng.normal(3, 0.3, n // 2), rng.uniform(0, 10, n - n // 2)])
+    ys = np.concatenate([rng.normal(6, 0.3, n // 2), rng.uniform(0, 10, n - n // 2)])
+    xs[::9] = xs[0]
+    ys[::9] = ys[0]
+    return xs, ys
+
+
+def collect(batches):
+    pairs = list(batches)
+    if len(pairs) == 0:
+        return set()
+    ia = np.concatenate([p[0] for p in pairs])
+    ib = np.concatenate([p[1] for p in pairs])
+    assert len(set(zip(ia.tolist(), ib.tolist()))) == len(ia)
+    return set(zip(ia.tolist(), ib.tolist()))
+
+
+def brute_force(xa, ya, xb, yb, r):
+    d2 = (xa[:, None] - xb[None, :]) ** 2 + (ya[:, None] - yb[None, :]) ** 2
+    return set(zip(*[v.tolist() for v in np.nonzero(d2 <= r * r)]))
+
+
+@pytest.mark.parametrize("r", [0, 0.05, 0.5, 3, 20])
+def test_join(r):
+    xa, ya = points(0, 500)
+    xb, yb = points(1, 300)
+    qa = ArrayQuadtree().add_all(xa, ya)
+    qb = ArrayQuadtree().add_all(xb, yb)
+
+    expected = brute_force(xa, ya, xb, yb, r)
+    assert collect(quadtree_join(qa, qb, r)) == expected
+    assert collect(quadtree_join(qa, qb, r, batch_size=100, brute_size=1)) == expected
+    assert collect(quadtree_join(qb, qa, r)) == {(j, i) for i, j in expected}
+
+
+@pytest.mark.parametrize("r", [0, 0.05, 0.5, 20])
+def test_self_join(r):
+    xs, ys = points(2, 600)
+    tree = ArrayQuadtree().add_all(xs, ys)
+
+    expected = {(i, j) for i, j in brute_force(xs, ys, xs, ys, r) if i < j}
+    assert collect(quadtree_self_join(tree, r)) == expected
+    assert (
+        collect(quadtree_self_join(tree, r, batch_size=100, brute_size=1)) == expected
+    )
+
+
+def test_join_quadtree():
+    xa, ya = points(3, 200)
+    xb, yb = points(4, 200)
+    qa = Quadtree(leaf_capacity=4).add_all(xa, ya)
+    qb = Quadtree(compress=True).add_all(xb, yb)
+
+    # Indices refer to the array-backed copies
+    array_a, array_b = qa.to_array(), qb.to_array()
+    expected = brute_force(array_a.xs, array_a.ys, array_b.xs, array_b.ys, 0.2)
+    assert collect(quadtree_join(qa, qb, 0.2)) == expected
+
+    assert collect(quadtree_join(qa, Quadtree(), 1)) == set()
+    assert collect(quadtree_self_join(ArrayQuadtree(), 1)) == set()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+import pytest
+
+import quadtreed3.quadtreed3
+from quadtreed3 import NodeView, Quadtree
+
+from .helpers import get_nodes
+
+
+def test_iter_nodes_pre_order(quadtree: Quadtree):
+    records = list(quadtree.iter_nodes())
+    nodes = get_nodes(quadtree)
+    assert len(records) == len(nodes)
+
+    for record, node in zip(records, nodes):
+        assert record.nid == node.nid
+        assert record.level == node.level
+        assert record.position == node.position
+        assert record.size == node.size
+        assert record.height == node.height
+        assert record.data == node.data
+
+
+def test_iter_nodes_post_order(quadtree: Quadtree):
+    records = list(quadtree.iter_nodes("post"))
+    nodes = {node.nid: node for node in get_nodes(quadtree)}
+    assert records[-1].nid == 0
+
+    seen = set()
+    for record in records:
+        node = nodes[record.nid]
+        assert all(c.nid in seen for c in node.children if c is not None)
+        assert (record.size, record.height) == (node.size, node.height)
+        seen.add(record.nid)
+
+
+def test_iter_node_batches(quadtree: Quadtree):
+    batches = list(quadtree.iter_node_batches(batch_size=100))
+    records = list(quadtree.iter_nodes())
+    assert all(len(b) == 100 for b in batches[:-1])
+
+    batch = np.concatenate(batches)
+    assert batch["nid"].tolist() == [r.nid for r in records]
+    assert batch["size"].tolist() == [r.size for r in records]
+    assert batch["x1"].tolist() == [r.position[2] for r in records]
+
+
+def node_attributes(node):
+    return (
+        node.nid,
+        node.level,
+        node.position,
+        node.size,
+        node.height,
+        node.data,
+        [c is None for c in node.children],
+    )
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"compress": True}, {"leaf_capacity": 4}, {"counted": True, "compress": True}],
+)
+def test_node_view(quadtree: Quadtree, options):
+    data = quadtree.data()
+    xs = [d["x"] for d in data] + [1e-9, 2e-9]
+    ys = [d["y"] for d in data] + [0, 0]
+    views = get_nodes(Quadtree(**options).add_all(xs, ys), lazy=True)
+    nodes = get_nodes(Quadtree(**options).add_all(xs, ys))
+
+    assert len(views) == len(nodes)
+    for view, node in zip(views, nodes):
+        assert node_attributes(view) == node_attributes(node)
+
+
+def test_node_view_lazy(quadtree: Quadtree):
+    root = quadtree.get_node_representation(lazy=True)
+    child = next(c for c in root.children if c is not None)
+
+    # Only the opened nodes exist
+    assert all(c is None or c._children is None for c in root.children)
+    assert child.nid == 1
+    assert str(child) == str(quadtree.get_node_representation().children[0])
+
+    assert Quadtree().get_node_representation(lazy=True).size == 0
+
+
+def test_node_view_top_levels(monkeypatch):
+    rng = np.random.default_rng(1)
+    tree = Quadtree().add_all(rng.uniform(size=20000), rng.uniform(size=20000))
+    records = {r.nid: r for r in tree.iter_nodes() if r.level <= 2}
+
+    # Inspecting the top levels creates their views and the children they fold
+    # their shapes from, and walks every subtree below them at most once
+    created, walked = [], []
+    init = NodeView.__init__
+    monkeypatch.setattr(
+        NodeView,
+        "__init__",
+        lambda view, *args: created.append(view) or init(view, *args),
+    )
+    walk = quadtreed3.quadtreed3._subtree_shape
+    monkeypatch.setattr(
+        quadtreed3.quadtreed3,
+        "_subtree_shape",
+        lambda node: walked.append(id(node)) or walk(node),
+    )
+    stack = [tree.get_node_representation(lazy=True)]
+    while len(stack) > 0:
+        view = stack.pop()
+        record = records.pop(view.nid)
+        assert (view.level, view.size, view.height) == (
+            record.level,
+            record.size,
+            record.height,
+        )
+        if view.level < 2:
+            stack.extend(c for c in view.children if c is not None)
+
+    assert records == {}
+    assert len(created) <= 1 + 4 + 16 + 64
+    assert len(walked) == len(set(walked)) <= 4 + 16 + 64
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+import pytest
+from quadtreed3 import ArrayQuadtree, Quadtree
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    xs = np.round(rng.uniform(-10, 10, size=300), 1)
+    ys = np.round(rng.uniform(-10, 10, size=300), 1)
+    return xs.tolist(), ys.tolist()
+
+
+def test_query_rect_simple():
+    q = Quadtree().add_all([0, 0.9, 0.9, 0.0, 0.4], [0, 0.9, 0, 0.9, 0.4]).add(0, 0)
+    assert list(q.query_rect(0, 0, 0.5, 0.5)) == [
+        {"x": 0, "y": 0},
+        {"x": 0, "y": 0},
+        {"x": 0.4, "y": 0.4},
+    ]
+    assert list(q.query_rect(0.5, 0.5, 0.8, 0.8)) == []
+    assert list(Quadtree().query_rect(0, 0, 1, 1)) == []
+
+
+def test_query_rect_brute_force(points):
+    xs, ys = points
+    q = Quadtree().add_all(xs, ys)
+    rng = np.random.default_rng(1)
+
+    for _ in range(20):
+        x0, x1 = sorted(rng.uniform(-12, 12, size=2))
+        y0, y1 = sorted(rng.uniform(-12, 12, size=2))
+        found = sorted((d["x"], d["y"]) for d in q.query_rect(x0, y0, x1, y1))
+        expected = sorted(
+            (x, y) for x, y in zip(xs, ys) if x0 <= x <= x1 and y0 <= y <= y1
+        )
+        assert found == expected
+
+
+def test_query_rect_batch(points):
+    xs, ys = points
+    q = Quadtree().add_all(xs, ys)
+    rng = np.random.default_rng(2)
+    corners = rng.uniform(-12, 12, size=(50, 2, 2))
+    rects = np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+
+    results = q.query_rect_batch(rects)
+    assert len(results) == 50
+    for rect, result in zip(rects, results):
+        assert result == list(q.query_rect(*rect))
+
+
+def inside_polygon(x, y, vertices):
+    inside = False
+    for (ax, ay), (bx, by) in zip(vertices, vertices[1:] + vertices[:1]):
+        if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+            inside = not inside
+    return inside
+
+
+@pytest.mark.parametrize("leaf_capacity", [1, 4])
+def test_query_radius(points, leaf_capacity):
+    xs, ys = points
+    q = Quadtree(leaf_capacity).add_all(xs, ys)
+    data = q.data()
+    rng = np.random.default_rng(3)
+
+    for x, y, r in zip(*rng.uniform(-12, 12, size=(2, 20)), rng.uniform(0, 15, 20)):
+        found = q.query_radius(x, y, r)
+        assert found.dtype == np.int64
+        assert list(found) == sorted(found)
+        expected = sorted(
+            (d["x"], d["y"])
+            for d in data
+            if (d["x"] - x) ** 2 + (d["y"] - y) ** 2 <= r * r
+        )
+        assert sorted((data[i]["x"], data[i]["y"]) for i in found) == expected
+
+    # Points on the circle are included
+    assert len(q.query_radius(xs[0], ys[0] + 0.5, 0.5)) >= 1
+    assert len(Quadtree().query_radius(0, 0, 1)) == 0
+
+
+def test_query_polygon(points):
+    xs, ys = points
+    tree = ArrayQuadtree().add_all(xs, ys)
+    rng = np.random.default_rng(4)
+
+    for n in [3, 5, 12, 40]:
+        # Star-shaped and self-intersecting polygons
+        angles = np.sort(rng.uniform(0, 2 * np.pi, n))
+        radii = rng.uniform(2, 11, n)
+        center = rng.uniform(-3, 3, 2)
+        star = center + np.stack([np.cos(angles), np.sin(angles)], 1) * radii[:, None]
+        tangled = rng.uniform(-11, 11, (n, 2))
+
+        for vertices in [star.tolist(), tangled.tolist()]:
+            found = tree.query_polygon(vertices)
+            expected = [
+                i
+                for i in range(len(xs))
+                if inside_polygon(tree.xs[i], tree.ys[i], vertices)
+            ]
+            assert sorted(found) == expected
+            assert sorted(tree.query_polygon(vertices, leaf_size=1)) == expected
+
+    # A square polygon matches the rectangle query inside it
+    square = [[-5.05, -5.05], [4.95, -5.05], [4.95, 4.95], [-5.05, 4.95]]
+    assert list(tree.query_polygon(square)) == list(
+        tree.query_rect(-5.05, -5.05, 4.95, 4.95)
+    )
+    assert len(tree.query_polygon([[0, 0], [1, 1]])) == 0
+
+
+@pytest.mark.parametrize(
+    "bounds, nx, ny",
+    [
+        (None, 16, 16),
+        ([-1, -1, 1, 1], 7, 13),
+        ([-0.25, 0, 0.5, 0.125], 100, 40),
+        ([2, 2, 3, 3], 4, 4),
+    ],
+)
+def test_histogram(bounds, nx, ny):
+    # Rounded coordinates put points on pixel edges and in the same leaves
+    rng = np.random.default_rng(7)
+    xs = np.round(rng.normal(0, 0.5, 5000), 2)
+    ys = np.round(rng.normal(0, 0.5, 5000), 2)
+    tree = Quadtree().add_all(xs, ys)
+
+    counts, x_edges, y_edges = tree.histogram(bounds, nx, ny)
+    x0, y0, x1, y1 = bounds or tree.extent()[0] + tree.extent()[1]
+    expected, ex, ey = np.histogram2d(xs, ys, bins=[nx, ny], range=[[x0, x1], [y0, y1]])
+    assert counts.shape == (nx, ny)
+    assert counts.tolist() == expected.astype(int).tolist()
+    assert np.array_equal(x_edges, ex) and np.array_equal(y_edges, ey)
+
+    array = ArrayQuadtree().add_all(xs, ys)
+    assert array.histogram([x0, y0, x1, y1], nx, ny)[0].tolist() == counts.tolist()
+
+
+def test_histogram_empty():
+    counts, x_edges, y_edges = Quadtree().histogram([0, 0, 1, 1], 3, 2)
+    assert counts.tolist() == [[0, 0], [0, 0], [0, 0]]
+    assert y_edges.tolist() == [0, 0.5, 1]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+import pytest
+
+from quadtreed3 import Quadtree
+
+from .helpers import as_points, build
+
+
+def random_points(seed, n=300):
+    rng = np.random.default_rng(seed)
+    xs = rng.integers(0, 40, n) / 4
+    ys = rng.integers(0, 40, n) / 4
+    return as_points(xs, ys)
+
+
+def test_remove_d3():
+    tree = Quadtree()
+    tree.add_all([0, 1, 1], [0, 0, 1])
+    tree.remove({"x": 1, "y": 1})
+    assert tree.root == [
+        {"data": {"x": 0, "y": 0}},
+        {"data": {"x": 1, "y": 0}},
+        None,
+        None,
+    ]
+
+    # The parent of the last two points collapses into the remaining leaf
+    tree.remove({"x": 1, "y": 0})
+    assert tree.root == {"data": {"x": 0, "y": 0}}
+    assert tree.extent() == [[0, 0], [2, 2]]
+
+    tree.remove({"x": 0, "y": 0})
+    assert tree.root is None
+
+
+def test_remove_collapses_to_retainer():
+    tree = Quadtree()
+    tree.add_all([0, 0.1, 3], [0, 0.1, 3])
+    tree.remove({"x": 0.1, "y": 0.1})
+    assert tree.root == [
+        {"data": {"x": 0, "y": 0}},
+        None,
+        None,
+        {"data": {"x": 3, "y": 3}},
+    ]
+
+
+def test_remove_coincident():
+    a = {"x": 1, "y": 1, "name": "a"}
+    b = {"x": 1, "y": 1, "name": "b"}
+    c = {"x": 1, "y": 1, "name": "c"}
+
+    tree = Quadtree()
+    tree.add_all_data([a, b, c])
+    tree.remove(b)
+    assert tree.root == {"data": c, "next": {"data": a}}
+
+    tree.remove(c)
+    assert tree.root == {"data": a}
+
+    # Missing entries are ignored
+    tree.remove({"x": 1, "y": 1, "name": "d"})
+    tree.remove({"x": 5, "y": 5})
+    assert tree.root == {"data": a}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_remove_same_as_rebuild(seed):
+    points = random_points(seed)
+    extent = ([0, 0], [16, 16])
+    rng = np.random.default_rng(seed)
+    removed = set(rng.choice(len(points), 200, replace=False).tolist())
+
+    tree = build(points, extent)
+    for i in rng.permutation(sorted(removed)).tolist():
+        tree.remove(points[i])
+
+    expected = build([d for d in points if d["i"] not in removed], extent)
+    assert tree.root == expected.root
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_remove_all_same_as_remove(seed):
+    points = random_points(seed)
+    extent = ([0, 0], [16, 16])
+    rng = np.random.default_rng(seed)
+    removed = [points[i] for i in rng.choice(len(points), 150, replace=False)]
+
+    tree = build(points, extent)
+    for d in removed:
+        tree.remove(d)
+
+    batch = build(points, extent).remove_all(removed)
+    assert batch.root == tree.root
+
+    batch.remove_all(points)
+    assert batch.root is None
+
+
+def test_remove_invalidates_cache():
+    tree = Quadtree()
+    tree.add_all([0, 1, 2, 3], [0, 1, 2, 3])
+    assert tree.aggregates().count[0] == 4
+    tree.remove({"x": 3, "y": 3})
+    assert tree.aggregates().count[0] == 3
+    tree.remove_all([{"x": 0, "y": 0}, {"x": 1, "y": 1}])
+    assert tree.aggregates().count[0] == 1
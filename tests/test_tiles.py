@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import pytest
+from quadtreed3 import Quadtree
+
+from .helpers import get_nodes
+
+
+@pytest.fixture
+def n_points():
+    return 500
+
+
+def test_tiles_simple():
+    q = Quadtree().add_all([0, 0.9, 0.9, 0.0, 0.4], [0, 0.9, 0, 0.9, 0.4])
+    tiles = list(q.iter_tiles(level=1))
+    assert [t.nid for t in tiles] == [1, 4, 5, 6]
+    assert tiles[0].position == [0, 0, 0.5, 0.5]
+    assert tiles[0].size == 2
+    assert tiles[0].cx == pytest.approx(0.2)
+    assert tiles[0].data == [{"x": 0, "y": 0}, {"x": 0.4, "y": 0.4}]
+
+
+def test_tiles_level(quadtree: Quadtree):
+    nodes = {node.nid: node for node in get_nodes(quadtree)}
+    tiles = list(quadtree.iter_tiles(level=3))
+    assert sum(t.size for t in tiles) == 500
+
+    for tile in tiles:
+        node = nodes[tile.nid]
+        assert node.level == tile.level
+        assert node.position == tile.position
+        assert tile.level == 3 or len(node.children) == 0
+
+
+def test_tiles_max_points(quadtree: Quadtree):
+    nodes = {node.nid: node for node in get_nodes(quadtree)}
+    table = quadtree.to_array().node_table()
+    tiles = list(quadtree.iter_tiles(max_points=20, sample=5, seed=0))
+    assert sum(t.size for t in tiles) == 500
+
+    for tile in tiles:
+        assert tile.size <= 20
+        assert len(tile.data) == min(5, tile.size)
+        assert nodes[tile.nid].position == tile.position
+
+        # The parent of every tile has too many points
+        assert tile.size == table.size[tile.nid]
+        assert tile.level == 0 or table.size[table.parent[tile.nid]] > 20
+
+
+def test_tiles_arguments():
+    with pytest.raises(ValueError):
+        list(Quadtree().iter_tiles())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import numpy as np
+import pytest
+
+from quadtreed3 import Quadtree
+
+from .helpers import build
+
+
+def assert_aggregates_equal(actual, expected):
+    np.testing.assert_array_equal(actual.count, expected.count)
+    for field in ("cx", "cy", "x0", "y0", "x1", "y1"):
+        np.testing.assert_allclose(getattr(actual, field), getattr(expected, field))
+    for name, values in expected.reductions.items():
+        np.testing.assert_allclose(actual.reductions[name], values)
+
+
+def test_update_in_place():
+    tree = Quadtree()
+    tree.add_all([0, 3, 3], [0, 0, 3])
+    tree.add_reduction("sum_x", "x", "sum")
+    aggregates = tree.aggregates()
+    assert aggregates.cx[0] == 2
+
+    # (0, 0) stays in the cell [0, 2) x [0, 2)
+    tree.update((0, 0), (1.5, 1))
+    assert tree.root[0] == {"data": {"x": 1.5, "y": 1}}
+    assert tree.aggregates() is aggregates
+    assert aggregates.cx[0] == 2.5
+    assert aggregates.x0[0] == 1.5
+    assert aggregates.reductions["sum_x"][0] == 7.5
+    assert tree._array_snapshot().xs.tolist() == [1.5, 3, 3]
+
+    # (3, 3) leaves its cell, the tree changes
+    tree.update((3, 3), (0.5, 0.5))
+    assert tree.root == [
+        [
+            {"data": {"x": 0.5, "y": 0.5}},
+            None,
+            None,
+            {"data": {"x": 1.5, "y": 1}},
+        ],
+        {"data": {"x": 3, "y": 0}},
+        None,
+        None,
+    ]
+    assert tree.aggregates().count.tolist() == [3, 2, 1, 1, 1]
+
+
+def test_update_coincident():
+    a = {"x": 1, "y": 1, "name": "a"}
+    b = {"x": 1, "y": 1, "name": "b"}
+
+    tree = Quadtree()
+    tree.add_all_data([a, b])
+    tree.update((1, 1), (1.5, 1.5), a)
+    assert a == {"x": 1.5, "y": 1.5, "name": "a"}
+    assert tree.root == [{"data": b}, None, None, {"data": a}]
+
+    # The data entry may already hold the new coordinates
+    b["x"] = 0.25
+    tree.update((1, 1), (0.25, 1), b)
+    assert tree.root == [{"data": b}, {"data": a}, None, None]
+    assert tree.extent() == [[0, 1], [2, 3]]
+
+    # Missing points are ignored
+    tree.update((5, 5), (1, 1))
+    assert tree.root == [{"data": b}, {"data": a}, None, None]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_update_many_same_as_rebuild(seed):
+    rng = np.random.default_rng(seed)
+    n = 400
+    xs = rng.random(n) * 16
+    ys = rng.random(n) * 16
+    points = [{"x": x, "y": y, "w": float(i)} for i, (x, y) in enumerate(zip(xs, ys))]
+    extent = ([0, 0], [16, 16])
+
+    tree = build(points, extent)
+    tree.add_reduction("mean_w", "w", "mean")
+    tree.add_reduction("max_w", "w", "max")
+    aggregates = tree.aggregates()
+
+    # Tiny moves stay in their cells and only patch the cached aggregates
+    moved = rng.choice(n, 40, replace=False)
+    old_xys = [(points[i]["x"], points[i]["y"]) for i in moved]
+    new_xys = [
+        (min(max(x + dx, 0), 15.9), min(max(y + dy, 0), 15.9))
+        for (x, y), dx, dy in zip(
+            old_xys, rng.normal(0, 1e-9, 40), rng.normal(0, 1e-9, 40)
+        )
+    ]
+    tree.update_many(old_xys, new_xys, [points[i] for i in moved])
+    assert tree.aggregates() is aggregates
+
+    expected = build(points, extent)
+    assert tree.root == expected.root
+
+    expected.add_reduction("mean_w", "w", "mean")
+    expected.add_reduction("max_w", "w", "max")
+    assert_aggregates_equal(tree.aggregates(), expected.aggregates())
+
+    # Large moves rebuild the affected paths
+    new_xys = [(x, y) for x, y in rng.random((40, 2)) * 16]
+    old_xys = [(points[i]["x"], points[i]["y"]) for i in moved]
+    tree.update_many(old_xys, new_xys, [points[i] for i in moved])
+
+    expected = build(
+        [d for i, d in enumerate(points) if i not in set(moved.tolist())]
+        + [points[i] for i in moved],
+        extent,
+    )
+    assert tree.root == expected.root
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""Tests for `quadtreed3` package."""
+
+import sys
+
+import numpy as np
+
+from quadtreed3 import Quadtree
+
+
+def make_tree():
+    rng = np.random.default_rng(15)
+    xs = np.round(rng.random(300) * 100, 1)
+    ys = np.round(rng.random(300) * 100, 1)
+    return Quadtree().add_all(xs, ys)
+
+
+def test_visit_pre_order():
+    q = make_tree()
+    cells = []
+    q.visit(lambda node, x0, y0, x1, y1: cells.append([x0, y0, x1, y1]))
+    assert cells == [record.position for record in q.iter_nodes()]
+
+
+def test_visit_skip():
+    q = make_tree()
+    visited = []
+
+    def callback(node, x0, y0, x1, y1):
+        visited.append([x0, y0, x1, y1])
+        # Only visit the cells touching the origin
+        return x0 > 0 or y0 > 0
+
+    q.visit(callback)
+
+    # Skip the pre-order records below each pruned cell
+    expected = []
+    skip_level = None
+    for record in q.iter_nodes():
+        if skip_level is not None and record.level > skip_level:
+            continue
+        skip_level = None
+        expected.append(record.position)
+        if record.position[0] > 0 or record.position[1] > 0:
+            skip_level = record.level
+
+    assert visited == expected
+
+
+def test_visit_after_post_order():
+    q = make_tree()
+    cells = []
+    q.visit_after(lambda node, x0, y0, x1, y1: cells.append([x0, y0, x1, y1]))
+    assert cells == [record.position for record in q.iter_nodes(order="post")]
+
+    # Leaves come before their parents
+    nodes = []
+    q.visit_after(lambda node, *cell: nodes.append(node))
+    assert "data" in nodes[0]
+    assert nodes[-1] is q.root
+
+
+def test_visit_deep_tree():
+    # The smallest positive float splits the cell more than 1000 times
+    q = Quadtree().add_all([0, 5e-324], [0, 0])
+    depths = {}
+
+    def callback(node, x0, y0, x1, y1):
+        depths[id(node)] = len(depths)
+
+    q.visit(callback)
+    assert len(depths) > sys.getrecursionlimit()
+
+    count = []
+    q.visit_after(lambda *args: count.append(1))
+    assert len(count) == len(depths)
+
+
+def test_visit_levels():
+    q = make_tree()
+    table = q.to_array().node_table()
+    levels = []
+
+    def callback(nodes, x0, y0, x1, y1):
+        levels.append(nodes)
+        np.testing.assert_array_equal(x1 - x0, table.x1[nodes] - table.x0[nodes])
+        # Prune every cell that does not touch the origin
+        return (x0 > 0) | (y0 > 0)
+
+    q.visit_levels(callback)
+    assert levels[0].tolist() == [0]
+
+    visited = []
+    q.visit(
+        lambda node, x0, y0, x1, y1: visited.append([x0, y0, x1, y1])
+        or x0 > 0
+        or y0 > 0
+    )
+    assert sum(len(nodes) for nodes in levels) == len(visited)
+
+    # Without pruning every node is visited once
+    levels = []
+    q.visit_levels(lambda nodes, *cells: levels.append(nodes))
+    assert sorted(np.concatenate(levels).tolist()) == list(range(len(table.ref)))